@@ -0,0 +1,43 @@
+import json
+
+import click
+from flask.cli import AppGroup
+
+from app.services.budget import reconcile_budgets
+from app.services.rollups import refresh_rollups
+
+budget_cli = AppGroup("budget", help="Campaign budget maintenance.")
+rollups_cli = AppGroup("rollups", help="Reporting rollup maintenance.")
+
+
+@budget_cli.command("reconcile")
+@click.option(
+    "--grace-seconds",
+    default=30,
+    show_default=True,
+    help="Only reclaim leases that expired at least this long ago.",
+)
+def reconcile_command(grace_seconds):
+    """Reclaim expired budget leases and fix budget_spent drift."""
+    click.echo(json.dumps(reconcile_budgets(grace_seconds=grace_seconds), indent=2))
+
+
+@rollups_cli.command("refresh")
+@click.option(
+    "--settle-seconds",
+    type=float,
+    default=None,
+    help=(
+        "Only fold event ids seen by a run at least this long ago "
+        "(default ROLLUP_SETTLE_SECONDS)."
+    ),
+)
+def refresh_rollups_command(settle_seconds):
+    """Fold new click and impression events into the daily rollups."""
+    report = refresh_rollups(settle_seconds=settle_seconds)
+    click.echo(json.dumps(report, indent=2))
+
+
+def register_commands(app):
+    app.cli.add_command(budget_cli)
+    app.cli.add_command(rollups_cli)
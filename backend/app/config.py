@@ -1,6 +1,9 @@
+from dataclasses import dataclass, field, fields
 import os
 from decimal import Decimal, InvalidOperation
 
+from flask import Config as FlaskConfig
+
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
@@ -10,22 +13,71 @@ class Config:
         "postgresql://postgres:postgres@db:5432/campaign_master",
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    APP_ENV = os.getenv("APP_ENV", "development")
+    SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "0")
+    SQL_TIMING_HEADERS = os.getenv("SQL_TIMING_HEADERS", "0")
     PLATFORM_FEE_PERCENT = os.getenv("PLATFORM_FEE_PERCENT", "30")
     CLICK_HASH_SALT = os.getenv("CLICK_HASH_SALT", "devsalt")
     CLICK_DUPLICATE_WINDOW_SECONDS = int(os.getenv("CLICK_DUPLICATE_WINDOW_SECONDS", "10"))
     CLICK_RATE_LIMIT_PER_MINUTE = int(os.getenv("CLICK_RATE_LIMIT_PER_MINUTE", "20"))
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_MEMORY_MAX_ENTRIES = int(os.getenv("RATE_LIMIT_MEMORY_MAX_ENTRIES", "100000"))
+    RATE_LIMIT_SHARED_PATH = os.getenv("RATE_LIMIT_SHARED_PATH", "")
+    RATE_LIMIT_SHARED_SLOTS = int(os.getenv("RATE_LIMIT_SHARED_SLOTS", "1048576"))
+    RATE_LIMIT_PURGE_INTERVAL_SECONDS = float(
+        os.getenv("RATE_LIMIT_PURGE_INTERVAL_SECONDS", "300")
+    )
+    HEAVY_HITTER_WINDOW_SECONDS = float(os.getenv("HEAVY_HITTER_WINDOW_SECONDS", "300"))
+    HEAVY_HITTER_WIDTH = int(os.getenv("HEAVY_HITTER_WIDTH", "2048"))
+    HEAVY_HITTER_DEPTH = int(os.getenv("HEAVY_HITTER_DEPTH", "4"))
+    HEAVY_HITTER_TOP_K = int(os.getenv("HEAVY_HITTER_TOP_K", "50"))
+    HEAVY_HITTER_REJECT_THRESHOLD = float(os.getenv("HEAVY_HITTER_REJECT_THRESHOLD", "0"))
+    HEAVY_HITTER_REJECT_DIMENSIONS = os.getenv("HEAVY_HITTER_REJECT_DIMENSIONS", "ip")
+    HEAVY_HITTER_WORKERS = int(os.getenv("HEAVY_HITTER_WORKERS", "1"))
     IMPRESSION_DEDUP_WINDOW_SECONDS = int(
         os.getenv("IMPRESSION_DEDUP_WINDOW_SECONDS", "60")
     )
+    DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "database")
+    DEDUP_MEMORY_MAX_ENTRIES = int(os.getenv("DEDUP_MEMORY_MAX_ENTRIES", "100000"))
     FREQ_CAP_SECONDS = int(os.getenv("FREQ_CAP_SECONDS", "60"))
+    FREQ_CAP_BACKEND = os.getenv("FREQ_CAP_BACKEND", "database")
+    FREQ_CAP_PURGE_INTERVAL_SECONDS = float(
+        os.getenv("FREQ_CAP_PURGE_INTERVAL_SECONDS", "300")
+    )
+    FREQ_CAP_MEMORY_MAX_ENTRIES = int(os.getenv("FREQ_CAP_MEMORY_MAX_ENTRIES", "100000"))
+    KV_STORE_URL = os.getenv("KV_STORE_URL", "")
     MATCH_CTR_LOOKBACK_DAYS = int(os.getenv("MATCH_CTR_LOOKBACK_DAYS", "14"))
     MATCH_REJECT_LOOKBACK_DAYS = int(os.getenv("MATCH_REJECT_LOOKBACK_DAYS", "7"))
     MATCH_CTR_WEIGHT = float(os.getenv("MATCH_CTR_WEIGHT", "1.0"))
     MATCH_TARGETING_BONUS = float(os.getenv("MATCH_TARGETING_BONUS", "0.5"))
     MATCH_REJECT_PENALTY_WEIGHT = float(os.getenv("MATCH_REJECT_PENALTY_WEIGHT", "1.0"))
     MATCHING_DEBUG = os.getenv("MATCHING_DEBUG", "0")
+    MATCHING_DEBUG_LIMIT = int(os.getenv("MATCHING_DEBUG_LIMIT", "3"))
+    MATCHING_SCORER = os.getenv("MATCHING_SCORER", "scalar")
+    BATCH_AD_MAX_SLOTS = int(os.getenv("BATCH_AD_MAX_SLOTS", "10"))
+    ASSIGNMENT_CODE_FORMAT = os.getenv("ASSIGNMENT_CODE_FORMAT", "random")
+    ASSIGNMENT_CODE_SECRET = os.getenv("ASSIGNMENT_CODE_SECRET", "")
+    ASSIGNMENT_CODE_MAX_AGE_DAYS = float(os.getenv("ASSIGNMENT_CODE_MAX_AGE_DAYS", "30"))
+    EXHAUSTED_CAMPAIGN_TTL_SECONDS = float(os.getenv("EXHAUSTED_CAMPAIGN_TTL_SECONDS", "30"))
+    BUDGET_LEASE_CLICKS = int(os.getenv("BUDGET_LEASE_CLICKS", "0"))
+    BUDGET_LEASE_SECONDS = float(os.getenv("BUDGET_LEASE_SECONDS", "60"))
+    BUDGET_LEASE_MARGIN_SECONDS = float(os.getenv("BUDGET_LEASE_MARGIN_SECONDS", "5"))
+    ASSIGNMENT_CACHE_TTL_SECONDS = float(os.getenv("ASSIGNMENT_CACHE_TTL_SECONDS", "300"))
+    ASSIGNMENT_CACHE_MAX_ENTRIES = int(os.getenv("ASSIGNMENT_CACHE_MAX_ENTRIES", "100000"))
+    EVENT_BUFFER_ENABLED = os.getenv("EVENT_BUFFER_ENABLED", "0")
+    EVENT_BUFFER_MAX_ROWS = int(os.getenv("EVENT_BUFFER_MAX_ROWS", "500"))
+    EVENT_BUFFER_FLUSH_MS = float(os.getenv("EVENT_BUFFER_FLUSH_MS", "200"))
+    EVENT_BUFFER_MAX_PENDING = int(os.getenv("EVENT_BUFFER_MAX_PENDING", "10000"))
+    ROLLUP_SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+    ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+    ADMIN_HEALTH_CACHE_SECONDS = float(os.getenv("ADMIN_HEALTH_CACHE_SECONDS", "0"))
+    ADMIN_HEALTH_STALE_SECONDS = float(os.getenv("ADMIN_HEALTH_STALE_SECONDS", "300"))
+    CAMPAIGN_INDEX_TTL_SECONDS = float(os.getenv("CAMPAIGN_INDEX_TTL_SECONDS", "5"))
+    SETTINGS_POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", "5"))
     MARKET_HEALTH_WINDOW_MINUTES = int(os.getenv("MARKET_HEALTH_WINDOW_MINUTES", "60"))
     MARKET_HEALTH_STREAK_SAMPLE = int(os.getenv("MARKET_HEALTH_STREAK_SAMPLE", "10"))
+    MARKET_HEALTH_CACHE_SECONDS = float(os.getenv("MARKET_HEALTH_CACHE_SECONDS", "30"))
+    MARKET_HEALTH_STALE_SECONDS = float(os.getenv("MARKET_HEALTH_STALE_SECONDS", "120"))
     MARKET_HEALTH_FILL_LOW = float(os.getenv("MARKET_HEALTH_FILL_LOW", "0.5"))
     MARKET_HEALTH_FILL_HIGH = float(os.getenv("MARKET_HEALTH_FILL_HIGH", "0.8"))
     MARKET_HEALTH_ELIGIBLE_SUPPLY_LOW = float(
@@ -99,3 +151,228 @@ def load_platform_fee_percent(value):
     if percent > 100:
         percent = Decimal("100")
     return percent
+
+
+class VersionedConfig(FlaskConfig):
+    """Flask config that counts writes so compiled settings know to rebuild."""
+
+    version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.version += 1
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _parse_dimensions(value):
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(",") if part.strip()]
+    value = tuple(value)
+    unknown = set(value) - set(HEAVY_HITTER_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown heavy hitter dimensions: {', '.join(sorted(unknown))}")
+    return value
+
+
+def _setting(key, default, parse):
+    return field(default=default, metadata={"key": key, "parse": parse})
+
+
+# Fields that are fractions and must stay within [0, 1].
+_RATE_FIELDS = (
+    "exploration_rate",
+    "quality_risky_reject_rate",
+    "quality_recover_reject_rate",
+    "delivery_low_click_rate",
+    "delivery_min_budget_remaining_ratio",
+    "market_fill_low",
+    "market_fill_high",
+    "market_reject_healthy",
+)
+
+MATCHING_SCORERS = ("scalar", "numpy")
+HEAVY_HITTER_DIMENSIONS = ("ip", "ua", "partner")
+
+
+@dataclass(frozen=True, slots=True)
+class MatchingConfig:
+    """Matching and market health settings, parsed and validated once."""
+
+    freq_cap_seconds: int = _setting("FREQ_CAP_SECONDS", 60, int)
+    ctr_lookback_days: int = _setting("MATCH_CTR_LOOKBACK_DAYS", 14, int)
+    reject_lookback_days: int = _setting("MATCH_REJECT_LOOKBACK_DAYS", 7, int)
+    ctr_weight: float = _setting("MATCH_CTR_WEIGHT", 1.0, float)
+    targeting_bonus_value: float = _setting("MATCH_TARGETING_BONUS", 0.5, float)
+    reject_penalty_weight: float = _setting("MATCH_REJECT_PENALTY_WEIGHT", 1.0, float)
+    scorer: str = _setting("MATCHING_SCORER", "scalar", str)
+    debug: bool = _setting("MATCHING_DEBUG", False, _parse_bool)
+    debug_limit: int = _setting("MATCHING_DEBUG_LIMIT", 3, int)
+    exploration_rate: float = _setting("EXPLORATION_RATE", 0.05, float)
+    exploration_bonus: float = _setting("EXPLORATION_BONUS", 0.2, float)
+    exploration_new_partner_requests: int = _setting(
+        "EXPLORATION_NEW_PARTNER_REQUESTS", 5, int
+    )
+    exploration_new_ad_serves: int = _setting("EXPLORATION_NEW_AD_SERVES", 1, int)
+    exploration_max_ad_serves: int = _setting("EXPLORATION_MAX_AD_SERVES", 5, int)
+    exploration_lookback_days: int = _setting("EXPLORATION_LOOKBACK_DAYS", 7, int)
+    quality_recent_days: int = _setting("PARTNER_QUALITY_RECENT_DAYS", 1, int)
+    quality_long_days: int = _setting("PARTNER_QUALITY_LONG_DAYS", 7, int)
+    quality_new_clicks: int = _setting("PARTNER_QUALITY_NEW_CLICKS", 10, int)
+    quality_risky_reject_rate: float = _setting("PARTNER_QUALITY_RISKY_REJECT_RATE", 0.2, float)
+    quality_recover_reject_rate: float = _setting(
+        "PARTNER_QUALITY_RECOVER_REJECT_RATE", 0.1, float
+    )
+    quality_delta_new: float = _setting("PARTNER_QUALITY_DELTA_NEW", 0.8, float)
+    quality_delta_stable: float = _setting("PARTNER_QUALITY_DELTA_STABLE", 1.0, float)
+    quality_delta_risky: float = _setting("PARTNER_QUALITY_DELTA_RISKY", 1.5, float)
+    quality_delta_recovering: float = _setting("PARTNER_QUALITY_DELTA_RECOVERING", 1.1, float)
+    delivery_lookback_days: int = _setting("DELIVERY_LOOKBACK_DAYS", 7, int)
+    delivery_min_requests: int = _setting("DELIVERY_MIN_REQUESTS", 10, int)
+    delivery_low_click_rate: float = _setting("DELIVERY_LOW_CLICK_RATE", 0.01, float)
+    delivery_min_budget_remaining_ratio: float = _setting(
+        "DELIVERY_MIN_BUDGET_REMAINING_RATIO", 0.5, float
+    )
+    delivery_boost_value: float = _setting("DELIVERY_BOOST_VALUE", 0.2, float)
+    market_window_minutes: int = _setting("MARKET_HEALTH_WINDOW_MINUTES", 60, int)
+    market_streak_sample: int = _setting("MARKET_HEALTH_STREAK_SAMPLE", 10, int)
+    market_cache_seconds: float = _setting("MARKET_HEALTH_CACHE_SECONDS", 30.0, float)
+    market_stale_seconds: float = _setting("MARKET_HEALTH_STALE_SECONDS", 120.0, float)
+    market_fill_low: float = _setting("MARKET_HEALTH_FILL_LOW", 0.5, float)
+    market_fill_high: float = _setting("MARKET_HEALTH_FILL_HIGH", 0.8, float)
+    market_eligible_supply_low: float = _setting("MARKET_HEALTH_ELIGIBLE_SUPPLY_LOW", 0.5, float)
+    market_reject_volatility_threshold: float = _setting(
+        "MARKET_HEALTH_REJECT_VOLATILITY_THRESHOLD", 0.1, float
+    )
+    market_unfilled_streak_threshold: int = _setting(
+        "MARKET_HEALTH_UNFILLED_STREAK_THRESHOLD", 3, int
+    )
+    market_reject_healthy: float = _setting("MARKET_HEALTH_REJECT_HEALTHY", 0.05, float)
+    alpha_profit_boost_low_fill: float = _setting("ALPHA_PROFIT_BOOST_LOW_FILL", 0.2, float)
+    alpha_profit_boost_low_supply: float = _setting("ALPHA_PROFIT_BOOST_LOW_SUPPLY", 0.1, float)
+    beta_ctr_boost_healthy: float = _setting("BETA_CTR_BOOST_HEALTHY", 0.1, float)
+    gamma_targeting_boost_low_fill: float = _setting(
+        "GAMMA_TARGETING_BOOST_LOW_FILL", 0.1, float
+    )
+    gamma_targeting_boost_unfilled: float = _setting(
+        "GAMMA_TARGETING_BOOST_UNFILLED", 0.1, float
+    )
+    delta_quality_boost_low_fill: float = _setting("DELTA_QUALITY_BOOST_LOW_FILL", 0.2, float)
+    delta_quality_boost_volatility: float = _setting(
+        "DELTA_QUALITY_BOOST_VOLATILITY", 0.1, float
+    )
+    campaign_index_ttl_seconds: float = _setting("CAMPAIGN_INDEX_TTL_SECONDS", 5.0, float)
+    heavy_hitter_reject_threshold: float = _setting("HEAVY_HITTER_REJECT_THRESHOLD", 0.0, float)
+    heavy_hitter_reject_dimensions: tuple = _setting(
+        "HEAVY_HITTER_REJECT_DIMENSIONS", ("ip",), _parse_dimensions
+    )
+    heavy_hitter_workers: int = _setting("HEAVY_HITTER_WORKERS", 1, int)
+
+    def __post_init__(self):
+        for spec in fields(self):
+            value = getattr(self, spec.name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if value < 0:
+                raise ValueError(f"{spec.metadata['key']} must not be negative")
+            if spec.name in _RATE_FIELDS and value > 1:
+                raise ValueError(f"{spec.metadata['key']} must be between 0 and 1")
+        if self.scorer not in MATCHING_SCORERS:
+            raise ValueError(f"MATCHING_SCORER must be one of {', '.join(MATCHING_SCORERS)}")
+        if self.debug_limit < 1:
+            raise ValueError("MATCHING_DEBUG_LIMIT must be at least 1")
+        if self.heavy_hitter_workers < 1:
+            raise ValueError("HEAVY_HITTER_WORKERS must be at least 1")
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        values = {}
+        for spec in fields(cls):
+            key = spec.metadata["key"]
+            if mapping.get(key) is not None:
+                try:
+                    values[spec.name] = spec.metadata["parse"](mapping[key])
+                except (TypeError, ValueError) as exc:
+                    raise ValueError(f"Invalid {key}: {mapping[key]!r}") from exc
+        return cls(**values)
+
+    def to_mapping(self):
+        return {spec.metadata["key"]: getattr(self, spec.name) for spec in fields(self)}
+
+    def with_changes(self, changes):
+        """Return a validated copy with ``changes`` (field name -> raw value) applied."""
+        keys = {spec.name: spec.metadata["key"] for spec in fields(self)}
+        unknown = sorted(set(changes) - set(keys))
+        if unknown:
+            raise ValueError(f"Unknown matching settings: {', '.join(unknown)}")
+        return self.from_mapping(
+            {**self.to_mapping(), **{keys[name]: value for name, value in changes.items()}}
+        )
+
+    @property
+    def quality_delta_multipliers(self):
+        return {
+            "NEW": self.quality_delta_new,
+            "STABLE": self.quality_delta_stable,
+            "RISKY": self.quality_delta_risky,
+            "RECOVERING": self.quality_delta_recovering,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class PricingConfig:
+    platform_fee_percent: Decimal = Decimal("30")
+    payout_multiplier: Decimal = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self,
+            "payout_multiplier",
+            (Decimal("100") - self.platform_fee_percent) / Decimal("100"),
+        )
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        return cls(
+            load_platform_fee_percent(
+                mapping.get("PLATFORM_FEE_PERCENT", Config.PLATFORM_FEE_PERCENT)
+            )
+        )
+
+    def to_mapping(self):
+        return {"PLATFORM_FEE_PERCENT": str(self.platform_fee_percent)}
+
+    def with_changes(self, changes):
+        unknown = sorted(set(changes) - {"platform_fee_percent"})
+        if unknown:
+            raise ValueError(f"Unknown pricing settings: {', '.join(unknown)}")
+        if "platform_fee_percent" not in changes:
+            return self
+        try:
+            percent = Decimal(str(changes["platform_fee_percent"]))
+        except (InvalidOperation, TypeError, ValueError) as exc:
+            raise ValueError("PLATFORM_FEE_PERCENT must be a number") from exc
+        if not Decimal("0") <= percent <= Decimal("100"):
+            raise ValueError("PLATFORM_FEE_PERCENT must be between 0 and 100")
+        return PricingConfig(percent)
@@ -1,10 +1,18 @@
 from app.models.ad import Ad
 from app.models.assignment import AdAssignment
+from app.models.budget_lease import BudgetLease
 from app.models.campaign import Campaign
 from app.models.click_event import ClickEvent
+from app.models.click_rate_limit import ClickRateLimit
+from app.models.daily_click_decision import DailyClickDecision
+from app.models.daily_traffic_stat import DailyTrafficStat
+from app.models.engagement_counter import EngagementCounter
 from app.models.impression_event import ImpressionEvent
 from app.models.partner_ad_exposure import PartnerAdExposure
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.models.partner_quality import PartnerQualityBucket
+from app.models.rollup_watermark import RollupWatermark
+from app.models.runtime_settings import RuntimeSettings
 from app.models.tracking_event import TrackingEvent
 from app.models.user import User
 
@@ -18,4 +26,12 @@ __all__ = [
     "ImpressionEvent",
     "PartnerAdRequestEvent",
     "PartnerAdExposure",
+    "PartnerQualityBucket",
+    "EngagementCounter",
+    "BudgetLease",
+    "ClickRateLimit",
+    "DailyTrafficStat",
+    "DailyClickDecision",
+    "RollupWatermark",
+    "RuntimeSettings",
 ]
@@ -5,7 +5,7 @@ class AdAssignment(db.Model):
     __tablename__ = "ad_assignments"
 
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(32), unique=True, nullable=False, index=True)
+    code = db.Column(db.String(64), unique=True, nullable=False, index=True)
     partner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     campaign_id = db.Column(db.Integer, db.ForeignKey("campaigns.id"), nullable=False)
     ad_id = db.Column(db.Integer, db.ForeignKey("ads.id"), nullable=False)
@@ -0,0 +1,22 @@
+from app.extensions import db
+
+
+class BudgetLease(db.Model):
+    __tablename__ = "budget_leases"
+
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey("campaigns.id"), nullable=False)
+    holder = db.Column(db.String(120), nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
+    spent = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    buyer_cpc = db.Column(db.Numeric(12, 2), nullable=False)
+    partner_payout = db.Column(db.Numeric(12, 2), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    released_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_budget_leases_campaign_released", "campaign_id", "released_at"),
+    )
+
+    campaign = db.relationship("Campaign")
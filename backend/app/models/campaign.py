@@ -10,6 +10,8 @@ class Campaign(db.Model):
     status = db.Column(db.String(32), nullable=False, default="active")
     budget_total = db.Column(db.Numeric(12, 2), nullable=False)
     budget_spent = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    # Leased to workers but not yet settled into budget_spent.
+    budget_reserved = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
     buyer_cpc = db.Column(db.Numeric(12, 2), nullable=False)
     partner_payout = db.Column(db.Numeric(12, 2), nullable=False)
     targeting_category = db.Column(db.String(120))
@@ -0,0 +1,12 @@
+from app.extensions import db
+
+
+class ClickRateLimit(db.Model):
+    __tablename__ = "click_rate_limits"
+
+    key = db.Column(db.String(64), primary_key=True)
+    window_index = db.Column(db.BigInteger, nullable=False)
+    current_count = db.Column(db.Integer, nullable=False, server_default="0")
+    previous_count = db.Column(db.Integer, nullable=False, server_default="0")
+
+    __table_args__ = (db.Index("ix_click_rate_limits_window_index", "window_index"),)
@@ -0,0 +1,28 @@
+from app.extensions import db
+
+
+class DailyClickDecision(db.Model):
+    """Click decisions per day; partner_id 0 means "not attributed" and an
+    empty reject_reason means the click had none.
+    """
+
+    __tablename__ = "daily_click_decisions"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    partner_id = db.Column(db.Integer, nullable=False, server_default="0")
+    status = db.Column(db.String(16), nullable=False)
+    reject_reason = db.Column(db.String(32), nullable=False, server_default="")
+    clicks = db.Column(db.Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "day",
+            "partner_id",
+            "status",
+            "reject_reason",
+            name="uq_daily_click_decision_key",
+        ),
+        db.Index("ix_daily_click_decisions_day", "day"),
+        db.Index("ix_daily_click_decisions_partner_day", "partner_id", "day"),
+    )
@@ -0,0 +1,34 @@
+from app.extensions import db
+
+
+class DailyTrafficStat(db.Model):
+    """Accepted clicks and impressions per day; 0 in an id column means "not attributed"."""
+
+    __tablename__ = "daily_traffic_stats"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    buyer_id = db.Column(db.Integer, nullable=False, server_default="0")
+    campaign_id = db.Column(db.Integer, nullable=False, server_default="0")
+    ad_id = db.Column(db.Integer, nullable=False, server_default="0")
+    partner_id = db.Column(db.Integer, nullable=False, server_default="0")
+    clicks = db.Column(db.Integer, nullable=False, server_default="0")
+    impressions = db.Column(db.Integer, nullable=False, server_default="0")
+    spend = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    earnings = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    profit = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "day",
+            "buyer_id",
+            "campaign_id",
+            "ad_id",
+            "partner_id",
+            name="uq_daily_traffic_stat_key",
+        ),
+        db.Index("ix_daily_traffic_stats_day", "day"),
+        db.Index("ix_daily_traffic_stats_buyer_day", "buyer_id", "day"),
+        db.Index("ix_daily_traffic_stats_partner_day", "partner_id", "day"),
+        db.Index("ix_daily_traffic_stats_campaign_day", "campaign_id", "day"),
+    )
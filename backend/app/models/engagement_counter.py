@@ -0,0 +1,27 @@
+from app.extensions import db
+
+
+class EngagementCounter(db.Model):
+    """Hourly engagement totals; 0 in an id column means "not attributed"."""
+
+    __tablename__ = "engagement_counters"
+
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)
+    partner_id = db.Column(db.Integer, nullable=False, server_default="0")
+    campaign_id = db.Column(db.Integer, nullable=False, server_default="0")
+    ad_id = db.Column(db.Integer, nullable=False, server_default="0")
+    impressions = db.Column(db.Integer, nullable=False, server_default="0")
+    accepted_clicks = db.Column(db.Integer, nullable=False, server_default="0")
+    rejected_clicks = db.Column(db.Integer, nullable=False, server_default="0")
+    filled_requests = db.Column(db.Integer, nullable=False, server_default="0")
+    unfilled_requests = db.Column(db.Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "hour", "partner_id", "campaign_id", "ad_id", name="uq_engagement_counter_key"
+        ),
+        db.Index("ix_engagement_counters_campaign_hour", "campaign_id", "hour"),
+        db.Index("ix_engagement_counters_ad_hour", "ad_id", "hour"),
+        db.Index("ix_engagement_counters_partner_hour", "partner_id", "hour"),
+    )
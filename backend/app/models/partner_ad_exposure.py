@@ -11,6 +11,7 @@ class PartnerAdExposure(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("partner_id", "ad_id", name="uq_partner_ad_exposure"),
+        db.Index("ix_partner_ad_exposures_last_served_at", "last_served_at"),
     )
 
     partner = db.relationship("User")
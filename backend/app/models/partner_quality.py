@@ -0,0 +1,17 @@
+from app.extensions import db
+
+
+class PartnerQualityBucket(db.Model):
+    __tablename__ = "partner_quality"
+
+    id = db.Column(db.Integer, primary_key=True)
+    partner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    accepted = db.Column(db.Integer, nullable=False, server_default="0")
+    rejected = db.Column(db.Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        db.UniqueConstraint("partner_id", "bucket_start", name="uq_partner_quality_bucket"),
+    )
+
+    partner = db.relationship("User")
@@ -0,0 +1,18 @@
+from app.extensions import db
+
+
+class RollupWatermark(db.Model):
+    """Highest source event id already folded into a rollup table.
+
+    ``observed_event_id`` is the highest event id seen at ``observed_at``;
+    once that is ``ROLLUP_SETTLE_SECONDS`` old, every id up to it belongs to a
+    finished transaction and can be folded.
+    """
+
+    __tablename__ = "rollup_watermarks"
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_event_id = db.Column(db.BigInteger, nullable=False, server_default="0")
+    observed_event_id = db.Column(db.BigInteger)
+    observed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
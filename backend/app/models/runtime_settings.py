@@ -0,0 +1,16 @@
+from app.extensions import db
+
+
+class RuntimeSettings(db.Model):
+    """Settings changed through ``PUT /api/admin/config``, shared by every worker.
+
+    ``overrides`` is a JSON object of config keys to values; ``version`` is
+    bumped on every change so workers know when to reload it.
+    """
+
+    __tablename__ = "runtime_settings"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, server_default="0")
+    overrides = db.Column(db.Text, nullable=False, server_default="{}")
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
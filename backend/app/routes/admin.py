@@ -0,0 +1,49 @@
+from dataclasses import asdict
+
+from flask import Blueprint, jsonify, request
+
+from app.auth.decorators import roles_required
+from app.services.event_buffer import get_event_buffer
+from app.services.settings import get_matching_config, get_pricing_config, publish_settings
+
+admin_bp = Blueprint("admin", __name__)
+
+
+def settings_payload(matching, pricing):
+    return {
+        "matching": asdict(matching),
+        "pricing": {
+            "platform_fee_percent": float(pricing.platform_fee_percent),
+        },
+    }
+
+
+@admin_bp.route("/api/admin/config", methods=["GET"])
+@roles_required("admin")
+def get_config_view():
+    return jsonify(settings_payload(get_matching_config(), get_pricing_config()))
+
+
+@admin_bp.route("/api/admin/config", methods=["PUT"])
+@roles_required("admin")
+def update_config_view():
+    payload = request.get_json(silent=True) or {}
+    matching_changes = payload.get("matching") or {}
+    pricing_changes = payload.get("pricing") or {}
+    if not isinstance(matching_changes, dict) or not isinstance(pricing_changes, dict):
+        return jsonify({"error": "invalid_payload"}), 400
+
+    try:
+        matching, pricing = publish_settings(matching_changes, pricing_changes)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(settings_payload(matching, pricing))
+
+
+@admin_bp.route("/api/admin/event-buffer", methods=["GET"])
+@roles_required("admin")
+def event_buffer_view():
+    event_buffer = get_event_buffer()
+    if event_buffer is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **event_buffer.stats()})
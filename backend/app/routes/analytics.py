@@ -22,6 +22,12 @@ from app.services.analytics import (
     partner_top_ads,
     partner_quality_summary,
 )
+from app.services.heavy_hitters import (
+    HEAVY_HITTER_DIMENSIONS,
+    get_heavy_hitters,
+    heavy_hitter_worker_threshold,
+)
+from app.services.settings import get_matching_config
 
 analytics_bp = Blueprint("analytics", __name__)
 
@@ -155,41 +161,85 @@ def admin_series():
     return jsonify({"daily": admin_daily_metrics(days=days)})
 
 
-@analytics_bp.route("/api/admin/risk/summary", methods=["GET"])
-@roles_required("admin")
-def admin_risk_summary_view():
-    return jsonify(admin_risk_summary())
+def _parse_date_range(default_days=None):
+    """Read ``from``/``to`` query args as dates.
 
-
-@analytics_bp.route("/api/admin/risk/series", methods=["GET"])
-@roles_required("admin")
-def admin_risk_series_view():
+    Returns ``(start_date, end_date, error)``. Missing bounds default to the
+    last ``default_days`` days, or stay ``None`` (unbounded) without a default.
+    """
     from_value = request.args.get("from")
     to_value = request.args.get("to")
-    group_by = (request.args.get("groupBy") or "day").lower()
-    if group_by != "day":
-        return jsonify({"error": "invalid_group_by"}), 400
 
     if from_value:
         try:
             start_date = date.fromisoformat(from_value)
         except (TypeError, ValueError):
-            return jsonify({"error": "invalid_from"}), 400
+            return None, None, "invalid_from"
+    elif default_days:
+        start_date = date.today() - timedelta(days=default_days - 1)
     else:
-        start_date = date.today() - timedelta(days=13)
+        start_date = None
 
     if to_value:
         try:
             end_date = date.fromisoformat(to_value)
         except (TypeError, ValueError):
-            return jsonify({"error": "invalid_to"}), 400
-    else:
+            return None, None, "invalid_to"
+    elif default_days:
         end_date = date.today()
+    else:
+        end_date = None
+
+    if start_date and end_date and end_date < start_date:
+        return None, None, "invalid_range"
+    return start_date, end_date, None
 
-    if end_date < start_date:
-        return jsonify({"error": "invalid_range"}), 400
 
-    return jsonify({"daily": admin_risk_series(start_date, end_date)})
+def _optional_int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    return int(value)
+
+
+@analytics_bp.route("/api/admin/risk/summary", methods=["GET"])
+@roles_required("admin")
+def admin_risk_summary_view():
+    start_date, end_date, error = _parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        partner_id = _optional_int_arg("partnerId")
+    except ValueError:
+        return jsonify({"error": "invalid_partner_id"}), 400
+    return jsonify(
+        admin_risk_summary(start_date=start_date, end_date=end_date, partner_id=partner_id)
+    )
+
+
+@analytics_bp.route("/api/admin/risk/series", methods=["GET"])
+@roles_required("admin")
+def admin_risk_series_view():
+    group_by = (request.args.get("groupBy") or "day").lower()
+    if group_by != "day":
+        return jsonify({"error": "invalid_group_by"}), 400
+
+    start_date, end_date, error = _parse_date_range(default_days=14)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        partner_id = _optional_int_arg("partnerId")
+    except ValueError:
+        return jsonify({"error": "invalid_partner_id"}), 400
+    reason = request.args.get("reason") or None
+
+    return jsonify(
+        {
+            "daily": admin_risk_series(
+                start_date, end_date, partner_id=partner_id, reject_reason=reason
+            )
+        }
+    )
 
 
 @analytics_bp.route("/api/admin/risk/top-partners", methods=["GET"])
@@ -200,4 +250,44 @@ def admin_risk_top_partners_view():
         limit = max(1, min(int(limit), 50))
     except (TypeError, ValueError):
         return jsonify({"error": "invalid_limit"}), 400
-    return jsonify({"partners": admin_risk_top_partners(limit=limit)})
+    start_date, end_date, error = _parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+    reason = request.args.get("reason") or None
+    return jsonify(
+        {
+            "partners": admin_risk_top_partners(
+                limit=limit, start_date=start_date, end_date=end_date, reject_reason=reason
+            )
+        }
+    )
+
+
+@analytics_bp.route("/api/admin/risk/heavy-hitters", methods=["GET"])
+@roles_required("admin")
+def admin_risk_heavy_hitters_view():
+    limit = request.args.get("limit", 10)
+    try:
+        limit = max(1, min(int(limit), 50))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_limit"}), 400
+    dimension = request.args.get("dimension")
+    if dimension and dimension not in HEAVY_HITTER_DIMENSIONS:
+        return jsonify({"error": "invalid_dimension"}), 400
+    dimensions = [dimension] if dimension else list(HEAVY_HITTER_DIMENSIONS)
+
+    tracker = get_heavy_hitters()
+    config = get_matching_config()
+    return jsonify(
+        {
+            "window_seconds": tracker.window_seconds,
+            "sketch_bytes": tracker.size_bytes,
+            # Counts below are this worker's only, not the deployment's.
+            "scope": "worker",
+            "workers": config.heavy_hitter_workers,
+            "reject_threshold": config.heavy_hitter_reject_threshold,
+            "worker_reject_threshold": heavy_hitter_worker_threshold(config),
+            "reject_dimensions": list(config.heavy_hitter_reject_dimensions),
+            "dimensions": {name: tracker.top(name, limit=limit) for name in dimensions},
+        }
+    )
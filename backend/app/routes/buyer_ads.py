@@ -5,6 +5,7 @@ from app.auth.decorators import roles_required
 from app.extensions import db
 from app.models.ad import Ad
 from app.models.campaign import Campaign
+from app.services.assignment_cache import get_assignment_cache
 
 buyer_ads_bp = Blueprint("buyer_ads", __name__)
 
@@ -141,4 +142,6 @@ def update_ad(campaign_id, ad_id):
         ad.active = bool(payload.get("active"))
 
     db.session.commit()
+    if "destination_url" in payload:
+        get_assignment_cache().discard_ad(ad.id)
     return jsonify({"ad": ad_to_dict(ad)})
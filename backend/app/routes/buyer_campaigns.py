@@ -7,8 +7,8 @@ from flask_jwt_extended import get_jwt_identity
 from app.auth.decorators import roles_required
 from app.extensions import db
 from app.models.campaign import Campaign
-from app.models.click_event import ClickEvent
-from app.models.impression_event import ImpressionEvent
+from app.services.analytics import campaign_event_totals
+from app.services.budget import get_exhausted_campaigns
 from app.services.pricing import compute_partner_payout, get_platform_fee_percent
 
 buyer_campaigns_bp = Blueprint("buyer_campaigns", __name__)
@@ -32,13 +32,11 @@ def parse_date(value, field_name):
         raise ValueError(f"invalid_{field_name}")
 
 
-def campaign_delivery_status(campaign):
-    clicks = (
-        ClickEvent.query.filter_by(campaign_id=campaign.id, status="ACCEPTED").count()
-    )
-    impressions = (
-        ImpressionEvent.query.filter_by(campaign_id=campaign.id, status="ACCEPTED").count()
-    )
+def campaign_delivery_status(campaign, totals=None):
+    if totals is None:
+        totals = campaign_event_totals([campaign.id])[campaign.id]
+    clicks = totals["clicks"]
+    impressions = totals["impressions"]
     ctr = clicks / impressions if impressions else 0
     if campaign.status != "active":
         return "PAUSED", ctr
@@ -47,15 +45,17 @@ def campaign_delivery_status(campaign):
     return "ON_TRACK", ctr
 
 
-def campaign_to_dict(campaign):
-    delivery_status, ctr = campaign_delivery_status(campaign)
+def campaign_to_dict(campaign, totals=None):
+    if totals is None:
+        totals = campaign_event_totals([campaign.id])[campaign.id]
+    delivery_status, ctr = campaign_delivery_status(campaign, totals)
     return {
         "id": campaign.id,
         "name": campaign.name,
         "status": campaign.status,
         "budget_total": float(campaign.budget_total),
-        "budget_spent": float(campaign.budget_spent),
-        "budget_remaining": float(campaign.budget_remaining),
+        "budget_spent": totals["budget_spent"],
+        "budget_remaining": totals["budget_remaining"],
         "buyer_cpc": float(campaign.buyer_cpc),
         "max_cpc": float(campaign.max_cpc),
         "partner_payout": float(campaign.partner_payout),
@@ -93,9 +93,10 @@ def list_campaigns():
     campaigns = (
         base_query.order_by(Campaign.id.desc()).limit(limit).offset(offset).all()
     )
+    totals = campaign_event_totals([c.id for c in campaigns])
     return jsonify(
         {
-            "campaigns": [campaign_to_dict(c) for c in campaigns],
+            "campaigns": [campaign_to_dict(c, totals[c.id]) for c in campaigns],
             "meta": {
                 "limit": limit,
                 "offset": offset,
@@ -234,4 +235,6 @@ def update_campaign(campaign_id):
             return jsonify({"error": str(exc)}), 400
 
     db.session.commit()
+    # Budget or status may have changed; let the next click re-check the row.
+    get_exhausted_campaigns().discard(campaign.id)
     return jsonify({"campaign": campaign_to_dict(campaign)})
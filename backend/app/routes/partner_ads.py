@@ -1,32 +1,56 @@
+from datetime import datetime
 import secrets
 
 import json
 
 from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import insert
 
 from app.auth.decorators import roles_required
 from app.extensions import db
-from app.models.partner_ad_exposure import PartnerAdExposure
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
 from app.models.assignment import AdAssignment
-from app.services.matching import select_ad_for_partner
+from app.services.assignment_cache import AssignmentRoute, get_assignment_cache
+from app.services.assignment_codes import sign_code, signed_codes_enabled
+from app.services.engagement import record_engagement
+from app.services.event_buffer import get_event_buffer, record_events
+from app.services.frequency_cap import get_frequency_cap_store
+from app.services.matching import AdSlot, select_ad_for_partner, select_ads_for_slots
+from app.services.settings import get_matching_config
 
 partner_ads_bp = Blueprint("partner_ads", __name__)
 
 
+def generate_codes(count):
+    codes = set()
+    while len(codes) < count:
+        fresh = {secrets.token_urlsafe(8).rstrip("=") for _ in range(count - len(codes))}
+        taken = {
+            row.code
+            for row in db.session.query(AdAssignment.code).filter(AdAssignment.code.in_(fresh))
+        }
+        codes |= fresh - taken
+    return list(codes)
+
+
 def generate_code():
-    while True:
-        code = secrets.token_urlsafe(8).rstrip("=")
-        if not AdAssignment.query.filter_by(code=code).first():
-            return code
+    return generate_codes(1)[0]
+
 
+def assignment_codes(partner_id, results):
+    """One code per filled result; signed codes need no uniqueness probe."""
+    filled = [result for result in results if result.ad and result.campaign]
+    if signed_codes_enabled():
+        return [sign_code(partner_id, result.campaign.id, result.ad.id) for result in filled]
+    return generate_codes(len(filled))
 
-def ad_payload(ad, campaign, assignment, explanation, score_breakdown):
+
+def ad_payload(ad, campaign, assignment_code, explanation, score_breakdown):
     return {
         "filled": True,
-        "assignment_code": assignment.code,
-        "tracking_url": f"/t/{assignment.code}",
+        "assignment_code": assignment_code,
+        "tracking_url": f"/t/{assignment_code}",
         "campaign": {
             "id": campaign.id,
             "max_cpc": float(campaign.max_cpc),
@@ -44,6 +68,22 @@ def ad_payload(ad, campaign, assignment, explanation, score_breakdown):
     }
 
 
+def request_event_row(partner_id, slot_fields, created_at, result=None, code=None):
+    # Filled and unfilled rows bind the same columns so they can share one INSERT.
+    filled = bool(result and result.ad and result.campaign)
+    return {
+        "partner_id": partner_id,
+        "filled": filled,
+        "ad_id": result.ad.id if filled else None,
+        "campaign_id": result.campaign.id if filled else None,
+        "assignment_code": code,
+        "explanation": result.explanation if filled else None,
+        "score_breakdown": json.dumps(result.score_breakdown) if filled else None,
+        "created_at": created_at,
+        **slot_fields,
+    }
+
+
 @partner_ads_bp.route("/api/partner/ad", methods=["GET"])
 @roles_required("partner")
 def request_ad():
@@ -57,63 +97,26 @@ def request_ad():
     placement = (request.args.get("placement") or "").strip() or None
     device = (request.args.get("device") or "").strip() or None
 
-    # Optional debug mode returns top candidate breakdowns for QA only.
+    config = get_matching_config()
     result = select_ad_for_partner(
         partner_id,
         category=category,
         geo=geo,
         device=device,
         placement=placement,
-        freq_cap_seconds=current_app.config.get("FREQ_CAP_SECONDS", 60),
-        ctr_lookback_days=current_app.config.get("MATCH_CTR_LOOKBACK_DAYS", 14),
-        reject_lookback_days=current_app.config.get("MATCH_REJECT_LOOKBACK_DAYS", 7),
-        ctr_weight=current_app.config.get("MATCH_CTR_WEIGHT", 1.0),
-        targeting_bonus_value=current_app.config.get("MATCH_TARGETING_BONUS", 0.5),
-        reject_penalty_weight=current_app.config.get("MATCH_REJECT_PENALTY_WEIGHT", 1.0),
-        exploration_rate=current_app.config.get("EXPLORATION_RATE", 0.05),
-        exploration_bonus=current_app.config.get("EXPLORATION_BONUS", 0.2),
-        exploration_new_partner_requests=current_app.config.get(
-            "EXPLORATION_NEW_PARTNER_REQUESTS", 5
-        ),
-        exploration_new_ad_serves=current_app.config.get("EXPLORATION_NEW_AD_SERVES", 1),
-        exploration_max_ad_serves=current_app.config.get("EXPLORATION_MAX_AD_SERVES", 5),
-        exploration_lookback_days=current_app.config.get("EXPLORATION_LOOKBACK_DAYS", 7),
-        quality_recent_days=current_app.config.get("PARTNER_QUALITY_RECENT_DAYS", 1),
-        quality_long_days=current_app.config.get("PARTNER_QUALITY_LONG_DAYS", 7),
-        quality_new_clicks=current_app.config.get("PARTNER_QUALITY_NEW_CLICKS", 10),
-        quality_risky_reject_rate=current_app.config.get(
-            "PARTNER_QUALITY_RISKY_REJECT_RATE", 0.2
-        ),
-        quality_recover_reject_rate=current_app.config.get(
-            "PARTNER_QUALITY_RECOVER_REJECT_RATE", 0.1
-        ),
-        quality_delta_new=current_app.config.get("PARTNER_QUALITY_DELTA_NEW", 0.8),
-        quality_delta_stable=current_app.config.get("PARTNER_QUALITY_DELTA_STABLE", 1.0),
-        quality_delta_risky=current_app.config.get("PARTNER_QUALITY_DELTA_RISKY", 1.5),
-        quality_delta_recovering=current_app.config.get(
-            "PARTNER_QUALITY_DELTA_RECOVERING", 1.1
-        ),
-        delivery_lookback_days=current_app.config.get("DELIVERY_LOOKBACK_DAYS", 7),
-        delivery_min_requests=current_app.config.get("DELIVERY_MIN_REQUESTS", 10),
-        delivery_low_click_rate=current_app.config.get("DELIVERY_LOW_CLICK_RATE", 0.01),
-        delivery_min_budget_remaining_ratio=current_app.config.get(
-            "DELIVERY_MIN_BUDGET_REMAINING_RATIO", 0.5
-        ),
-        delivery_boost_value=current_app.config.get("DELIVERY_BOOST_VALUE", 0.2),
-        debug=str(current_app.config.get("MATCHING_DEBUG", "0")).lower()
-        in ("1", "true", "yes"),
-        debug_limit=3,
+        config=config,
     )
+    slot_fields = {
+        "category": category,
+        "geo": geo,
+        "placement": placement,
+        "device": device,
+    }
     if not result.ad or not result.campaign:
-        request_event = PartnerAdRequestEvent(
-            partner_id=partner_id,
-            placement=placement,
-            device=device,
-            geo=geo,
-            category=category,
-            filled=False,
+        record_events(
+            PartnerAdRequestEvent,
+            [request_event_row(partner_id, slot_fields, datetime.utcnow())],
         )
-        db.session.add(request_event)
         db.session.commit()
         response = {"filled": False, "reason": result.unfilled_reason}
         if result.debug_candidates is not None:
@@ -123,47 +126,136 @@ def request_ad():
     ad = result.ad
     campaign = result.campaign
 
-    assignment = AdAssignment(
-        code=generate_code(),
-        partner_id=partner_id,
-        campaign_id=campaign.id,
-        ad_id=ad.id,
-        category=category,
-        geo=geo,
-        placement=placement,
-        device=device,
+    code = assignment_codes(partner_id, [result])[0]
+    created_at = datetime.utcnow()
+    assignment_row = {
+        "code": code,
+        "partner_id": partner_id,
+        "campaign_id": campaign.id,
+        "ad_id": ad.id,
+        "created_at": created_at,
+        **slot_fields,
+    }
+    if signed_codes_enabled():
+        # Tracking decodes signed codes itself; the row is only kept for audit.
+        record_events(AdAssignment, [assignment_row])
+    else:
+        db.session.add(AdAssignment(**assignment_row))
+    get_frequency_cap_store().mark_served(partner_id, ad.id, config.freq_cap_seconds)
+    record_events(
+        PartnerAdRequestEvent,
+        [request_event_row(partner_id, slot_fields, created_at, result, code)],
     )
-    db.session.add(assignment)
     db.session.commit()
+    get_assignment_cache().put(
+        AssignmentRoute(code, partner_id, campaign.id, ad.id, ad.destination_url)
+    )
 
-    exposure = PartnerAdExposure.query.filter_by(partner_id=partner_id, ad_id=ad.id).first()
-    if exposure:
-        exposure.last_served_at = db.func.now()
-    else:
-        db.session.add(
-            PartnerAdExposure(
-                partner_id=partner_id,
-                ad_id=ad.id,
+    response = ad_payload(ad, campaign, code, result.explanation, result.score_breakdown)
+    if result.debug_candidates is not None:
+        response["debug_candidates"] = result.debug_candidates
+    return jsonify(response)
+
+
+def _parse_slot(raw_slot):
+    if not isinstance(raw_slot, dict):
+        return None
+    values = {}
+    for field in ("category", "geo", "device", "placement"):
+        value = raw_slot.get(field)
+        if value is not None and not isinstance(value, str):
+            return None
+        values[field] = (value or "").strip() or None
+    return AdSlot(**values)
+
+
+@partner_ads_bp.route("/api/partner/ads/batch", methods=["POST"])
+@roles_required("partner")
+def request_ads_batch():
+    try:
+        partner_id = int(get_jwt_identity())
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_identity"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    raw_slots = payload.get("slots")
+    if not isinstance(raw_slots, list) or not raw_slots:
+        return jsonify({"error": "invalid_slots"}), 400
+    if len(raw_slots) > int(current_app.config.get("BATCH_AD_MAX_SLOTS", 10)):
+        return jsonify({"error": "too_many_slots"}), 400
+    slots = [_parse_slot(raw_slot) for raw_slot in raw_slots]
+    if any(slot is None for slot in slots):
+        return jsonify({"error": "invalid_slots"}), 400
+
+    config = get_matching_config()
+    results = select_ads_for_slots(partner_id, slots, config=config)
+
+    codes = iter(assignment_codes(partner_id, results))
+    created_at = datetime.utcnow()
+    assignment_rows = []
+    request_rows = []
+    served_ad_ids = []
+    routes = []
+    responses = []
+    for slot, result in zip(slots, results):
+        slot_fields = {
+            "category": slot.category,
+            "geo": slot.geo,
+            "placement": slot.placement,
+            "device": slot.device,
+        }
+        if not result.ad or not result.campaign:
+            request_rows.append(request_event_row(partner_id, slot_fields, created_at))
+            response = {"filled": False, "reason": result.unfilled_reason}
+        else:
+            code = next(codes)
+            assignment_rows.append(
+                {
+                    "code": code,
+                    "partner_id": partner_id,
+                    "campaign_id": result.campaign.id,
+                    "ad_id": result.ad.id,
+                    "created_at": created_at,
+                    **slot_fields,
+                }
             )
-        )
+            request_rows.append(
+                request_event_row(partner_id, slot_fields, created_at, result, code)
+            )
+            served_ad_ids.append(result.ad.id)
+            routes.append(
+                AssignmentRoute(
+                    code,
+                    partner_id,
+                    result.campaign.id,
+                    result.ad.id,
+                    result.ad.destination_url,
+                )
+            )
+            response = ad_payload(
+                result.ad, result.campaign, code, result.explanation, result.score_breakdown
+            )
+        if result.debug_candidates is not None:
+            response["debug_candidates"] = result.debug_candidates
+        responses.append(response)
 
-    request_event = PartnerAdRequestEvent(
-        partner_id=partner_id,
-        placement=placement,
-        device=device,
-        geo=geo,
-        category=category,
-        filled=True,
-        ad_id=ad.id,
-        campaign_id=campaign.id,
-        assignment_code=assignment.code,
-        explanation=result.explanation,
-        score_breakdown=json.dumps(result.score_breakdown),
+    # Bulk inserts bypass the flush hooks, so counters are folded in explicitly.
+    event_buffer = get_event_buffer()
+    if event_buffer is not None and signed_codes_enabled():
+        event_buffer.add_many(AdAssignment, assignment_rows)
+    elif assignment_rows:
+        db.session.execute(insert(AdAssignment), assignment_rows)
+    if event_buffer is not None:
+        event_buffer.add_many(PartnerAdRequestEvent, request_rows)
+    else:
+        db.session.execute(insert(PartnerAdRequestEvent), request_rows)
+        record_engagement(PartnerAdRequestEvent, request_rows)
+    get_frequency_cap_store().mark_served_many(
+        partner_id, served_ad_ids, config.freq_cap_seconds
     )
-    db.session.add(request_event)
     db.session.commit()
+    assignment_cache = get_assignment_cache()
+    for route in routes:
+        assignment_cache.put(route)
 
-    response = ad_payload(ad, campaign, assignment, result.explanation, result.score_breakdown)
-    if result.debug_candidates is not None:
-        response["debug_candidates"] = result.debug_candidates
-    return jsonify(response)
+    return jsonify({"slots": responses})
@@ -1,18 +1,29 @@
 import json
 from datetime import date, timedelta
 
-from sqlalchemy import case, func
+from sqlalchemy import func
 from flask import current_app
 
 from app.extensions import db
 from app.models.ad import Ad
+from app.models.budget_lease import BudgetLease
 from app.models.campaign import Campaign
 from app.models.click_event import ClickEvent
 from app.models.impression_event import ImpressionEvent
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.models.partner_quality import PartnerQualityBucket
 from app.models.user import User
-from app.services.market_health import build_market_health_snapshot, derive_adaptive_multipliers
-from app.services.partner_quality import partner_quality_state, partner_reject_rate
+from app.services.cached_value import CachedValue
+from app.services.market_health import get_market_health
+from app.services.partner_quality import (
+    partner_click_totals,
+    partner_quality_state,
+    partner_reject_rate,
+)
+from app.services.rollups import click_decision_counts, daily_traffic_rows
+from app.services.settings import get_matching_config
+
+TARGETING_FIELDS = ("category", "geo", "device", "placement")
 
 
 def _normalize_day(value):
@@ -21,47 +32,33 @@ def _normalize_day(value):
     return value
 
 
+def _empty_day():
+    return {"spend": 0, "earnings": 0, "profit": 0, "clicks": 0, "impressions": 0}
+
+
 def build_daily_series(click_rows, impression_rows, days):
+    """Zero-filled daily series; rows for the same day are summed, so rollup
+    rows and raw top-up rows can be passed together.
+    """
     end_date = date.today()
     start_date = end_date - timedelta(days=days - 1)
     row_map = {}
 
     for row in click_rows:
-        row_map[_normalize_day(row.day)] = {
-            "spend": float(row.spend or 0),
-            "earnings": float(row.earnings or 0),
-            "profit": float(row.profit or 0),
-            "clicks": int(row.clicks or 0),
-            "impressions": 0,
-        }
+        payload = row_map.setdefault(_normalize_day(row.day), _empty_day())
+        payload["spend"] += float(row.spend or 0)
+        payload["earnings"] += float(row.earnings or 0)
+        payload["profit"] += float(row.profit or 0)
+        payload["clicks"] += int(row.clicks or 0)
 
     for row in impression_rows:
-        day_value = _normalize_day(row.day)
-        payload = row_map.setdefault(
-            day_value,
-            {
-                "spend": 0,
-                "earnings": 0,
-                "profit": 0,
-                "clicks": 0,
-                "impressions": 0,
-            },
-        )
-        payload["impressions"] = int(row.impressions or 0)
+        payload = row_map.setdefault(_normalize_day(row.day), _empty_day())
+        payload["impressions"] += int(row.impressions or 0)
 
     series = []
     for offset in range(days):
         current_day = start_date + timedelta(days=offset)
-        payload = row_map.get(
-            current_day,
-            {
-                "spend": 0,
-                "earnings": 0,
-                "profit": 0,
-                "clicks": 0,
-                "impressions": 0,
-            },
-        )
+        payload = row_map.get(current_day, _empty_day())
         series.append(
             {
                 "date": current_day.isoformat(),
@@ -76,19 +73,12 @@ def build_daily_series(click_rows, impression_rows, days):
     return series
 
 
-def build_risk_series(rows, start_date, end_date):
-    row_map = {}
-    for row in rows:
-        row_map[_normalize_day(row.day)] = {
-            "accepted": int(row.accepted or 0),
-            "rejected": int(row.rejected or 0),
-        }
-
+def build_risk_series(day_counts, start_date, end_date):
     series = []
     total_days = (end_date - start_date).days + 1
     for offset in range(total_days):
         current_day = start_date + timedelta(days=offset)
-        payload = row_map.get(current_day, {"accepted": 0, "rejected": 0})
+        payload = day_counts.get(current_day, {"accepted": 0, "rejected": 0})
         series.append(
             {
                 "date": current_day.isoformat(),
@@ -99,143 +89,149 @@ def build_risk_series(rows, start_date, end_date):
     return series
 
 
-def _click_rows_for_campaign_filter(campaign_filter, start_date):
-    return (
-        db.session.query(
-            func.date(ClickEvent.ts).label("day"),
-            func.count(ClickEvent.id).label("clicks"),
-            func.sum(ClickEvent.spend_delta).label("spend"),
-            func.sum(ClickEvent.earnings_delta).label("earnings"),
-            func.sum(ClickEvent.profit_delta).label("profit"),
-        )
-        .join(Campaign, ClickEvent.campaign_id == Campaign.id)
-        .filter(campaign_filter)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= start_date)
-        .group_by("day")
-        .all()
-    )
-
-
-def _impression_rows_for_campaign_filter(campaign_filter, start_date):
-    return (
-        db.session.query(
-            func.date(ImpressionEvent.ts).label("day"),
-            func.count(ImpressionEvent.id).label("impressions"),
-        )
-        .join(Campaign, ImpressionEvent.campaign_id == Campaign.id)
-        .filter(campaign_filter)
-        .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= start_date)
-        .group_by("day")
-        .all()
-    )
-
-
 def buyer_daily_metrics(buyer_id, days=14):
     start_date = date.today() - timedelta(days=days - 1)
-
-    click_rows = _click_rows_for_campaign_filter(Campaign.buyer_id == buyer_id, start_date)
-    impression_rows = _impression_rows_for_campaign_filter(
-        Campaign.buyer_id == buyer_id, start_date
-    )
+    click_rows, impression_rows = daily_traffic_rows(start_date, buyer_id=buyer_id)
     return build_daily_series(click_rows, impression_rows, days)
 
 
 def partner_daily_metrics(partner_id, days=14):
     start_date = date.today() - timedelta(days=days - 1)
+    click_rows, impression_rows = daily_traffic_rows(start_date, partner_id=partner_id)
+    return build_daily_series(click_rows, impression_rows, days)
+
 
-    click_rows = (
+def campaign_event_totals(campaign_ids):
+    """Accepted clicks, spend, impressions and budget spent for each of
+    ``campaign_ids``, aggregated per campaign in one statement.
+    """
+    campaign_ids = list(campaign_ids)
+    if not campaign_ids:
+        return {}
+    clicks = (
         db.session.query(
-            func.date(ClickEvent.ts).label("day"),
+            ClickEvent.campaign_id.label("campaign_id"),
             func.count(ClickEvent.id).label("clicks"),
             func.sum(ClickEvent.spend_delta).label("spend"),
-            func.sum(ClickEvent.earnings_delta).label("earnings"),
-            func.sum(ClickEvent.profit_delta).label("profit"),
         )
-        .filter(ClickEvent.partner_id == partner_id)
+        .filter(ClickEvent.campaign_id.in_(campaign_ids))
         .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= start_date)
-        .group_by("day")
-        .all()
+        .group_by(ClickEvent.campaign_id)
+        .subquery()
     )
-
-    impression_rows = (
+    impressions = (
         db.session.query(
-            func.date(ImpressionEvent.ts).label("day"),
+            ImpressionEvent.campaign_id.label("campaign_id"),
             func.count(ImpressionEvent.id).label("impressions"),
         )
-        .filter(ImpressionEvent.partner_id == partner_id)
+        .filter(ImpressionEvent.campaign_id.in_(campaign_ids))
         .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= start_date)
-        .group_by("day")
+        .group_by(ImpressionEvent.campaign_id)
+        .subquery()
+    )
+    leases = (
+        db.session.query(
+            BudgetLease.campaign_id.label("campaign_id"),
+            func.sum(BudgetLease.spent).label("spent"),
+        )
+        .filter(BudgetLease.campaign_id.in_(campaign_ids))
+        .filter(BudgetLease.released_at.is_(None))
+        .group_by(BudgetLease.campaign_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(
+            Campaign.id,
+            Campaign.budget_total,
+            Campaign.budget_spent,
+            clicks.c.clicks,
+            clicks.c.spend,
+            impressions.c.impressions,
+            leases.c.spent.label("lease_spent"),
+        )
+        .outerjoin(clicks, clicks.c.campaign_id == Campaign.id)
+        .outerjoin(impressions, impressions.c.campaign_id == Campaign.id)
+        .outerjoin(leases, leases.c.campaign_id == Campaign.id)
+        .filter(Campaign.id.in_(campaign_ids))
         .all()
     )
+    results = {}
+    for row in rows:
+        # Settled spend plus clicks charged to still-open leases; budget
+        # reserved for those leases is not spend.
+        budget_spent = (row.budget_spent or 0) + (row.lease_spent or 0)
+        results[row.id] = {
+            "clicks": int(row.clicks or 0),
+            "spend": float(row.spend or 0),
+            "impressions": int(row.impressions or 0),
+            "budget_spent": float(budget_spent),
+            "budget_remaining": float((row.budget_total or 0) - budget_spent),
+        }
+    return results
 
-    return build_daily_series(click_rows, impression_rows, days)
+
+def campaign_top_partners(campaign_ids, limit=3):
+    """The ``limit`` partners with the most accepted clicks on each campaign,
+    ranked with ``ROW_NUMBER()`` per campaign in one statement.
+    """
+    campaign_ids = list(campaign_ids)
+    if not campaign_ids:
+        return {}
+    clicks = func.count(ClickEvent.id)
+    ranked = (
+        db.session.query(
+            ClickEvent.campaign_id.label("campaign_id"),
+            ClickEvent.partner_id.label("partner_id"),
+            clicks.label("clicks"),
+            func.row_number()
+            .over(
+                partition_by=ClickEvent.campaign_id,
+                order_by=(clicks.desc(), ClickEvent.partner_id),
+            )
+            .label("position"),
+        )
+        .filter(ClickEvent.campaign_id.in_(campaign_ids))
+        .filter(ClickEvent.status == "ACCEPTED")
+        .filter(ClickEvent.partner_id.isnot(None))
+        .group_by(ClickEvent.campaign_id, ClickEvent.partner_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(ranked.c.campaign_id, User.id, User.email, ranked.c.clicks)
+        .join(User, User.id == ranked.c.partner_id)
+        .filter(ranked.c.position <= limit)
+        .order_by(ranked.c.campaign_id, ranked.c.position)
+        .all()
+    )
+    results = {campaign_id: [] for campaign_id in campaign_ids}
+    for row in rows:
+        results[row.campaign_id].append(
+            {"id": row.id, "email": row.email, "clicks": int(row.clicks)}
+        )
+    return results
 
 
 def buyer_campaign_table(buyer_id):
     campaigns = Campaign.query.filter_by(buyer_id=buyer_id).order_by(Campaign.id.desc()).all()
+    campaign_ids = [campaign.id for campaign in campaigns]
+    totals = campaign_event_totals(campaign_ids)
+    top_partners = campaign_top_partners(campaign_ids)
     results = []
 
     for campaign in campaigns:
-        click_stats = (
-            db.session.query(
-                func.count(ClickEvent.id).label("clicks"),
-                func.sum(ClickEvent.spend_delta).label("spend"),
-            )
-            .filter(ClickEvent.campaign_id == campaign.id)
-            .filter(ClickEvent.status == "ACCEPTED")
-            .first()
-        )
-        click_count = int(click_stats.clicks or 0)
-        spend = float(click_stats.spend or 0)
-
-        impressions = (
-            db.session.query(func.count(ImpressionEvent.id))
-            .filter(ImpressionEvent.campaign_id == campaign.id)
-            .filter(ImpressionEvent.status == "ACCEPTED")
-            .scalar()
-            or 0
-        )
-        ctr = click_count / impressions if impressions else 0
-
-        partner_rows = (
-            db.session.query(
-                User.id,
-                User.email,
-                func.count(ClickEvent.id).label("clicks"),
-            )
-            .join(ClickEvent, ClickEvent.partner_id == User.id)
-            .filter(
-                ClickEvent.campaign_id == campaign.id,
-                ClickEvent.status == "ACCEPTED",
-            )
-            .group_by(User.id, User.email)
-            .order_by(func.count(ClickEvent.id).desc())
-            .limit(3)
-            .all()
-        )
-
+        stats = totals[campaign.id]
+        ctr = stats["clicks"] / stats["impressions"] if stats["impressions"] else 0
         results.append(
             {
                 "id": campaign.id,
                 "name": campaign.name,
                 "status": campaign.status,
-                "spend": spend,
-                "clicks": click_count,
-                "impressions": int(impressions),
+                "spend": stats["spend"],
+                "clicks": stats["clicks"],
+                "impressions": stats["impressions"],
                 "ctr": ctr,
-                "budget_remaining": float(campaign.budget_remaining),
-                "top_partners": [
-                    {
-                        "id": row.id,
-                        "email": row.email,
-                        "clicks": int(row.clicks),
-                    }
-                    for row in partner_rows
-                ],
+                "budget_remaining": stats["budget_remaining"],
+                "top_partners": top_partners[campaign.id],
             }
         )
 
@@ -270,10 +266,10 @@ def partner_campaign_table(partner_id):
 
 
 def partner_top_ads(partner_id, limit=5):
-    rows = (
+    top_ads = (
         db.session.query(
-            Ad.id,
-            Ad.title,
+            Ad.id.label("id"),
+            Ad.title.label("title"),
             func.count(ClickEvent.id).label("clicks"),
             func.sum(ClickEvent.earnings_delta).label("earnings"),
         )
@@ -283,20 +279,36 @@ def partner_top_ads(partner_id, limit=5):
         .group_by(Ad.id, Ad.title)
         .order_by(func.sum(ClickEvent.earnings_delta).desc())
         .limit(limit)
+        .subquery()
+    )
+    impressions = (
+        db.session.query(
+            ImpressionEvent.ad_id.label("ad_id"),
+            func.count(ImpressionEvent.id).label("impressions"),
+        )
+        .filter(ImpressionEvent.partner_id == partner_id)
+        .filter(ImpressionEvent.ad_id.in_(db.session.query(top_ads.c.id)))
+        .filter(ImpressionEvent.status == "ACCEPTED")
+        .group_by(ImpressionEvent.ad_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(
+            top_ads.c.id,
+            top_ads.c.title,
+            top_ads.c.clicks,
+            top_ads.c.earnings,
+            impressions.c.impressions,
+        )
+        .outerjoin(impressions, impressions.c.ad_id == top_ads.c.id)
+        .order_by(top_ads.c.earnings.desc())
         .all()
     )
 
     results = []
     for row in rows:
-        impressions = (
-            db.session.query(func.count(ImpressionEvent.id))
-            .filter(ImpressionEvent.partner_id == partner_id)
-            .filter(ImpressionEvent.ad_id == row.id)
-            .filter(ImpressionEvent.status == "ACCEPTED")
-            .scalar()
-            or 0
-        )
-        ctr = int(row.clicks or 0) / impressions if impressions else 0
+        impression_count = int(row.impressions or 0)
+        ctr = int(row.clicks or 0) / impression_count if impression_count else 0
         results.append(
             {
                 "id": row.id,
@@ -383,8 +395,50 @@ def partner_latest_request(partner_id):
     }
 
 
-def buyer_request_stats(buyer_id):
-    campaigns = Campaign.query.filter_by(buyer_id=buyer_id, status="active").all()
+def unfilled_request_signatures():
+    """Unfilled ad requests grouped by targeting signature, as
+    ``((category, geo, device, placement), count)`` pairs.
+    """
+    columns = [getattr(PartnerAdRequestEvent, field) for field in TARGETING_FIELDS]
+    rows = (
+        db.session.query(*columns, func.count(PartnerAdRequestEvent.id).label("requests"))
+        .filter(PartnerAdRequestEvent.filled.is_(False))
+        .group_by(*columns)
+        .all()
+    )
+    return [(tuple(row[: len(TARGETING_FIELDS)]), int(row.requests)) for row in rows]
+
+
+def _targeting_compatible(targeting, signature):
+    # A field left empty on either side matches anything.
+    return all(
+        not wanted or not offered or wanted == offered
+        for wanted, offered in zip(targeting, signature)
+    )
+
+
+def unfilled_requests_for_targeting(targetings, signatures):
+    """How many unfilled requests at least one of ``targetings`` could have served."""
+    targetings = set(targetings)
+    return sum(
+        count
+        for signature, count in signatures
+        if any(_targeting_compatible(targeting, signature) for targeting in targetings)
+    )
+
+
+def buyer_request_stats(buyer_id, signatures=None):
+    campaigns = (
+        db.session.query(
+            Campaign.id,
+            Campaign.targeting_category,
+            Campaign.targeting_geo,
+            Campaign.targeting_device,
+            Campaign.targeting_placement,
+        )
+        .filter(Campaign.buyer_id == buyer_id, Campaign.status == "active")
+        .all()
+    )
     campaign_ids = [campaign.id for campaign in campaigns]
     if not campaign_ids:
         return {"fill_rate": 0, "total_requests": 0, "filled_requests": 0}
@@ -396,24 +450,11 @@ def buyer_request_stats(buyer_id):
         ).count()
     )
 
-    unfilled_events = PartnerAdRequestEvent.query.filter_by(filled=False).all()
-    unfilled_requests = 0
-    for event in unfilled_events:
-        for campaign in campaigns:
-            if campaign.targeting_category and event.category:
-                if campaign.targeting_category != event.category:
-                    continue
-            if campaign.targeting_geo and event.geo:
-                if campaign.targeting_geo != event.geo:
-                    continue
-            if campaign.targeting_device and event.device:
-                if campaign.targeting_device != event.device:
-                    continue
-            if campaign.targeting_placement and event.placement:
-                if campaign.targeting_placement != event.placement:
-                    continue
-            unfilled_requests += 1
-            break
+    if signatures is None:
+        signatures = unfilled_request_signatures()
+    unfilled_requests = unfilled_requests_for_targeting(
+        (tuple(campaign[1:]) for campaign in campaigns), signatures
+    )
 
     total_requests = filled_requests + unfilled_requests
     fill_rate = filled_requests / total_requests if total_requests else 0
@@ -424,8 +465,18 @@ def buyer_request_stats(buyer_id):
     }
 
 
-def buyer_delivery_status(buyer_id):
-    stats = buyer_request_stats(buyer_id)
+def _delivery_status(total_requests, fill_rate, clicks):
+    click_rate = clicks / total_requests if total_requests else 0
+    if total_requests >= 10 and (fill_rate < 0.5 or click_rate < 0.01):
+        return (
+            "UNDER_DELIVERING",
+            "Low fill or click rate; delivery balancing may boost exposure.",
+        )
+    return "ON_TRACK", "Delivery pacing is within expected range."
+
+
+def buyer_delivery_status(buyer_id, signatures=None):
+    stats = buyer_request_stats(buyer_id, signatures)
     clicks = (
         db.session.query(func.count(ClickEvent.id))
         .join(Campaign, ClickEvent.campaign_id == Campaign.id)
@@ -436,13 +487,7 @@ def buyer_delivery_status(buyer_id):
     )
     total_requests = stats["total_requests"]
     fill_rate = stats["fill_rate"]
-    click_rate = clicks / total_requests if total_requests else 0
-    if total_requests >= 10 and (fill_rate < 0.5 or click_rate < 0.01):
-        status = "UNDER_DELIVERING"
-        note = "Low fill or click rate; delivery balancing may boost exposure."
-    else:
-        status = "ON_TRACK"
-        note = "Delivery pacing is within expected range."
+    status, note = _delivery_status(total_requests, fill_rate, clicks)
     return {
         "status": status,
         "fill_rate": fill_rate,
@@ -453,32 +498,7 @@ def buyer_delivery_status(buyer_id):
 
 def admin_daily_metrics(days=14):
     start_date = date.today() - timedelta(days=days - 1)
-
-    click_rows = (
-        db.session.query(
-            func.date(ClickEvent.ts).label("day"),
-            func.count(ClickEvent.id).label("clicks"),
-            func.sum(ClickEvent.spend_delta).label("spend"),
-            func.sum(ClickEvent.earnings_delta).label("earnings"),
-            func.sum(ClickEvent.profit_delta).label("profit"),
-        )
-        .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= start_date)
-        .group_by("day")
-        .all()
-    )
-
-    impression_rows = (
-        db.session.query(
-            func.date(ImpressionEvent.ts).label("day"),
-            func.count(ImpressionEvent.id).label("impressions"),
-        )
-        .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= start_date)
-        .group_by("day")
-        .all()
-    )
-
+    click_rows, impression_rows = daily_traffic_rows(start_date)
     return build_daily_series(click_rows, impression_rows, days)
 
 
@@ -537,12 +557,7 @@ def admin_top_partners(limit=5):
 
 
 def partner_quality_summary(partner_id):
-    accepted_clicks = (
-        ClickEvent.query.filter_by(partner_id=partner_id, status="ACCEPTED").count()
-    )
-    rejected_clicks = (
-        ClickEvent.query.filter_by(partner_id=partner_id, status="REJECTED").count()
-    )
+    accepted_clicks, rejected_clicks = partner_click_totals(partner_id)
     accepted_impressions = (
         ImpressionEvent.query.filter_by(partner_id=partner_id, status="ACCEPTED").count()
     )
@@ -559,25 +574,17 @@ def partner_quality_summary(partner_id):
     epc = float(earnings) / accepted_clicks if accepted_clicks else 0
     rejection_rate = rejected_clicks / total_clicks if total_clicks else 0
 
+    config = get_matching_config()
     quality = partner_quality_state(
         partner_id=partner_id,
-        recent_days=current_app.config.get("PARTNER_QUALITY_RECENT_DAYS", 1),
-        long_days=current_app.config.get("PARTNER_QUALITY_LONG_DAYS", 7),
-        new_clicks_threshold=current_app.config.get("PARTNER_QUALITY_NEW_CLICKS", 10),
-        risky_reject_rate=current_app.config.get("PARTNER_QUALITY_RISKY_REJECT_RATE", 0.2),
-        recovering_reject_rate=current_app.config.get(
-            "PARTNER_QUALITY_RECOVER_REJECT_RATE", 0.1
-        ),
-        delta_multipliers={
-            "NEW": current_app.config.get("PARTNER_QUALITY_DELTA_NEW", 0.8),
-            "STABLE": current_app.config.get("PARTNER_QUALITY_DELTA_STABLE", 1.0),
-            "RISKY": current_app.config.get("PARTNER_QUALITY_DELTA_RISKY", 1.5),
-            "RECOVERING": current_app.config.get("PARTNER_QUALITY_DELTA_RECOVERING", 1.1),
-        },
-    )
-    recent_reject_rate = partner_reject_rate(
-        partner_id, current_app.config.get("MATCH_REJECT_LOOKBACK_DAYS", 7)
+        recent_days=config.quality_recent_days,
+        long_days=config.quality_long_days,
+        new_clicks_threshold=config.quality_new_clicks,
+        risky_reject_rate=config.quality_risky_reject_rate,
+        recovering_reject_rate=config.quality_recover_reject_rate,
+        delta_multipliers=config.quality_delta_multipliers,
     )
+    recent_reject_rate = partner_reject_rate(partner_id, config.reject_lookback_days)
 
     return {
         "accepted_clicks": accepted_clicks,
@@ -592,30 +599,47 @@ def partner_quality_summary(partner_id):
     }
 
 
-def admin_marketplace_health():
-    total_requests = PartnerAdRequestEvent.query.count()
-    filled_requests = PartnerAdRequestEvent.query.filter_by(filled=True).count()
+def _build_marketplace_health():
+    requests = db.session.query(
+        func.count(PartnerAdRequestEvent.id).label("total"),
+        func.count(PartnerAdRequestEvent.id)
+        .filter(PartnerAdRequestEvent.filled.is_(True))
+        .label("filled"),
+    ).one()
+    total_requests = int(requests.total or 0)
+    filled_requests = int(requests.filled or 0)
     fill_rate = filled_requests / total_requests if total_requests else 0
 
-    accepted_clicks = ClickEvent.query.filter_by(status="ACCEPTED").count()
-    rejected_clicks = ClickEvent.query.filter_by(status="REJECTED").count()
+    accepted = ClickEvent.status == "ACCEPTED"
+    clicks = db.session.query(
+        func.count(ClickEvent.id).filter(accepted).label("accepted"),
+        func.count(ClickEvent.id).filter(ClickEvent.status == "REJECTED").label("rejected"),
+        func.sum(ClickEvent.spend_delta).filter(accepted).label("spend"),
+        func.sum(ClickEvent.profit_delta).filter(accepted).label("profit"),
+    ).one()
+    accepted_clicks = int(clicks.accepted or 0)
+    rejected_clicks = int(clicks.rejected or 0)
     total_clicks = accepted_clicks + rejected_clicks
     reject_rate = rejected_clicks / total_clicks if total_clicks else 0
-
-    spend = (
-        db.session.query(func.sum(ClickEvent.spend_delta))
-        .filter(ClickEvent.status == "ACCEPTED")
-        .scalar()
-        or 0
-    )
-    profit = (
-        db.session.query(func.sum(ClickEvent.profit_delta))
-        .filter(ClickEvent.status == "ACCEPTED")
-        .scalar()
-        or 0
-    )
+    spend = clicks.spend or 0
+    profit = clicks.profit or 0
     take_rate = float(profit) / float(spend) if spend else 0
 
+    return {
+        "fill_rate": fill_rate,
+        "reject_rate": reject_rate,
+        "profit": float(profit or 0),
+        "take_rate": take_rate,
+        "market_note": get_market_health()[1]["market_note"],
+        "top_under_delivering_buyers": _under_delivering_buyers()[:5],
+        "top_low_quality_partners": _low_quality_partners()[:5],
+    }
+
+
+def _under_delivering_buyers():
+    """Fill rate, accepted clicks and delivery status for every buyer with a
+    campaign, from one grouped statement per measure.
+    """
     buyer_rows = (
         db.session.query(User.id, User.email)
         .join(Campaign, Campaign.buyer_id == User.id)
@@ -623,76 +647,123 @@ def admin_marketplace_health():
         .group_by(User.id, User.email)
         .all()
     )
-    under_delivering = []
+    active_targetings = {}
+    for row in db.session.query(
+        Campaign.buyer_id,
+        Campaign.targeting_category,
+        Campaign.targeting_geo,
+        Campaign.targeting_device,
+        Campaign.targeting_placement,
+    ).filter(Campaign.status == "active"):
+        active_targetings.setdefault(row.buyer_id, set()).add(tuple(row[1:]))
+    filled_by_buyer = dict(
+        db.session.query(Campaign.buyer_id, func.count(PartnerAdRequestEvent.id))
+        .join(Campaign, PartnerAdRequestEvent.campaign_id == Campaign.id)
+        .filter(PartnerAdRequestEvent.filled.is_(True), Campaign.status == "active")
+        .group_by(Campaign.buyer_id)
+        .all()
+    )
+    clicks_by_buyer = dict(
+        db.session.query(Campaign.buyer_id, func.count(ClickEvent.id))
+        .join(Campaign, ClickEvent.campaign_id == Campaign.id)
+        .filter(ClickEvent.status == "ACCEPTED")
+        .group_by(Campaign.buyer_id)
+        .all()
+    )
+    signatures = unfilled_request_signatures()
+
+    buyers = []
     for row in buyer_rows:
-        stats = buyer_request_stats(row.id)
-        delivery = buyer_delivery_status(row.id)
-        under_delivering.append(
+        fill_rate, total_requests = 0, 0
+        targetings = active_targetings.get(row.id)
+        if targetings:
+            filled = int(filled_by_buyer.get(row.id, 0))
+            total_requests = filled + unfilled_requests_for_targeting(targetings, signatures)
+            fill_rate = filled / total_requests if total_requests else 0
+        clicks = int(clicks_by_buyer.get(row.id, 0))
+        buyers.append(
             {
                 "id": row.id,
                 "email": row.email,
-                "fill_rate": stats["fill_rate"],
-                "clicks": (
-                    db.session.query(func.count(ClickEvent.id))
-                    .join(Campaign, ClickEvent.campaign_id == Campaign.id)
-                    .filter(Campaign.buyer_id == row.id)
-                    .filter(ClickEvent.status == "ACCEPTED")
-                    .scalar()
-                    or 0
-                ),
-                "status": delivery["status"],
+                "fill_rate": fill_rate,
+                "clicks": clicks,
+                "status": _delivery_status(total_requests, fill_rate, clicks)[0],
             }
         )
+    buyers.sort(key=lambda item: (item["fill_rate"], item["clicks"]))
+    return buyers
+
+
+def _low_quality_partners():
+    """All-time rejection rate and CTR for every partner, highest rejection first."""
+    decisions = {
+        row.partner_id: (int(row.accepted or 0), int(row.rejected or 0))
+        for row in db.session.query(
+            PartnerQualityBucket.partner_id,
+            func.sum(PartnerQualityBucket.accepted).label("accepted"),
+            func.sum(PartnerQualityBucket.rejected).label("rejected"),
+        ).group_by(PartnerQualityBucket.partner_id)
+    }
+    impressions = dict(
+        db.session.query(ImpressionEvent.partner_id, func.count(ImpressionEvent.id))
+        .filter(ImpressionEvent.status == "ACCEPTED")
+        .group_by(ImpressionEvent.partner_id)
+        .all()
+    )
 
-    under_delivering.sort(key=lambda item: (item["fill_rate"], item["clicks"]))
-
-    partner_rows = User.query.filter_by(role="partner").all()
-    low_quality = []
-    for partner in partner_rows:
-        quality = partner_quality_summary(partner.id)
-        low_quality.append(
+    partners = []
+    for partner_id, email in (
+        db.session.query(User.id, User.email).filter(User.role == "partner").order_by(User.id)
+    ):
+        accepted, rejected = decisions.get(partner_id, (0, 0))
+        accepted_impressions = int(impressions.get(partner_id, 0))
+        total_clicks = accepted + rejected
+        partners.append(
             {
-                "id": partner.id,
-                "email": partner.email,
-                "rejection_rate": quality["rejection_rate"],
-                "ctr": quality["ctr"],
+                "id": partner_id,
+                "email": email,
+                "rejection_rate": rejected / total_clicks if total_clicks else 0,
+                "ctr": accepted / accepted_impressions if accepted_impressions else 0,
             }
         )
-    low_quality.sort(key=lambda item: (-item["rejection_rate"], item["ctr"]))
+    partners.sort(key=lambda item: (-item["rejection_rate"], item["ctr"]))
+    return partners
 
-    snapshot = build_market_health_snapshot()
-    market_note = derive_adaptive_multipliers(snapshot)["market_note"]
 
-    return {
-        "fill_rate": fill_rate,
-        "reject_rate": reject_rate,
-        "profit": float(profit or 0),
-        "take_rate": take_rate,
-        "market_note": market_note,
-        "top_under_delivering_buyers": under_delivering[:5],
-        "top_low_quality_partners": low_quality[:5],
-    }
+def admin_marketplace_health():
+    """Marketplace health for the admin summary.
+
+    Cached per worker for ``ADMIN_HEALTH_CACHE_SECONDS`` (``0``, the default,
+    recomputes on every call); for a further ``ADMIN_HEALTH_STALE_SECONDS`` the
+    stale value is served while a background refresh runs.
+    """
+    cache = current_app.extensions.setdefault(
+        "marketplace_health", CachedValue(_build_marketplace_health)
+    )
+    return cache.get(
+        float(current_app.config.get("ADMIN_HEALTH_CACHE_SECONDS", 0)),
+        float(current_app.config.get("ADMIN_HEALTH_STALE_SECONDS", 300)),
+    )
 
 
-def admin_risk_summary():
-    accepted = ClickEvent.query.filter_by(status="ACCEPTED").count()
-    rejected = ClickEvent.query.filter_by(status="REJECTED").count()
+def admin_risk_summary(start_date=None, end_date=None, partner_id=None):
+    counts = click_decision_counts(
+        ("reject_reason",), start_date=start_date, end_date=end_date, partner_id=partner_id
+    )
+    accepted = sum(entry["accepted"] for entry in counts.values())
+    rejected = sum(entry["rejected"] for entry in counts.values())
     total = accepted + rejected
     rejection_rate = rejected / total if total else 0
 
-    reason_rows = (
-        db.session.query(ClickEvent.reject_reason, func.count(ClickEvent.id).label("count"))
-        .filter(ClickEvent.status == "REJECTED")
-        .group_by(ClickEvent.reject_reason)
-        .order_by(func.count(ClickEvent.id).desc())
-        .all()
+    top_reasons = sorted(
+        (
+            {"reason": reason or "UNKNOWN", "count": entry["rejected"]}
+            for (reason,), entry in counts.items()
+            if entry["rejected"]
+        ),
+        key=lambda item: (-item["count"], item["reason"]),
     )
 
-    top_reasons = [
-        {"reason": row.reject_reason or "UNKNOWN", "count": int(row.count or 0)}
-        for row in reason_rows
-    ]
-
     return {
         "totals": {
             "accepted": accepted,
@@ -704,52 +775,56 @@ def admin_risk_summary():
     }
 
 
-def admin_risk_series(start_date, end_date):
-    rows = (
-        db.session.query(
-            func.date(ClickEvent.ts).label("day"),
-            func.sum(case((ClickEvent.status == "ACCEPTED", 1), else_=0)).label(
-                "accepted"
-            ),
-            func.sum(case((ClickEvent.status == "REJECTED", 1), else_=0)).label(
-                "rejected"
-            ),
-        )
-        .filter(func.date(ClickEvent.ts) >= start_date)
-        .filter(func.date(ClickEvent.ts) <= end_date)
-        .group_by("day")
-        .all()
+def admin_risk_series(start_date, end_date, partner_id=None, reject_reason=None):
+    counts = click_decision_counts(
+        ("day",),
+        start_date=start_date,
+        end_date=end_date,
+        partner_id=partner_id,
+        reject_reason=reject_reason,
+    )
+    return build_risk_series(
+        {day: entry for (day,), entry in counts.items()}, start_date, end_date
     )
 
-    return build_risk_series(rows, start_date, end_date)
 
+def admin_risk_top_partners(limit=5, start_date=None, end_date=None, reject_reason=None):
+    totals = click_decision_counts(("partner_id",), start_date=start_date, end_date=end_date)
+    rejected_counts = totals
+    if reject_reason is not None:
+        rejected_counts = click_decision_counts(
+            ("partner_id",),
+            start_date=start_date,
+            end_date=end_date,
+            reject_reason=reject_reason,
+        )
 
-def admin_risk_top_partners(limit=5):
-    rows = (
-        db.session.query(
-            User.id,
-            User.email,
-            func.sum(case((ClickEvent.status == "REJECTED", 1), else_=0)).label(
-                "rejected"
-            ),
-            func.count(ClickEvent.id).label("total"),
+    def rejected_for(partner_id):
+        return rejected_counts.get((partner_id,), {"rejected": 0})["rejected"]
+
+    partner_ids = [partner_id for (partner_id,) in totals if partner_id]
+    emails = {}
+    if partner_ids:
+        emails = dict(
+            db.session.query(User.id, User.email).filter(User.id.in_(partner_ids)).all()
         )
-        .join(ClickEvent, ClickEvent.partner_id == User.id)
-        .group_by(User.id, User.email)
-        .order_by(func.sum(case((ClickEvent.status == "REJECTED", 1), else_=0)).desc())
-        .limit(limit)
-        .all()
-    )
+    # Partners without a user row are dropped before the cut, so the list
+    # still holds ``limit`` entries when that many qualify.
+    ranked = sorted(
+        (partner_id for partner_id in partner_ids if partner_id in emails),
+        key=lambda partner_id: (-rejected_for(partner_id), partner_id),
+    )[:limit]
 
     results = []
-    for row in rows:
-        total = int(row.total or 0)
-        rejected = int(row.rejected or 0)
+    for partner_id in ranked:
+        entry = totals[(partner_id,)]
+        total = entry["accepted"] + entry["rejected"]
+        rejected = rejected_for(partner_id)
         rate = rejected / total if total else 0
         results.append(
             {
-                "id": row.id,
-                "email": row.email,
+                "id": partner_id,
+                "email": emails[partner_id],
                 "rejected": rejected,
                 "total": total,
                 "rejection_rate": rate,
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+
+from flask import current_app
+
+
+@dataclass(frozen=True, slots=True)
+class AssignmentRoute:
+    """What the tracking endpoints need to know about an assignment code."""
+
+    code: str
+    partner_id: int
+    campaign_id: int
+    ad_id: int
+    destination_url: str
+
+
+class AssignmentCache:
+    """Worker-local LRU of assignment code -> :class:`AssignmentRoute`.
+
+    Assignments never change after they are created, so entries only expire
+    to pick up edited ad destinations from other workers. Local ad edits call
+    :meth:`discard_ad` directly.
+    """
+
+    def __init__(self, max_entries=100_000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, code):
+        entry = self._entries.get(code)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl_seconds:
+            self.misses += 1
+            return None
+        with self._lock:
+            if code in self._entries:
+                self._entries.move_to_end(code)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, route):
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[route.code] = (route, time.monotonic())
+            self._entries.move_to_end(route.code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard_ad(self, ad_id):
+        with self._lock:
+            stale = [code for code, (route, _) in self._entries.items() if route.ad_id == ad_id]
+            for code in stale:
+                del self._entries[code]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_assignment_cache():
+    cache = current_app.extensions.get("assignment_cache")
+    if cache is None:
+        config = current_app.config
+        cache = current_app.extensions.setdefault(
+            "assignment_cache",
+            AssignmentCache(
+                max_entries=int(config.get("ASSIGNMENT_CACHE_MAX_ENTRIES", 100_000)),
+                ttl_seconds=float(config.get("ASSIGNMENT_CACHE_TTL_SECONDS", 300)),
+            ),
+        )
+    return cache
@@ -0,0 +1,146 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import secrets
+import struct
+
+from flask import current_app
+
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.assignment import AdAssignment
+from app.services.assignment_cache import AssignmentRoute, get_assignment_cache
+from app.services.campaign_index import get_campaign_index
+
+ASSIGNMENT_CODE_FORMATS = ("random", "signed")
+
+# version, partner_id, campaign_id, ad_id, issued_at (epoch seconds), nonce
+_PAYLOAD = struct.Struct(">BIIII3s")
+_VERSION = 1
+_MAC_BYTES = 10
+SIGNED_CODE_LENGTH = 4 * (_PAYLOAD.size + _MAC_BYTES) // 3
+
+
+@dataclass(frozen=True)
+class SignedAssignment:
+    """Assignment fields recovered from a verified signed code."""
+
+    code: str
+    partner_id: int
+    campaign_id: int
+    ad_id: int
+    issued_at: datetime
+
+    @property
+    def ad(self):
+        indexed = get_campaign_index().ads.get(self.campaign_id)
+        if indexed is not None and indexed.id == self.ad_id:
+            return indexed
+        return db.session.get(Ad, self.ad_id)
+
+
+def _secret():
+    config = current_app.config
+    secret = config.get("ASSIGNMENT_CODE_SECRET") or config.get("SECRET_KEY")
+    return secret.encode("utf-8")
+
+
+def _mac(payload, secret):
+    return hmac.new(secret, payload, hashlib.sha256).digest()[:_MAC_BYTES]
+
+
+def sign_code(partner_id, campaign_id, ad_id, issued_at=None, secret=None):
+    """Pack assignment fields and a truncated HMAC into a URL-safe token."""
+    issued_at = issued_at or datetime.utcnow()
+    payload = _PAYLOAD.pack(
+        _VERSION,
+        partner_id,
+        campaign_id,
+        ad_id,
+        int((issued_at - datetime(1970, 1, 1)).total_seconds()),
+        secrets.token_bytes(3),
+    )
+    mac = _mac(payload, secret or _secret())
+    return urlsafe_b64encode(payload + mac).decode("ascii")
+
+
+def verify_code(code, secret=None, max_age=None):
+    """Return the :class:`SignedAssignment` for ``code``, or ``None`` if it is
+    not a valid signed code (wrong shape, bad signature or older than ``max_age``).
+    """
+    if len(code) != SIGNED_CODE_LENGTH:
+        return None
+    try:
+        raw = urlsafe_b64decode(code.encode("ascii"))
+    except (Base64Error, UnicodeEncodeError, ValueError):
+        return None
+    payload, mac = raw[: _PAYLOAD.size], raw[_PAYLOAD.size :]
+    if not hmac.compare_digest(mac, _mac(payload, secret or _secret())):
+        return None
+    version, partner_id, campaign_id, ad_id, issued_ts, _ = _PAYLOAD.unpack(payload)
+    if version != _VERSION:
+        return None
+    issued_at = datetime(1970, 1, 1) + timedelta(seconds=issued_ts)
+    if max_age is not None and datetime.utcnow() - issued_at > max_age:
+        return None
+    return SignedAssignment(code, partner_id, campaign_id, ad_id, issued_at)
+
+
+def signed_codes_enabled():
+    code_format = current_app.config.get("ASSIGNMENT_CODE_FORMAT", "random")
+    if code_format not in ASSIGNMENT_CODE_FORMATS:
+        raise ValueError(f"Unknown assignment code format: {code_format!r}")
+    return code_format == "signed"
+
+
+def _load_route(code):
+    if len(code) == SIGNED_CODE_LENGTH:
+        max_age_days = float(current_app.config.get("ASSIGNMENT_CODE_MAX_AGE_DAYS", 30))
+        max_age = timedelta(days=max_age_days) if max_age_days > 0 else None
+        claims = verify_code(code, max_age=max_age)
+        if claims is None:
+            return None
+        ad = claims.ad
+        return AssignmentRoute(
+            code,
+            claims.partner_id,
+            claims.campaign_id,
+            claims.ad_id,
+            ad.destination_url if ad is not None else None,
+        )
+    row = (
+        db.session.query(
+            AdAssignment.code,
+            AdAssignment.partner_id,
+            AdAssignment.campaign_id,
+            AdAssignment.ad_id,
+            Ad.destination_url,
+        )
+        .outerjoin(Ad, Ad.id == AdAssignment.ad_id)
+        .filter(AdAssignment.code == code)
+        .first()
+    )
+    return AssignmentRoute(**row._asdict()) if row else None
+
+
+def resolve_assignment(code):
+    """Return the :class:`AssignmentRoute` behind a tracking code, or ``None``.
+
+    Hot codes are served from the worker's assignment cache. On a miss,
+    signed codes are verified and decoded without touching
+    ``ad_assignments`` (a code with the signed shape that fails verification
+    resolves to ``None``), and random codes are read together with their ad
+    destination in one query. Both formats are accepted whatever
+    ``ASSIGNMENT_CODE_FORMAT`` is set to, so issued links keep working when
+    the setting changes.
+    """
+    cache = get_assignment_cache()
+    route = cache.get(code)
+    if route is None:
+        route = _load_route(code)
+        if route is not None:
+            cache.put(route)
+    return route
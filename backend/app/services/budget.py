@@ -0,0 +1,458 @@
+import atexit
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+import os
+import socket
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import and_, exists, func, insert, or_, select, update
+
+from app.extensions import db
+from app.models.budget_lease import BudgetLease
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.services.campaign_index import flag_campaigns_changed
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0")
+
+
+@dataclass(frozen=True, slots=True)
+class SpendResult:
+    status: str
+    reject_reason: str | None
+    spend_delta: Decimal = ZERO
+    earnings_delta: Decimal = ZERO
+    profit_delta: Decimal = ZERO
+
+
+class ExhaustedCampaigns:
+    """Worker-local set of campaigns known to be paused or out of budget.
+
+    Clicks for these are rejected without touching the campaign row. Entries
+    expire after ``ttl_seconds`` so top-ups and reactivations made through
+    other workers are seen; local campaign edits call :meth:`discard`.
+    """
+
+    def __init__(self, ttl_seconds=30):
+        self.ttl_seconds = ttl_seconds
+        self._marked_at = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, campaign_id):
+        marked_at = self._marked_at.get(campaign_id)
+        return marked_at is not None and time.monotonic() - marked_at < self.ttl_seconds
+
+    def __len__(self):
+        return len(self._marked_at)
+
+    def add(self, campaign_id):
+        now = time.monotonic()
+        with self._lock:
+            self._marked_at[campaign_id] = now
+            if len(self._marked_at) % 1024 == 0:
+                cutoff = now - self.ttl_seconds
+                self._marked_at = {
+                    key: marked for key, marked in self._marked_at.items() if marked >= cutoff
+                }
+
+    def discard(self, campaign_id):
+        with self._lock:
+            self._marked_at.pop(campaign_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._marked_at.clear()
+
+
+def get_exhausted_campaigns():
+    exhausted = current_app.extensions.get("exhausted_campaigns")
+    if exhausted is None:
+        exhausted = current_app.extensions.setdefault(
+            "exhausted_campaigns",
+            ExhaustedCampaigns(
+                ttl_seconds=float(current_app.config.get("EXHAUSTED_CAMPAIGN_TTL_SECONDS", 30))
+            ),
+        )
+    return exhausted
+
+
+@dataclass(slots=True)
+class LocalLease:
+    id: int
+    campaign_id: int
+    amount: Decimal
+    spent: Decimal
+    buyer_cpc: Decimal
+    partner_payout: Decimal
+    expires_at: datetime
+
+    def can_spend(self, now, margin):
+        return (
+            self.spent + self.buyer_cpc <= self.amount
+            and now + margin < self.expires_at
+        )
+
+
+class BudgetLeases:
+    """Leases of campaign budget held by this worker, one per campaign.
+
+    A lease moves ``clicks`` x ``buyer_cpc`` of the campaign's remaining
+    budget into ``budget_reserved`` and a ``budget_leases`` row with one
+    conditional UPDATE, so the shared campaign row is only written once per
+    slice. Clicks then charge the lease row, which only this worker writes.
+    When a lease runs out, expires or the worker exits, its spend is settled
+    into ``budget_spent`` and its reservation dropped; leases a dead worker
+    never returned are reclaimed by :func:`reconcile_budgets`.
+    """
+
+    def __init__(self, engine, clicks=20, ttl_seconds=60, margin_seconds=5):
+        self.engine = engine
+        self.clicks = clicks
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.margin = timedelta(seconds=margin_seconds)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"[:120]
+        self.pid = os.getpid()
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._leases)
+
+    def get(self, campaign_id):
+        return self._leases.get(campaign_id)
+
+    def put(self, lease):
+        with self._lock:
+            self._leases[lease.campaign_id] = lease
+
+    def pop(self, campaign_id):
+        with self._lock:
+            return self._leases.pop(campaign_id, None)
+
+    def release_all(self):
+        """Return every held lease in its own transaction; used at shutdown."""
+        with self._lock:
+            leases = list(self._leases.values())
+            self._leases.clear()
+        if not leases:
+            return 0
+        try:
+            with self.engine.begin() as connection:
+                for lease in leases:
+                    _release(connection, lease.id, datetime.utcnow())
+        except Exception:
+            logger.exception("Could not return budget leases; the reconciler will")
+        return len(leases)
+
+
+def get_budget_leases():
+    """The worker's lease holder, or ``None`` when leasing is disabled."""
+    clicks = int(current_app.config.get("BUDGET_LEASE_CLICKS", 0))
+    if clicks <= 0:
+        return None
+    leases = current_app.extensions.get("budget_leases")
+    # A forked worker must not reuse leases recorded by its parent.
+    if leases is None or leases.pid != os.getpid():
+        config = current_app.config
+        leases = BudgetLeases(
+            db.engine,
+            clicks=clicks,
+            ttl_seconds=float(config.get("BUDGET_LEASE_SECONDS", 60)),
+            margin_seconds=float(config.get("BUDGET_LEASE_MARGIN_SECONDS", 5)),
+        )
+        atexit.register(leases.release_all)
+        current_app.extensions["budget_leases"] = leases
+    return leases
+
+
+def _release(executor, lease_id, now):
+    """Close a lease, settle its spend and drop its reservation; a no-op if
+    already closed. Returns the unspent amount given back.
+    """
+    leases = BudgetLease.__table__
+    closed = executor.execute(
+        update(leases)
+        .where(leases.c.id == lease_id)
+        .where(leases.c.released_at.is_(None))
+        .values(released_at=now)
+        .returning(leases.c.campaign_id, leases.c.amount, leases.c.spent)
+    ).first()
+    if closed is None:
+        return Decimal("0")
+    campaign_id, amount, spent = closed
+    campaigns = Campaign.__table__
+    executor.execute(
+        update(campaigns)
+        .where(campaigns.c.id == campaign_id)
+        .values(
+            budget_spent=campaigns.c.budget_spent + spent,
+            budget_reserved=campaigns.c.budget_reserved - amount,
+        )
+    )
+    return amount - spent
+
+
+def _acquire_lease(leases, campaign_id, now):
+    campaigns = Campaign.__table__
+    slice_amount = campaigns.c.buyer_cpc * leases.clicks
+    reserved = db.session.execute(
+        update(campaigns)
+        .where(campaigns.c.id == campaign_id)
+        .where(campaigns.c.status == "active")
+        .where(
+            campaigns.c.budget_spent + campaigns.c.budget_reserved + slice_amount
+            <= campaigns.c.budget_total
+        )
+        .values(budget_reserved=campaigns.c.budget_reserved + slice_amount)
+        .returning(campaigns.c.buyer_cpc, campaigns.c.partner_payout)
+    ).first()
+    if reserved is None:
+        return None
+    amount = reserved.buyer_cpc * leases.clicks
+    expires_at = now + leases.ttl
+    lease_id = db.session.execute(
+        insert(BudgetLease.__table__)
+        .values(
+            campaign_id=campaign_id,
+            holder=leases.holder,
+            amount=amount,
+            spent=Decimal("0"),
+            buyer_cpc=reserved.buyer_cpc,
+            partner_payout=reserved.partner_payout,
+            expires_at=expires_at,
+        )
+        .returning(BudgetLease.__table__.c.id)
+    ).scalar()
+    lease = LocalLease(
+        lease_id,
+        campaign_id,
+        amount,
+        Decimal("0"),
+        reserved.buyer_cpc,
+        reserved.partner_payout,
+        expires_at,
+    )
+    leases.put(lease)
+    return lease
+
+
+def _spend_from_lease(leases, campaign_id):
+    """Charge one click to this worker's lease, leasing a new slice if needed.
+
+    Returns ``None`` when no slice can be leased, so the caller falls back to
+    charging the campaign row directly for the last few clicks of budget.
+    """
+    now = datetime.utcnow()
+    lease = leases.get(campaign_id)
+    if lease is not None and not lease.can_spend(now, leases.margin):
+        leases.pop(campaign_id)
+        _release(db.session, lease.id, now)
+        lease = None
+    for _ in range(2):
+        if lease is None:
+            lease = _acquire_lease(leases, campaign_id, now)
+            if lease is None:
+                return None
+        table = BudgetLease.__table__
+        charged = db.session.execute(
+            update(table)
+            .where(table.c.id == lease.id)
+            .where(table.c.released_at.is_(None))
+            .where(table.c.expires_at > now)
+            .where(table.c.spent + table.c.buyer_cpc <= table.c.amount)
+            .values(spent=table.c.spent + table.c.buyer_cpc)
+        )
+        if charged.rowcount:
+            lease.spent += lease.buyer_cpc
+            return SpendResult(
+                "ACCEPTED",
+                None,
+                spend_delta=lease.buyer_cpc,
+                earnings_delta=lease.partner_payout,
+                profit_delta=lease.buyer_cpc - lease.partner_payout,
+            )
+        # Reclaimed by the reconciler or rolled back with an earlier request.
+        leases.pop(campaign_id)
+        lease = None
+    return None
+
+
+def reconcile_budgets(grace_seconds=0, now=None):
+    """Reclaim expired leases and realign campaign budgets with click deltas.
+
+    ``budget_spent`` should equal the accepted click spend not charged to an
+    open lease, and ``budget_reserved`` the amount of the open leases. Leases
+    past ``expires_at`` by more than ``grace_seconds`` are closed first.
+
+    Drift is measured in one statement and corrected by adding the
+    difference, not by writing the expected value: a click committed after
+    the measurement moves the column and its click row together, so the
+    correction stays right without locking campaign rows.
+    Returns ``{"reclaimed_leases": n, "corrected_campaigns": [...]}``.
+    """
+    now = now or datetime.utcnow()
+    leases = BudgetLease.__table__
+    expired_ids = db.session.execute(
+        select(leases.c.id)
+        .where(leases.c.released_at.is_(None))
+        .where(leases.c.expires_at < now - timedelta(seconds=grace_seconds))
+    ).scalars().all()
+    for lease_id in expired_ids:
+        _release(db.session, lease_id, now)
+
+    campaigns = Campaign.__table__
+    clicks = ClickEvent.__table__
+    click_spend = (
+        select(func.coalesce(func.sum(clicks.c.spend_delta), 0))
+        .where(clicks.c.campaign_id == campaigns.c.id)
+        .where(clicks.c.status == "ACCEPTED")
+        .scalar_subquery()
+    )
+    lease_spent = (
+        select(func.coalesce(func.sum(leases.c.spent), 0))
+        .where(leases.c.campaign_id == campaigns.c.id)
+        .where(leases.c.released_at.is_(None))
+        .scalar_subquery()
+    )
+    expected_reserved = (
+        select(func.coalesce(func.sum(leases.c.amount), 0))
+        .where(leases.c.campaign_id == campaigns.c.id)
+        .where(leases.c.released_at.is_(None))
+        .scalar_subquery()
+    )
+    expected_spent = click_spend - lease_spent
+    drifted = db.session.execute(
+        select(
+            campaigns.c.id,
+            campaigns.c.budget_spent,
+            campaigns.c.budget_reserved,
+            expected_spent.label("expected_spent"),
+            expected_reserved.label("expected_reserved"),
+        ).where(
+            or_(
+                campaigns.c.budget_spent != expected_spent,
+                campaigns.c.budget_reserved != expected_reserved,
+            )
+        )
+    ).all()
+    corrected = []
+    for row in drifted:
+        spent_drift = _cents(row.expected_spent) - row.budget_spent
+        reserved_drift = _cents(row.expected_reserved) - row.budget_reserved
+        db.session.execute(
+            update(campaigns)
+            .where(campaigns.c.id == row.id)
+            .values(
+                budget_spent=campaigns.c.budget_spent + spent_drift,
+                budget_reserved=campaigns.c.budget_reserved + reserved_drift,
+            )
+        )
+        corrected.append(
+            {
+                "campaign_id": row.id,
+                "budget_spent": str(row.budget_spent),
+                "expected": str(_cents(row.expected_spent)),
+                "budget_reserved": str(row.budget_reserved),
+                "expected_reserved": str(_cents(row.expected_reserved)),
+            }
+        )
+    if expired_ids or corrected:
+        flag_campaigns_changed(db.session)
+    db.session.commit()
+    return {"reclaimed_leases": len(expired_ids), "corrected_campaigns": corrected}
+
+
+def _cents(value):
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+
+def _pause_if_exhausted(campaign_id):
+    """Pause the campaign once it cannot afford a click and no lease is open."""
+    table = Campaign.__table__
+    leases = BudgetLease.__table__
+    paused = db.session.execute(
+        update(table)
+        .where(table.c.id == campaign_id)
+        .where(table.c.status == "active")
+        .where(
+            table.c.budget_spent + table.c.budget_reserved + table.c.buyer_cpc
+            > table.c.budget_total
+        )
+        .where(
+            ~exists().where(
+                and_(leases.c.campaign_id == campaign_id, leases.c.released_at.is_(None))
+            )
+        )
+        .values(status="paused")
+    )
+    if paused.rowcount:
+        flag_campaigns_changed(db.session)
+
+
+def spend_click(campaign_id):
+    """Charge one click to ``campaign_id`` with a single conditional UPDATE.
+
+    The budget check and the increment happen in the database, so concurrent
+    clicks never overspend and no row is locked before the write. A campaign
+    that cannot afford the next click is paused in a follow-up UPDATE that
+    re-checks the same condition, and remembered in the worker's exhausted set
+    so later clicks are rejected without a query. With ``BUDGET_LEASE_CLICKS``
+    set, clicks are charged to a worker-held lease first (see
+    :class:`BudgetLeases`).
+    """
+    exhausted = get_exhausted_campaigns()
+    if campaign_id in exhausted:
+        return SpendResult("REJECTED", "BUDGET_EXHAUSTED")
+
+    leases = get_budget_leases()
+    if leases is not None:
+        result = _spend_from_lease(leases, campaign_id)
+        if result is not None:
+            return result
+
+    table = Campaign.__table__
+    charged = db.session.execute(
+        update(table)
+        .where(table.c.id == campaign_id)
+        .where(table.c.status == "active")
+        .where(
+            table.c.budget_spent + table.c.budget_reserved + table.c.buyer_cpc
+            <= table.c.budget_total
+        )
+        .values(budget_spent=table.c.budget_spent + table.c.buyer_cpc)
+        .returning(
+            table.c.buyer_cpc,
+            table.c.partner_payout,
+            table.c.budget_spent,
+            table.c.budget_reserved,
+            table.c.budget_total,
+        )
+    ).first()
+
+    if charged is None:
+        status = db.session.execute(
+            select(table.c.status).where(table.c.id == campaign_id)
+        ).scalar()
+        if status is None:
+            return SpendResult("REJECTED", "INVALID_ASSIGNMENT")
+        _pause_if_exhausted(campaign_id)
+        exhausted.add(campaign_id)
+        return SpendResult("REJECTED", "BUDGET_EXHAUSTED")
+
+    available = charged.budget_total - charged.budget_spent - charged.budget_reserved
+    if available < charged.buyer_cpc:
+        _pause_if_exhausted(campaign_id)
+        exhausted.add(campaign_id)
+    return SpendResult(
+        "ACCEPTED",
+        None,
+        spend_delta=charged.buyer_cpc,
+        earnings_delta=charged.partner_payout,
+        profit_delta=charged.buyer_cpc - charged.partner_payout,
+    )
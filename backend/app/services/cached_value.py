@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class CachedValue:
+    """Worker-local value with a TTL and stale-while-revalidate refresh.
+
+    Within ``ttl_seconds`` the cached value is returned as is. For a further
+    ``stale_seconds`` the stale value is still returned while a background
+    thread recomputes it. Past that (or on first use) the value is computed
+    inline. A non-positive TTL disables caching.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _store(self, value):
+        self._value = value
+        self._loaded_at = time.monotonic()
+        return value
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self._store(self._loader())
+            except Exception:
+                logger.exception("Background refresh failed; serving stale value")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, ttl_seconds, stale_seconds=0):
+        if ttl_seconds <= 0:
+            return self._loader()
+
+        loaded_at = self._loaded_at
+        if loaded_at is not None:
+            age = time.monotonic() - loaded_at
+            if age < ttl_seconds:
+                return self._value
+            if age < ttl_seconds + stale_seconds:
+                self._refresh_in_background()
+                return self._value
+
+        with self._lock:
+            loaded_at = self._loaded_at
+            if loaded_at is not None and time.monotonic() - loaded_at < ttl_seconds:
+                return self._value
+            return self._store(self._loader())
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
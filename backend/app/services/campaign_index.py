@@ -0,0 +1,255 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.campaign import Campaign
+from app.services.settings import get_matching_config
+
+TARGETING_DIMENSIONS = ("category", "geo", "device", "placement")
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class IndexedCampaign:
+    id: int
+    buyer_id: int
+    status: str
+    budget_total: Decimal
+    budget_spent: Decimal
+    buyer_cpc: Decimal
+    partner_payout: Decimal
+    targeting_category: str | None
+    targeting_geo: str | None
+    targeting_device: str | None
+    targeting_placement: str | None
+    start_date: date | None
+    end_date: date | None
+
+    @property
+    def budget_remaining(self):
+        return (self.budget_total or 0) - (self.budget_spent or 0)
+
+    @property
+    def max_cpc(self):
+        return self.buyer_cpc
+
+
+@dataclass(frozen=True)
+class IndexedAd:
+    id: int
+    campaign_id: int
+    title: str
+    body: str
+    image_url: str
+    destination_url: str
+
+
+def current_version():
+    return _version
+
+
+def mark_campaigns_changed():
+    """Invalidate every worker-local index built before this call."""
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def flag_campaigns_changed(session):
+    """Invalidate indexes once ``session`` commits; for Core writes the flush hook misses."""
+    session.info["campaign_index_dirty"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_campaign_changes(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Campaign, Ad)):
+            flag_campaigns_changed(session)
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_version_on_commit(session):
+    if session.info.pop("campaign_index_dirty", False):
+        mark_campaigns_changed()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_changes(session):
+    session.info.pop("campaign_index_dirty", None)
+
+
+class CampaignIndex:
+    """Eligible campaigns with posting lists per targeting value.
+
+    A campaign is listed under its targeting value for each dimension, or under
+    the wildcard set when it does not target that dimension. Only campaigns
+    that are active, within budget, inside their date window and have at least
+    one active ad are indexed.
+    """
+
+    def __init__(self, campaigns, ads, built_for, version):
+        self.campaigns = {campaign.id: campaign for campaign in campaigns}
+        self.ads = {ad.campaign_id: ad for ad in ads}
+        self.built_for = built_for
+        self.version = version
+        self.built_at = time.monotonic()
+        self._all_ids = frozenset(self.campaigns) & frozenset(self.ads)
+        self._postings = {dimension: {} for dimension in TARGETING_DIMENSIONS}
+        self._wildcards = {dimension: set() for dimension in TARGETING_DIMENSIONS}
+
+        for campaign_id in self._all_ids:
+            campaign = self.campaigns[campaign_id]
+            for dimension in TARGETING_DIMENSIONS:
+                value = getattr(campaign, f"targeting_{dimension}")
+                if value is None:
+                    self._wildcards[dimension].add(campaign_id)
+                else:
+                    self._postings[dimension].setdefault(value, set()).add(campaign_id)
+
+    def __len__(self):
+        return len(self._all_ids)
+
+    def candidate_ids(self, category=None, geo=None, device=None, placement=None):
+        requested = {
+            "category": category,
+            "geo": geo,
+            "device": device,
+            "placement": placement,
+        }
+        ids = set(self._all_ids)
+        for dimension, value in requested.items():
+            if not value:
+                continue
+            matching = self._postings[dimension].get(value, set())
+            ids &= matching | self._wildcards[dimension]
+            if not ids:
+                break
+        return sorted(ids)
+
+    def candidates(self, category=None, geo=None, device=None, placement=None):
+        return [
+            (self.campaigns[campaign_id], self.ads[campaign_id])
+            for campaign_id in self.candidate_ids(category, geo, device, placement)
+        ]
+
+
+def _load_index(today, version):
+    campaign_rows = (
+        db.session.query(
+            Campaign.id,
+            Campaign.buyer_id,
+            Campaign.status,
+            Campaign.budget_total,
+            Campaign.budget_spent,
+            Campaign.buyer_cpc,
+            Campaign.partner_payout,
+            Campaign.targeting_category,
+            Campaign.targeting_geo,
+            Campaign.targeting_device,
+            Campaign.targeting_placement,
+            Campaign.start_date,
+            Campaign.end_date,
+        )
+        .filter(Campaign.status == "active")
+        .filter(Campaign.budget_spent + Campaign.buyer_cpc <= Campaign.budget_total)
+        .filter(or_(Campaign.start_date.is_(None), Campaign.start_date <= today))
+        .filter(or_(Campaign.end_date.is_(None), Campaign.end_date >= today))
+        .all()
+    )
+
+    first_ad_ids = (
+        db.session.query(func.min(Ad.id))
+        .join(Campaign, Ad.campaign_id == Campaign.id)
+        .filter(Campaign.status == "active")
+        .filter(Ad.active.is_(True))
+        .group_by(Ad.campaign_id)
+    )
+    ad_rows = (
+        db.session.query(
+            Ad.id,
+            Ad.campaign_id,
+            Ad.title,
+            Ad.body,
+            Ad.image_url,
+            Ad.destination_url,
+        )
+        .filter(Ad.id.in_(first_ad_ids))
+        .all()
+    )
+
+    return CampaignIndex(
+        [IndexedCampaign(**row._asdict()) for row in campaign_rows],
+        [IndexedAd(**row._asdict()) for row in ad_rows],
+        built_for=today,
+        version=version,
+    )
+
+
+def affordable_campaign_ids(campaign_ids):
+    """The ``campaign_ids`` whose campaign row is active and can pay for a click now.
+
+    The same budget condition the index is built with, read live, for callers
+    that cannot serve a campaign other workers exhausted since the last build.
+    """
+    if not campaign_ids:
+        return set()
+    rows = (
+        db.session.query(Campaign.id)
+        .filter(Campaign.id.in_(campaign_ids))
+        .filter(Campaign.status == "active")
+        .filter(Campaign.budget_spent + Campaign.buyer_cpc <= Campaign.budget_total)
+        .all()
+    )
+    return {row.id for row in rows}
+
+
+class CampaignIndexCache:
+    """Worker-local holder that rebuilds the index when it goes stale.
+
+    The index is rebuilt when a local commit touched campaigns or ads, when the
+    UTC day rolls over, or after ``ttl_seconds`` so changes committed by other
+    workers are picked up.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, index, today, ttl_seconds):
+        if index is None:
+            return False
+        if index.version != current_version() or index.built_for != today:
+            return False
+        return time.monotonic() - index.built_at < ttl_seconds
+
+    def get(self, ttl_seconds):
+        today = datetime.utcnow().date()
+        index = self._index
+        if self._is_fresh(index, today, ttl_seconds):
+            return index
+        with self._lock:
+            index = self._index
+            if not self._is_fresh(index, today, ttl_seconds):
+                index = _load_index(today, current_version())
+                self._index = index
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+def get_campaign_index():
+    cache = current_app.extensions.setdefault("campaign_index", CampaignIndexCache())
+    return cache.get(get_matching_config().campaign_index_ttl_seconds)
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from flask import current_app
+
+from app.services.frequency_cap import LocalKeyValueClient, get_kv_client
+
+DEDUP_BACKENDS = ("database", "memory", "kv")
+DEDUP_WINDOWS = {
+    "click": ("CLICK_DUPLICATE_WINDOW_SECONDS", 10),
+    "impression": ("IMPRESSION_DEDUP_WINDOW_SECONDS", 60),
+}
+
+
+class MemoryDedupStore:
+    """In-process TTL set of recently seen keys.
+
+    Keys are kept in last-seen order, so expired ones are dropped from the
+    front on every write. Keys still inside their window are never dropped:
+    once ``max_entries`` live keys are held, new keys are not stored and
+    their misses fall through to the event-table query.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._seen_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen_at)
+
+    def _mark(self, key, now, window_seconds):
+        seen_at = self._seen_at
+        cutoff = now - window_seconds
+        while seen_at and next(iter(seen_at.values())) < cutoff:
+            seen_at.popitem(last=False)
+        last_seen = seen_at.get(key)
+        if last_seen is not None or len(seen_at) < self.max_entries:
+            seen_at[key] = now
+            seen_at.move_to_end(key)
+        return last_seen
+
+    def check_and_mark(self, key, window_seconds):
+        with self._lock:
+            return self._mark(key, time.monotonic(), window_seconds) is not None
+
+    def mark(self, key, window_seconds):
+        with self._lock:
+            self._mark(key, time.monotonic(), window_seconds)
+
+
+class KeyValueDedupStore:
+    """Seen keys as expiring entries in a key-value store.
+
+    ``shared`` follows the client: true for a Redis client every worker talks
+    to, false for the :class:`LocalKeyValueClient` stand-in.
+    """
+
+    def __init__(self, client=None, prefix="dedup"):
+        self.client = client if client is not None else LocalKeyValueClient()
+        self.prefix = prefix
+
+    @property
+    def shared(self):
+        return getattr(self.client, "shared", True)
+
+    def _name(self, key):
+        return f"{self.prefix}:" + ":".join(str(part) for part in key)
+
+    def check_and_mark(self, key, window_seconds):
+        name = self._name(key)
+        ttl = max(1, math.ceil(window_seconds))
+        if self.client.set(name, "1", ex=ttl, nx=True):
+            return False
+        # Each hit restarts the window, matching the event-table query.
+        self.client.set(name, "1", ex=ttl)
+        return True
+
+    def mark(self, key, window_seconds):
+        self.client.set(self._name(key), "1", ex=max(1, math.ceil(window_seconds)))
+
+
+class DedupWindow:
+    """Answers "was this key seen within the window?" and records the hit.
+
+    A hit in the store is a duplicate without touching the database. A miss
+    is confirmed with ``fallback`` (the event-table query) unless the store is
+    shared by every worker and one full window has passed since this worker
+    started; a per-worker store cannot see hits handled by other workers or
+    replicas, nor ones from before startup.
+    """
+
+    def __init__(self, store, window_seconds):
+        self.store = store
+        self.window_seconds = window_seconds
+        self._started_at = time.monotonic()
+
+    @property
+    def warm(self):
+        return time.monotonic() - self._started_at >= self.window_seconds
+
+    def is_duplicate(self, key, fallback):
+        if self.window_seconds <= 0:
+            return False
+        if self.store.check_and_mark(key, self.window_seconds):
+            return True
+        if self.store.shared and self.warm:
+            return False
+        return bool(fallback())
+
+    def mark(self, key):
+        """Record a hit that was decided without :meth:`is_duplicate`."""
+        if self.window_seconds > 0:
+            self.store.mark(key, self.window_seconds)
+
+
+def _build_store(backend, kind):
+    if backend == "memory":
+        return MemoryDedupStore(
+            max_entries=int(current_app.config.get("DEDUP_MEMORY_MAX_ENTRIES", 100_000))
+        )
+    if backend == "kv":
+        return KeyValueDedupStore(client=get_kv_client(), prefix=f"dedup:{kind}")
+    raise ValueError(f"Unknown dedup backend: {backend!r}")
+
+
+def get_dedup_window(kind):
+    """The worker's dedup window for ``kind``, or ``None`` for the database backend."""
+    backend = current_app.config.get("DEDUP_BACKEND", "database")
+    if backend == "database":
+        return None
+    windows = current_app.extensions.setdefault("dedup_windows", {})
+    window = windows.get((backend, kind))
+    if window is None:
+        config_key, default = DEDUP_WINDOWS[kind]
+        window = windows.setdefault(
+            (backend, kind),
+            DedupWindow(
+                _build_store(backend, kind),
+                float(current_app.config.get(config_key, default)),
+            ),
+        )
+    return window
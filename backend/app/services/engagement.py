@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.click_event import ClickEvent
+from app.models.engagement_counter import EngagementCounter
+from app.models.impression_event import ImpressionEvent
+from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.services.upsert import increment_counters
+
+COUNTER_COLUMNS = (
+    "impressions",
+    "accepted_clicks",
+    "rejected_clicks",
+    "filled_requests",
+    "unfilled_requests",
+)
+
+
+def hour_start(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _counter_row(ts, partner_id, campaign_id, ad_id, column):
+    return {
+        "hour": hour_start(ts or datetime.utcnow()),
+        "partner_id": partner_id or 0,
+        "campaign_id": campaign_id or 0,
+        "ad_id": ad_id or 0,
+        column: 1,
+    }
+
+
+def click_counter_row(click):
+    if click["status"] not in ("ACCEPTED", "REJECTED"):
+        return None
+    column = "accepted_clicks" if click["status"] == "ACCEPTED" else "rejected_clicks"
+    return _counter_row(
+        click.get("ts"), click.get("partner_id"), click.get("campaign_id"), click.get("ad_id"), column
+    )
+
+
+def impression_counter_row(impression):
+    # Deduped impressions never count toward CTR, so they are not tallied.
+    if impression["status"] != "ACCEPTED":
+        return None
+    return _counter_row(
+        impression.get("ts"),
+        impression.get("partner_id"),
+        impression.get("campaign_id"),
+        impression.get("ad_id"),
+        "impressions",
+    )
+
+
+def request_counter_row(request_event):
+    column = "filled_requests" if request_event.get("filled") else "unfilled_requests"
+    return _counter_row(
+        request_event.get("created_at"),
+        request_event.get("partner_id"),
+        request_event.get("campaign_id"),
+        request_event.get("ad_id"),
+        column,
+    )
+
+
+_ROW_BUILDERS = {
+    ClickEvent: click_counter_row,
+    ImpressionEvent: impression_counter_row,
+    PartnerAdRequestEvent: request_counter_row,
+}
+
+
+def record_engagement(model, events, connection=None):
+    """Fold event dicts of ``model`` into the hourly engagement counters.
+
+    Models without counters are ignored.
+    """
+    builder = _ROW_BUILDERS.get(model)
+    if builder is None:
+        return
+    rows = [row for row in (builder(event_row) for event_row in events) if row]
+    increment_counters(
+        EngagementCounter.__table__,
+        ("hour", "partner_id", "campaign_id", "ad_id"),
+        COUNTER_COLUMNS,
+        rows,
+        connection=connection,
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_events(session, flush_context):
+    pending = {model: [] for model in _ROW_BUILDERS}
+    for instance in session.new:
+        model = type(instance)
+        if model in pending:
+            # Only attributes set in Python; server defaults (timestamps) are
+            # not loaded yet and fall back to the current hour.
+            pending[model].append(dict(instance.__dict__))
+    for model, events in pending.items():
+        if events:
+            record_engagement(model, events, connection=session.connection())
@@ -0,0 +1,270 @@
+import atexit
+import logging
+import threading
+import time
+
+from flask import current_app
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models.click_event import ClickEvent
+from app.services.engagement import record_engagement
+from app.services.partner_quality import record_click_decisions
+
+logger = logging.getLogger(__name__)
+
+BUFFER_DEPTH = Gauge(
+    "event_buffer_pending_rows",
+    "Event rows waiting for the next write-behind flush",
+)
+FLUSH_TIME = Histogram(
+    "event_buffer_flush_seconds",
+    "Time spent writing one write-behind batch",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+_buffer_lock = threading.Lock()
+
+
+class EventBuffer:
+    """Per-worker write-behind queue for append-only event rows.
+
+    Rows are plain column dicts keyed by model. A background thread writes
+    them with one multi-row INSERT per model (plus the matching counter
+    upserts) once ``max_rows`` are pending or the oldest row is
+    ``max_delay_ms`` old. Failed batches are put back, up to
+    ``max_pending`` rows; anything beyond that is dropped and counted.
+    :meth:`close` flushes what is left and runs at interpreter exit.
+
+    The newest ``ts`` per ``(assignment_code, ip_hash)`` of rows not yet
+    committed is indexed as they are queued, taken for a flush and put back,
+    so read-your-writes checks are a dict lookup however deep the queue is.
+    """
+
+    def __init__(self, engine, max_rows=500, max_delay_ms=200, max_pending=10_000):
+        self.engine = engine
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max_pending
+        self._pending = {}
+        self._latest = {}
+        self._inflight = {}
+        self._depth = 0
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def __len__(self):
+        return self._depth
+
+    def add(self, model, row):
+        self.add_many(model, [row])
+
+    def add_many(self, model, rows):
+        if not rows:
+            return
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("event buffer is closed")
+            self._pending.setdefault(model, []).extend(rows)
+            _index_rows(self._latest, model, rows)
+            self._depth += len(rows)
+            self.enqueued += len(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            BUFFER_DEPTH.set(self._depth)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-buffer", daemon=True
+                )
+                self._thread.start()
+            if self._depth >= self.max_rows:
+                self._condition.notify()
+
+    def latest_pending_ts(self, model, assignment_code, ip_hash):
+        """Newest ``ts`` of uncommitted ``model`` rows for the pair, or ``None``."""
+        key = (assignment_code, ip_hash)
+        with self._condition:
+            found = [
+                index[model][key]
+                for index in (self._latest, self._inflight)
+                if key in index.get(model, ())
+            ]
+        return max(found) if found else None
+
+    def _due(self):
+        if not self._depth:
+            return False
+        return (
+            self._depth >= self.max_rows
+            or time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(0.0, self._oldest + self.max_delay - time.monotonic())
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _take(self):
+        with self._condition:
+            batch = self._pending
+            self._pending = {}
+            # Rows being written stay visible until their transaction commits.
+            self._inflight = self._latest
+            self._latest = {}
+            self._depth = 0
+            self._oldest = None
+            BUFFER_DEPTH.set(0)
+            return batch
+
+    def _requeue(self, batch):
+        with self._condition:
+            room = self.max_pending - self._depth
+            for model, rows in batch.items():
+                kept = rows[: max(room, 0)]
+                room -= len(kept)
+                self.dropped += len(rows) - len(kept)
+                if kept:
+                    self._pending[model] = kept + self._pending.get(model, [])
+                    _index_rows(self._latest, model, kept)
+                    self._depth += len(kept)
+            self._inflight = {}
+            if self._depth and self._oldest is None:
+                self._oldest = time.monotonic()
+            BUFFER_DEPTH.set(self._depth)
+
+    def flush(self):
+        """Write every pending row now; returns the number of rows written."""
+        with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                with self.engine.begin() as connection:
+                    for model, rows in batch.items():
+                        _write_rows(connection, model, rows)
+            except Exception:
+                self.failures += 1
+                logger.exception("Event buffer flush failed; requeueing batch")
+                self._requeue(batch)
+                return 0
+            with self._condition:
+                self._inflight = {}
+            elapsed = time.perf_counter() - started
+            FLUSH_TIME.observe(elapsed)
+            written = sum(len(rows) for rows in batch.values())
+            self.flushes += 1
+            self.flushed += written
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return written
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {
+            "pending": self._depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+            "max_rows": self.max_rows,
+            "max_delay_ms": round(self.max_delay * 1000, 3),
+        }
+
+
+def _index_rows(index, model, rows):
+    latest = index.setdefault(model, {})
+    for row in rows:
+        ts = row.get("ts")
+        if ts is None or row.get("assignment_code") is None:
+            continue
+        key = (row["assignment_code"], row.get("ip_hash"))
+        if key not in latest or ts > latest[key]:
+            latest[key] = ts
+
+
+def _write_rows(connection, model, rows):
+    # executemany needs every row to bind the same columns.
+    by_columns = {}
+    for row in rows:
+        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for group in by_columns.values():
+        connection.execute(insert(model), group)
+    # Core inserts bypass the flush hooks, so counters are folded in here.
+    record_engagement(model, rows, connection=connection)
+    if model is ClickEvent:
+        record_click_decisions(
+            [(row.get("partner_id"), row["status"], row.get("ts")) for row in rows],
+            connection=connection,
+        )
+
+
+def _enabled():
+    return str(current_app.config.get("EVENT_BUFFER_ENABLED", "0")).lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+
+def get_event_buffer():
+    """The worker's event buffer, or ``None`` when write-behind is disabled."""
+    if not _enabled():
+        return None
+    event_buffer = current_app.extensions.get("event_buffer")
+    if event_buffer is not None:
+        return event_buffer
+    with _buffer_lock:
+        event_buffer = current_app.extensions.get("event_buffer")
+        if event_buffer is None:
+            config = current_app.config
+            event_buffer = EventBuffer(
+                db.engine,
+                max_rows=int(config.get("EVENT_BUFFER_MAX_ROWS", 500)),
+                max_delay_ms=float(config.get("EVENT_BUFFER_FLUSH_MS", 200)),
+                max_pending=int(config.get("EVENT_BUFFER_MAX_PENDING", 10_000)),
+            )
+            atexit.register(event_buffer.close)
+            current_app.extensions["event_buffer"] = event_buffer
+        return event_buffer
+
+
+def record_events(model, rows):
+    """Queue ``rows`` behind the buffer, or add them to the session when disabled.
+
+    Rows must set their own timestamps; buffered rows are written after the
+    request has finished, so server defaults would record the flush time.
+    """
+    event_buffer = get_event_buffer()
+    if event_buffer is not None:
+        event_buffer.add_many(model, rows)
+        return
+    db.session.add_all([model(**row) for row in rows])
@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import math
+import threading
+import time
+
+from flask import current_app
+
+from app.extensions import db
+from app.models.partner_ad_exposure import PartnerAdExposure
+from app.services.upsert import dialect_insert
+
+FREQUENCY_CAP_BACKENDS = ("database", "memory", "kv")
+
+
+class MemoryFrequencyCapStore:
+    """In-process TTL map of (partner_id, ad_id) -> last serve time.
+
+    Entries are kept in serve order, so expired ones are dropped from the
+    front on every write. ``max_entries`` bounds the map even when the cap
+    window is long. Caps are only enforced within the worker that served.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._served_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._served_at)
+
+    def capped_ad_ids(self, partner_id, ad_ids, cap_seconds):
+        if not cap_seconds:
+            return set()
+        cutoff = time.monotonic() - cap_seconds
+        served_at = self._served_at
+        capped = set()
+        for ad_id in ad_ids:
+            last_served = served_at.get((partner_id, ad_id))
+            if last_served is not None and last_served >= cutoff:
+                capped.add(ad_id)
+        return capped
+
+    def mark_served(self, partner_id, ad_id, cap_seconds):
+        self.mark_served_many(partner_id, [ad_id], cap_seconds)
+
+    def mark_served_many(self, partner_id, ad_ids, cap_seconds):
+        if not cap_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for ad_id in ad_ids:
+                key = (partner_id, ad_id)
+                self._served_at[key] = now
+                self._served_at.move_to_end(key)
+            self._evict(now - cap_seconds)
+
+    def _evict(self, cutoff):
+        served_at = self._served_at
+        while served_at:
+            last_served = next(iter(served_at.values()))
+            if last_served >= cutoff and len(served_at) <= self.max_entries:
+                break
+            served_at.popitem(last=False)
+
+    def purge_expired(self, cap_seconds):
+        with self._lock:
+            before = len(self._served_at)
+            self._evict(time.monotonic() - cap_seconds)
+            return before - len(self._served_at)
+
+
+class DatabaseFrequencyCapStore:
+    """Shared cap state in ``partner_ad_exposures``.
+
+    Marks are upserted in the caller's transaction. Rows older than the cap
+    window are deleted at most every ``purge_interval_seconds`` per worker so
+    the table only holds live exposures (it is UNLOGGED on Postgres).
+    """
+
+    def __init__(self, purge_interval_seconds=300):
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_purge = time.monotonic()
+
+    def capped_ad_ids(self, partner_id, ad_ids, cap_seconds):
+        if not cap_seconds or not ad_ids:
+            return set()
+        cutoff = datetime.utcnow() - timedelta(seconds=cap_seconds)
+        rows = (
+            db.session.query(PartnerAdExposure.ad_id)
+            .filter(PartnerAdExposure.partner_id == partner_id)
+            .filter(PartnerAdExposure.ad_id.in_(ad_ids))
+            .filter(PartnerAdExposure.last_served_at >= cutoff)
+            .all()
+        )
+        return {row.ad_id for row in rows}
+
+    def mark_served(self, partner_id, ad_id, cap_seconds):
+        self.mark_served_many(partner_id, [ad_id], cap_seconds)
+
+    def mark_served_many(self, partner_id, ad_ids, cap_seconds):
+        ad_ids = sorted(set(ad_ids))
+        if not cap_seconds or not ad_ids:
+            return
+        table = PartnerAdExposure.__table__
+        served_at = datetime.utcnow()
+        stmt = dialect_insert(table).values(
+            [
+                {"partner_id": partner_id, "ad_id": ad_id, "last_served_at": served_at}
+                for ad_id in ad_ids
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.partner_id, table.c.ad_id],
+            set_={"last_served_at": stmt.excluded.last_served_at},
+        )
+        db.session.execute(stmt)
+
+        if time.monotonic() - self._last_purge >= self.purge_interval_seconds:
+            self._last_purge = time.monotonic()
+            self.purge_expired(cap_seconds)
+
+    def purge_expired(self, cap_seconds):
+        cutoff = datetime.utcnow() - timedelta(seconds=cap_seconds)
+        return (
+            db.session.query(PartnerAdExposure)
+            .filter(PartnerAdExposure.last_served_at < cutoff)
+            .delete(synchronize_session=False)
+        )
+
+
+class LocalKeyValueClient:
+    """Single-process stand-in for a shared key-value store.
+
+    Implements the ``mget`` / ``set(..., ex=..., nx=...)`` subset used by
+    :class:`KeyValueFrequencyCapStore` and the dedup windows, with per-key
+    expiry, so a Redis-style client can be swapped in without touching callers.
+    Its data is private to the process, so ``shared`` is false.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def mget(self, keys):
+        now = time.monotonic()
+        values = []
+        for key in keys:
+            entry = self._values.get(key)
+            if entry is None or entry[1] <= now:
+                values.append(None)
+            else:
+                values.append(entry[0])
+        return values
+
+    def set(self, key, value, ex=None, nx=False):
+        now = time.monotonic()
+        expires_at = now + ex if ex is not None else math.inf
+        with self._lock:
+            if nx:
+                entry = self._values.get(key)
+                if entry is not None and entry[1] > now:
+                    return None
+            self._values[key] = (value, expires_at)
+            if len(self._values) % 1024 == 0:
+                self._values = {
+                    key: entry for key, entry in self._values.items() if entry[1] > now
+                }
+        return True
+
+
+class KeyValueFrequencyCapStore:
+    """Cap state as expiring keys in a key-value store, one key per partner/ad."""
+
+    def __init__(self, client=None, prefix="fcap"):
+        self.client = client if client is not None else LocalKeyValueClient()
+        self.prefix = prefix
+
+    def _key(self, partner_id, ad_id):
+        return f"{self.prefix}:{partner_id}:{ad_id}"
+
+    def capped_ad_ids(self, partner_id, ad_ids, cap_seconds):
+        if not cap_seconds or not ad_ids:
+            return set()
+        ad_ids = list(ad_ids)
+        values = self.client.mget([self._key(partner_id, ad_id) for ad_id in ad_ids])
+        return {ad_id for ad_id, value in zip(ad_ids, values) if value is not None}
+
+    def mark_served(self, partner_id, ad_id, cap_seconds):
+        self.mark_served_many(partner_id, [ad_id], cap_seconds)
+
+    def mark_served_many(self, partner_id, ad_ids, cap_seconds):
+        if not cap_seconds:
+            return
+        for ad_id in ad_ids:
+            self.client.set(
+                self._key(partner_id, ad_id), "1", ex=max(1, math.ceil(cap_seconds))
+            )
+
+
+def get_kv_client():
+    """The worker's key-value client for the ``kv`` backends.
+
+    A Redis client for ``KV_STORE_URL`` when it is set (requires the ``redis``
+    package), shared by every worker and replica; otherwise a
+    :class:`LocalKeyValueClient` private to this process.
+    """
+    client = current_app.extensions.get("kv_client")
+    if client is None:
+        url = current_app.config.get("KV_STORE_URL")
+        if url:
+            try:
+                import redis
+            except ImportError as exc:
+                raise RuntimeError("KV_STORE_URL requires the redis package") from exc
+            client = redis.Redis.from_url(url)
+        else:
+            client = LocalKeyValueClient()
+        client = current_app.extensions.setdefault("kv_client", client)
+    return client
+
+
+def _build_store(backend):
+    if backend == "database":
+        return DatabaseFrequencyCapStore(
+            purge_interval_seconds=float(
+                current_app.config.get("FREQ_CAP_PURGE_INTERVAL_SECONDS", 300)
+            )
+        )
+    if backend == "memory":
+        return MemoryFrequencyCapStore(
+            max_entries=int(current_app.config.get("FREQ_CAP_MEMORY_MAX_ENTRIES", 100_000))
+        )
+    if backend == "kv":
+        return KeyValueFrequencyCapStore(client=get_kv_client())
+    raise ValueError(f"Unknown frequency cap backend: {backend!r}")
+
+
+def get_frequency_cap_store():
+    backend = current_app.config.get("FREQ_CAP_BACKEND", "database")
+    stores = current_app.extensions.setdefault("frequency_cap_stores", {})
+    store = stores.get(backend)
+    if store is None:
+        store = stores.setdefault(backend, _build_store(backend))
+    return store
@@ -0,0 +1,227 @@
+from array import array
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+
+from app.config import HEAVY_HITTER_DIMENSIONS
+from app.services.settings import get_matching_config
+
+
+def _hash_pair(key):
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class CountMinSketch:
+    """Fixed-size frequency estimates for an unbounded key space.
+
+    ``depth`` rows of ``width`` counters; a key's estimate is the smallest of
+    its counters, so it never undercounts and overcounts by at most
+    ``e / width`` of the total with probability ``1 - e^-depth``. Updates are
+    conservative: only counters at the current minimum are raised.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    @property
+    def size_bytes(self):
+        return sum(row.itemsize * len(row) for row in self._rows)
+
+    @property
+    def error_bound(self):
+        return math.e / self.width * self.total
+
+    def _cells(self, key):
+        first, step = _hash_pair(key)
+        width = self.width
+        return [(first + row * step) % width for row in range(self.depth)]
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(key)))
+
+    def add(self, key, count=1):
+        cells = self._cells(key)
+        rows = self._rows
+        estimate = min(row[cell] for row, cell in zip(rows, cells)) + count
+        for row, cell in zip(rows, cells):
+            if row[cell] < estimate:
+                row[cell] = estimate
+        self.total += count
+        return estimate
+
+
+class SpaceSaving:
+    """The ``capacity`` keys with the largest counts seen so far.
+
+    A new key only displaces the smallest tracked one when its count is
+    larger, so the tracked set converges on the heavy hitters while staying
+    the same size.
+    """
+
+    def __init__(self, capacity=50):
+        self.capacity = capacity
+        self.counts = {}
+
+    def offer(self, key, count):
+        counts = self.counts
+        if key in counts or len(counts) < self.capacity:
+            counts[key] = count
+            return
+        smallest = min(counts, key=counts.get)
+        if count > counts[smallest]:
+            del counts[smallest]
+            counts[key] = count
+
+
+class HeavyHitterWindow:
+    """Click counts for one dimension over the last ``window_seconds``.
+
+    Two tumbling windows, each a :class:`CountMinSketch` plus a
+    :class:`SpaceSaving` top-k. A key's count is its current-window estimate
+    plus the still-overlapping share of the previous window, the same
+    weighting the click rate limiter uses.
+    """
+
+    def __init__(self, width=2048, depth=4, top_k=50, window_seconds=300):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window_index = None
+        self._current = self._new_window()
+        self._previous = self._new_window()
+
+    def _new_window(self):
+        return CountMinSketch(self.width, self.depth), SpaceSaving(self.top_k)
+
+    def _roll(self, now):
+        window_index = int(now // self.window_seconds)
+        if window_index != self._window_index:
+            if self._window_index is not None and window_index == self._window_index + 1:
+                self._previous = self._current
+            else:
+                self._previous = self._new_window()
+            self._current = self._new_window()
+            self._window_index = window_index
+        elapsed = now - window_index * self.window_seconds
+        return 1.0 - elapsed / self.window_seconds
+
+    @property
+    def size_bytes(self):
+        return self._current[0].size_bytes + self._previous[0].size_bytes
+
+    def add(self, key, now=None):
+        """Count one click for ``key`` and return its windowed estimate."""
+        now = time.time() if now is None else now
+        with self._lock:
+            weight = self._roll(now)
+            sketch, top = self._current
+            current = sketch.add(key)
+            top.offer(key, current)
+            return current + self._previous[0].estimate(key) * weight
+
+    def top(self, limit=10, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            weight = self._roll(now)
+            current_sketch, current_top = self._current
+            previous_sketch, previous_top = self._previous
+            keys = set(current_top.counts) | set(previous_top.counts)
+            estimates = [
+                (key, current_sketch.estimate(key) + previous_sketch.estimate(key) * weight)
+                for key in keys
+            ]
+            total = current_sketch.total + previous_sketch.total * weight
+            error_bound = current_sketch.error_bound + previous_sketch.error_bound * weight
+        estimates.sort(key=lambda item: (-item[1], str(item[0])))
+        return {
+            "total": round(total, 2),
+            "error_bound": round(error_bound, 2),
+            "keys": [
+                {"key": key, "estimate": round(estimate, 2)}
+                for key, estimate in estimates[:limit]
+                if estimate > 0
+            ],
+        }
+
+
+class HeavyHitters:
+    """Per-worker heavy-hitter windows for IP hash, user agent hash and partner.
+
+    Counts are not shared between workers: each sees only the clicks routed
+    to it, so thresholds are scaled down by ``HEAVY_HITTER_WORKERS``.
+    """
+
+    def __init__(self, width=2048, depth=4, top_k=50, window_seconds=300):
+        self.window_seconds = window_seconds
+        self.windows = {
+            dimension: HeavyHitterWindow(width, depth, top_k, window_seconds)
+            for dimension in HEAVY_HITTER_DIMENSIONS
+        }
+
+    @property
+    def size_bytes(self):
+        return sum(window.size_bytes for window in self.windows.values())
+
+    def observe(self, keys, now=None):
+        """Count one click for each ``dimension -> key`` pair (``None`` keys are
+        skipped) and return the windowed estimates.
+        """
+        now = time.time() if now is None else now
+        return {
+            dimension: self.windows[dimension].add(key, now)
+            for dimension, key in keys.items()
+            if key is not None
+        }
+
+    def top(self, dimension, limit=10, now=None):
+        return self.windows[dimension].top(limit, now)
+
+
+def get_heavy_hitters():
+    tracker = current_app.extensions.get("heavy_hitters")
+    if tracker is None:
+        config = current_app.config
+        tracker = current_app.extensions.setdefault(
+            "heavy_hitters",
+            HeavyHitters(
+                width=int(config.get("HEAVY_HITTER_WIDTH", 2048)),
+                depth=int(config.get("HEAVY_HITTER_DEPTH", 4)),
+                top_k=int(config.get("HEAVY_HITTER_TOP_K", 50)),
+                window_seconds=float(config.get("HEAVY_HITTER_WINDOW_SECONDS", 300)),
+            ),
+        )
+    return tracker
+
+
+def heavy_hitter_worker_threshold(config=None):
+    """``HEAVY_HITTER_REJECT_THRESHOLD`` as a share of one worker's counts.
+
+    The threshold is set for the whole deployment; with clicks spread over
+    ``HEAVY_HITTER_WORKERS`` workers, each sees about that fraction of a key's
+    clicks.
+    """
+    config = config or get_matching_config()
+    return config.heavy_hitter_reject_threshold / config.heavy_hitter_workers
+
+
+def is_heavy_hitter(estimates, config=None):
+    """Whether any auto-reject dimension is above this worker's share of
+    ``HEAVY_HITTER_REJECT_THRESHOLD`` (``0`` turns auto-rejection off).
+    """
+    config = config or get_matching_config()
+    threshold = heavy_hitter_worker_threshold(config)
+    if threshold <= 0:
+        return False
+    return any(
+        estimates.get(dimension, 0) > threshold
+        for dimension in config.heavy_hitter_reject_dimensions
+    )
@@ -1,154 +1,165 @@
 from datetime import datetime, timedelta
 
 from flask import current_app, has_app_context
-from sqlalchemy import func
+from sqlalchemy import func, select, true
 
+from app.config import MatchingConfig
 from app.extensions import db
 from app.models.ad import Ad
 from app.models.campaign import Campaign
 from app.models.click_event import ClickEvent
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.services.cached_value import CachedValue
+from app.services.settings import get_matching_config
 
 
-def _get_config(key, default):
+def _matching_config(config):
+    if config is not None:
+        return config
     if has_app_context():
-        return current_app.config.get(key, default)
-    return default
+        return get_matching_config()
+    return MatchingConfig()
 
 
-def build_market_health_snapshot():
-    window_minutes = int(_get_config("MARKET_HEALTH_WINDOW_MINUTES", 60))
-    window_delta = timedelta(minutes=window_minutes)
+def build_market_health_snapshot(config=None):
+    """Compute the market health snapshot in a single aggregate statement."""
+    config = _matching_config(config)
+    streak_sample = config.market_streak_sample
+    window_delta = timedelta(minutes=config.market_window_minutes)
     now = datetime.utcnow()
     cutoff = now - window_delta
     previous_cutoff = cutoff - window_delta
 
-    total_requests = (
-        PartnerAdRequestEvent.query.filter(PartnerAdRequestEvent.created_at >= cutoff).count()
+    request_stats = (
+        select(
+            func.count(PartnerAdRequestEvent.id).label("total_requests"),
+            func.count(PartnerAdRequestEvent.id)
+            .filter(PartnerAdRequestEvent.filled.is_(True))
+            .label("filled_requests"),
+        )
+        .where(PartnerAdRequestEvent.created_at >= cutoff)
+        .subquery()
     )
-    filled_requests = (
-        PartnerAdRequestEvent.query.filter(PartnerAdRequestEvent.created_at >= cutoff)
-        .filter(PartnerAdRequestEvent.filled.is_(True))
-        .count()
-    )
-    fill_rate = filled_requests / total_requests if total_requests else 0
 
-    rejected = (
-        ClickEvent.query.filter(ClickEvent.ts >= cutoff)
-        .filter(ClickEvent.status == "REJECTED")
-        .count()
-    )
-    accepted = (
-        ClickEvent.query.filter(ClickEvent.ts >= cutoff)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .count()
+    current_window = ClickEvent.ts >= cutoff
+    previous_window = ClickEvent.ts < cutoff
+    click_stats = (
+        select(
+            func.count(ClickEvent.id)
+            .filter(current_window, ClickEvent.status == "REJECTED")
+            .label("rejected"),
+            func.count(ClickEvent.id)
+            .filter(current_window, ClickEvent.status == "ACCEPTED")
+            .label("accepted"),
+            func.count(ClickEvent.id)
+            .filter(previous_window, ClickEvent.status == "REJECTED")
+            .label("prev_rejected"),
+            func.count(ClickEvent.id)
+            .filter(previous_window, ClickEvent.status == "ACCEPTED")
+            .label("prev_accepted"),
+        )
+        .where(ClickEvent.ts >= previous_cutoff)
+        .subquery()
     )
-    total_clicks = accepted + rejected
-    reject_rate = rejected / total_clicks if total_clicks else 0
-
-    prev_rejected = (
-        ClickEvent.query.filter(ClickEvent.ts < cutoff)
-        .filter(ClickEvent.ts >= previous_cutoff)
-        .filter(ClickEvent.status == "REJECTED")
-        .count()
+
+    eligible_stats = (
+        select(func.count(Ad.id).label("eligible_ads"))
+        .join(Campaign, Ad.campaign_id == Campaign.id)
+        .where(Ad.active.is_(True))
+        .where(Campaign.status == "active")
+        .where(Campaign.budget_spent + Campaign.buyer_cpc <= Campaign.budget_total)
+        .subquery()
     )
-    prev_accepted = (
-        ClickEvent.query.filter(ClickEvent.ts < cutoff)
-        .filter(ClickEvent.ts >= previous_cutoff)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .count()
+
+    # Unfilled streak: position of the newest filled request among the last N.
+    latest_requests = (
+        select(
+            PartnerAdRequestEvent.id,
+            PartnerAdRequestEvent.created_at,
+            PartnerAdRequestEvent.filled,
+        )
+        .order_by(PartnerAdRequestEvent.created_at.desc(), PartnerAdRequestEvent.id.desc())
+        .limit(streak_sample)
+        .subquery()
     )
-    prev_total = prev_accepted + prev_rejected
-    prev_reject_rate = prev_rejected / prev_total if prev_total else 0
+    ranked_requests = select(
+        latest_requests.c.filled,
+        func.row_number()
+        .over(order_by=(latest_requests.c.created_at.desc(), latest_requests.c.id.desc()))
+        .label("position"),
+    ).subquery()
+    streak_stats = select(
+        func.coalesce(
+            func.min(ranked_requests.c.position).filter(ranked_requests.c.filled.is_(True))
+            - 1,
+            func.count(),
+        ).label("unfilled_streak")
+    ).subquery()
+
+    # Each subquery yields exactly one row, so the cross join is a single row.
+    row = db.session.execute(
+        select(request_stats, click_stats, eligible_stats, streak_stats).select_from(
+            request_stats.join(click_stats, true())
+            .join(eligible_stats, true())
+            .join(streak_stats, true())
+        )
+    ).one()
+
+    total_requests = row.total_requests or 0
+    fill_rate = (row.filled_requests or 0) / total_requests if total_requests else 0
+
+    total_clicks = (row.accepted or 0) + (row.rejected or 0)
+    reject_rate = (row.rejected or 0) / total_clicks if total_clicks else 0
+
+    prev_total = (row.prev_accepted or 0) + (row.prev_rejected or 0)
+    prev_reject_rate = (row.prev_rejected or 0) / prev_total if prev_total else 0
     reject_volatility = abs(reject_rate - prev_reject_rate)
 
-    eligible_ads = (
-        db.session.query(func.count(Ad.id))
-        .join(Campaign, Ad.campaign_id == Campaign.id)
-        .filter(Ad.active.is_(True))
-        .filter(Campaign.status == "active")
-        .filter(Campaign.budget_spent + Campaign.buyer_cpc <= Campaign.budget_total)
-        .scalar()
-        or 0
-    )
+    eligible_ads = row.eligible_ads or 0
     eligible_ads_per_request = (
         eligible_ads / total_requests if total_requests else float(eligible_ads)
     )
 
-    recent_requests = (
-        PartnerAdRequestEvent.query.order_by(PartnerAdRequestEvent.created_at.desc())
-        .limit(int(_get_config("MARKET_HEALTH_STREAK_SAMPLE", 10)))
-        .all()
-    )
-    unfilled_streak = 0
-    for event in recent_requests:
-        if event.filled:
-            break
-        unfilled_streak += 1
-
     return {
         "fill_rate": fill_rate,
         "reject_rate": reject_rate,
         "reject_volatility": reject_volatility,
         "eligible_ads_per_request": eligible_ads_per_request,
-        "unfilled_streak": unfilled_streak,
+        "unfilled_streak": int(row.unfilled_streak or 0),
     }
 
 
-def derive_adaptive_multipliers(snapshot):
+def derive_adaptive_multipliers(snapshot, config=None):
+    config = _matching_config(config)
     alpha_profit = 1.0
     beta_ctr = 1.0
     gamma_targeting = 1.0
     delta_quality = 1.0
     notes = []
 
-    fill_low = float(_get_config("MARKET_HEALTH_FILL_LOW", 0.5))
-    fill_high = float(_get_config("MARKET_HEALTH_FILL_HIGH", 0.8))
-    eligible_low = float(_get_config("MARKET_HEALTH_ELIGIBLE_SUPPLY_LOW", 0.5))
-    volatility_threshold = float(
-        _get_config("MARKET_HEALTH_REJECT_VOLATILITY_THRESHOLD", 0.1)
-    )
-    unfilled_threshold = int(_get_config("MARKET_HEALTH_UNFILLED_STREAK_THRESHOLD", 3))
-    reject_rate_healthy = float(_get_config("MARKET_HEALTH_REJECT_HEALTHY", 0.05))
-
-    profit_boost_low_fill = float(_get_config("ALPHA_PROFIT_BOOST_LOW_FILL", 0.2))
-    ctr_boost_healthy = float(_get_config("BETA_CTR_BOOST_HEALTHY", 0.1))
-    targeting_boost_low_fill = float(
-        _get_config("GAMMA_TARGETING_BOOST_LOW_FILL", 0.1)
-    )
-    targeting_boost_unfilled = float(
-        _get_config("GAMMA_TARGETING_BOOST_UNFILLED", 0.1)
-    )
-    quality_boost_low_fill = float(
-        _get_config("DELTA_QUALITY_BOOST_LOW_FILL", 0.2)
-    )
-    quality_boost_volatility = float(
-        _get_config("DELTA_QUALITY_BOOST_VOLATILITY", 0.1)
-    )
-    profit_boost_low_supply = float(
-        _get_config("ALPHA_PROFIT_BOOST_LOW_SUPPLY", 0.1)
-    )
-
-    if snapshot["fill_rate"] < fill_low:
-        alpha_profit += profit_boost_low_fill
-        gamma_targeting += targeting_boost_low_fill
-        delta_quality += quality_boost_low_fill
+    if snapshot["fill_rate"] < config.market_fill_low:
+        alpha_profit += config.alpha_profit_boost_low_fill
+        gamma_targeting += config.gamma_targeting_boost_low_fill
+        delta_quality += config.delta_quality_boost_low_fill
         notes.append("Tight supply: emphasizing profit, targeting, and quality.")
 
-    if snapshot["fill_rate"] > fill_high and snapshot["reject_rate"] < reject_rate_healthy:
-        beta_ctr += ctr_boost_healthy
+    if (
+        snapshot["fill_rate"] > config.market_fill_high
+        and snapshot["reject_rate"] < config.market_reject_healthy
+    ):
+        beta_ctr += config.beta_ctr_boost_healthy
         notes.append("Healthy demand: modestly emphasizing CTR.")
 
-    if snapshot["eligible_ads_per_request"] < eligible_low:
-        alpha_profit += profit_boost_low_supply
+    if snapshot["eligible_ads_per_request"] < config.market_eligible_supply_low:
+        alpha_profit += config.alpha_profit_boost_low_supply
         notes.append("Low eligible supply: prioritizing profit.")
 
-    if snapshot["unfilled_streak"] >= unfilled_threshold:
-        gamma_targeting += targeting_boost_unfilled
+    if snapshot["unfilled_streak"] >= config.market_unfilled_streak_threshold:
+        gamma_targeting += config.gamma_targeting_boost_unfilled
         notes.append("Recent unfilled streak: boosting targeting match.")
 
-    if snapshot["reject_volatility"] > volatility_threshold:
-        delta_quality += quality_boost_volatility
+    if snapshot["reject_volatility"] > config.market_reject_volatility_threshold:
+        delta_quality += config.delta_quality_boost_volatility
         notes.append("Reject volatility: tightening quality penalty.")
 
     market_note = "Market stable." if not notes else " ".join(notes)
@@ -160,3 +171,18 @@ def derive_adaptive_multipliers(snapshot):
         "delta_quality": round(delta_quality, 4),
         "market_note": market_note,
     }
+
+
+def _load_market_health():
+    config = get_matching_config()
+    snapshot = build_market_health_snapshot(config)
+    return snapshot, derive_adaptive_multipliers(snapshot, config)
+
+
+def get_market_health(config=None):
+    """Return the cached ``(snapshot, multipliers)`` pair for this worker."""
+    config = _matching_config(config)
+    cache = current_app.extensions.setdefault(
+        "market_health", CachedValue(_load_market_health)
+    )
+    return cache.get(config.market_cache_seconds, config.market_stale_seconds)
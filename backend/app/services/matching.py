@@ -1,27 +1,41 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
 import hashlib
 
+import numpy as np
 from sqlalchemy import func, or_
 
 from app.extensions import db
-from app.models.ad import Ad
 from app.models.assignment import AdAssignment
-from app.models.campaign import Campaign
-from app.models.click_event import ClickEvent
-from app.models.impression_event import ImpressionEvent
-from app.models.partner_ad_request_event import PartnerAdRequestEvent
-from app.models.partner_ad_exposure import PartnerAdExposure
-from app.services.market_health import build_market_health_snapshot, derive_adaptive_multipliers
+from app.models.engagement_counter import EngagementCounter
+from app.services.budget import get_exhausted_campaigns
+from app.services.campaign_index import (
+    TARGETING_DIMENSIONS,
+    IndexedAd,
+    IndexedCampaign,
+    affordable_campaign_ids,
+    get_campaign_index,
+)
+from app.services.engagement import hour_start
+from app.services.frequency_cap import get_frequency_cap_store
+from app.services.market_health import get_market_health
 from app.services.partner_quality import partner_quality_state, partner_reject_rate
+from app.services.scoring import (
+    CandidateColumns,
+    CandidateSignals,
+    ScoringWeights,
+    rank_rows,
+    rank_scalar,
+)
+from app.services.settings import get_matching_config
 
 DEFAULT_CTR = 0.01
 
 
 @dataclass
 class MatchResult:
-    ad: Ad | None
-    campaign: Campaign | None
+    ad: IndexedAd | None
+    campaign: IndexedCampaign | None
     explanation: str | None
     score_breakdown: dict
     unfilled_reason: str | None
@@ -38,63 +52,13 @@ def _smoothed_ctr(clicks, impressions):
     return (clicks + 1) / (impressions + 10)
 
 
-def _ctr_counts(query_clicks, query_impressions):
-    clicks = query_clicks.scalar() or 0
-    impressions = query_impressions.scalar() or 0
-    return clicks, impressions
-
-
 def _lookback_cutoff(days):
     return datetime.utcnow() - timedelta(days=days)
 
 
-def _ad_ctr(partner_id, ad_id, days):
-    cutoff = _lookback_cutoff(days)
-    clicks, impressions = _ctr_counts(
-        db.session.query(func.count(ClickEvent.id))
-        .filter(ClickEvent.partner_id == partner_id)
-        .filter(ClickEvent.ad_id == ad_id)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= cutoff),
-        db.session.query(func.count(ImpressionEvent.id))
-        .filter(ImpressionEvent.partner_id == partner_id)
-        .filter(ImpressionEvent.ad_id == ad_id)
-        .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= cutoff),
-    )
-    return clicks, impressions
-
-
-def _campaign_ctr(partner_id, campaign_id, days):
-    cutoff = _lookback_cutoff(days)
-    clicks, impressions = _ctr_counts(
-        db.session.query(func.count(ClickEvent.id))
-        .filter(ClickEvent.partner_id == partner_id)
-        .filter(ClickEvent.campaign_id == campaign_id)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= cutoff),
-        db.session.query(func.count(ImpressionEvent.id))
-        .filter(ImpressionEvent.partner_id == partner_id)
-        .filter(ImpressionEvent.campaign_id == campaign_id)
-        .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= cutoff),
-    )
-    return clicks, impressions
-
-
-def _global_campaign_ctr(campaign_id, days):
-    cutoff = _lookback_cutoff(days)
-    clicks, impressions = _ctr_counts(
-        db.session.query(func.count(ClickEvent.id))
-        .filter(ClickEvent.campaign_id == campaign_id)
-        .filter(ClickEvent.status == "ACCEPTED")
-        .filter(ClickEvent.ts >= cutoff),
-        db.session.query(func.count(ImpressionEvent.id))
-        .filter(ImpressionEvent.campaign_id == campaign_id)
-        .filter(ImpressionEvent.status == "ACCEPTED")
-        .filter(ImpressionEvent.ts >= cutoff),
-    )
-    return clicks, impressions
+def _lookback_hour(days):
+    # Engagement counters are hourly, so windows start at the cutoff's hour.
+    return hour_start(_lookback_cutoff(days))
 
 
 def _deterministic_fraction(seed):
@@ -103,22 +67,17 @@ def _deterministic_fraction(seed):
 
 
 def _partner_request_count(partner_id, days):
-    cutoff = _lookback_cutoff(days)
-    return (
-        PartnerAdRequestEvent.query.filter_by(partner_id=partner_id)
-        .filter(PartnerAdRequestEvent.created_at >= cutoff)
-        .count()
-    )
-
-
-def _partner_ad_serves(partner_id, ad_id, days):
-    cutoff = _lookback_cutoff(days)
+    cutoff = _lookback_hour(days)
     return (
-        PartnerAdRequestEvent.query.filter_by(
-            partner_id=partner_id, ad_id=ad_id, filled=True
+        db.session.query(
+            func.coalesce(
+                func.sum(EngagementCounter.filled_requests + EngagementCounter.unfilled_requests),
+                0,
+            )
         )
-        .filter(PartnerAdRequestEvent.created_at >= cutoff)
-        .count()
+        .filter(EngagementCounter.partner_id == partner_id)
+        .filter(EngagementCounter.hour >= cutoff)
+        .scalar()
     )
 
 
@@ -144,7 +103,8 @@ def _exploration_decision(
 
 def _delivery_boost(
     campaign,
-    lookback_days,
+    request_count,
+    accepted_clicks,
     min_requests,
     low_click_rate,
     min_budget_remaining_ratio,
@@ -159,20 +119,9 @@ def _delivery_boost(
         if budget_remaining_ratio < min_budget_remaining_ratio:
             return 0
 
-    cutoff = _lookback_cutoff(lookback_days)
-    request_count = (
-        PartnerAdRequestEvent.query.filter_by(campaign_id=campaign.id, filled=True)
-        .filter(PartnerAdRequestEvent.created_at >= cutoff)
-        .count()
-    )
     if request_count < min_requests:
         return 0
 
-    accepted_clicks = (
-        ClickEvent.query.filter_by(campaign_id=campaign.id, status="ACCEPTED")
-        .filter(ClickEvent.ts >= cutoff)
-        .count()
-    )
     click_rate = accepted_clicks / request_count if request_count else 0
     if click_rate < low_click_rate:
         return boost_value
@@ -192,164 +141,321 @@ def _targeting_bonus(campaign, category, geo, device, placement, bonus_value):
     return bonus
 
 
-def _exposure_blocked(partner_id, ad_id, freq_cap_seconds):
-    cutoff = datetime.utcnow() - timedelta(seconds=freq_cap_seconds)
-    exposure = (
-        PartnerAdExposure.query.filter_by(partner_id=partner_id, ad_id=ad_id)
-        .filter(PartnerAdExposure.last_served_at >= cutoff)
-        .first()
-    )
-    return exposure is not None
-
-
-def select_ad_for_partner(
+@dataclass
+class CandidateFeatures:
+    """Per-request signals for every candidate, keyed by ad or campaign id."""
+
+    blocked_ad_ids: set
+    ad_clicks: dict
+    ad_impressions: dict
+    campaign_clicks: dict
+    campaign_impressions: dict
+    global_clicks: dict
+    global_impressions: dict
+    ad_serves: dict
+    delivery_requests: dict
+    delivery_clicks: dict
+    assignment_counts: dict
+
+    def ctr_counts(self, campaign_id, ad_id):
+        # Same fallback chain as before: partner+ad, partner+campaign, campaign.
+        clicks = self.ad_clicks.get(ad_id, 0)
+        impressions = self.ad_impressions.get(ad_id, 0)
+        if impressions == 0:
+            clicks = self.campaign_clicks.get(campaign_id, 0)
+            impressions = self.campaign_impressions.get(campaign_id, 0)
+        if impressions == 0:
+            clicks = self.global_clicks.get(campaign_id, 0)
+            impressions = self.global_impressions.get(campaign_id, 0)
+        return clicks, impressions
+
+
+def _sum_into(target, key, value):
+    if key is not None and value:
+        target[key] = target.get(key, 0) + value
+
+
+def load_candidate_features(
     partner_id,
-    category=None,
-    geo=None,
-    device=None,
-    placement=None,
-    freq_cap_seconds=60,
-    ctr_lookback_days=14,
-    reject_lookback_days=7,
-    ctr_weight=1.0,
-    targeting_bonus_value=0.5,
-    reject_penalty_weight=1.0,
-    exploration_rate=0.05,
-    exploration_bonus=0.2,
-    exploration_new_partner_requests=5,
-    exploration_new_ad_serves=1,
-    exploration_max_ad_serves=5,
-    exploration_lookback_days=7,
-    quality_recent_days=1,
-    quality_long_days=7,
-    quality_new_clicks=10,
-    quality_risky_reject_rate=0.2,
-    quality_recover_reject_rate=0.1,
-    quality_delta_new=0.8,
-    quality_delta_stable=1.0,
-    quality_delta_risky=1.5,
-    quality_delta_recovering=1.1,
-    delivery_lookback_days=7,
-    delivery_min_requests=10,
-    delivery_low_click_rate=0.01,
-    delivery_min_budget_remaining_ratio=0.5,
-    delivery_boost_value=0.2,
-    debug=False,
-    debug_limit=3,
+    campaign_ids,
+    ad_ids,
+    freq_cap_seconds,
+    ctr_lookback_days,
+    exploration_lookback_days,
+    delivery_lookback_days,
 ):
-    today = datetime.utcnow().date()
+    """Load every scoring signal for the candidate set in a fixed number of queries.
+
+    Engagement windows come from one pass over the hourly counters, grouped by
+    (campaign_id, ad_id), with FILTER clauses splitting the partner-scoped and
+    global windows.
+    """
+    features = CandidateFeatures(
+        blocked_ad_ids=set(),
+        ad_clicks={},
+        ad_impressions={},
+        campaign_clicks={},
+        campaign_impressions={},
+        global_clicks={},
+        global_impressions={},
+        ad_serves={},
+        delivery_requests={},
+        delivery_clicks={},
+        assignment_counts={},
+    )
+    if not campaign_ids:
+        return features
 
-    campaigns = (
-        Campaign.query.filter(Campaign.status == "active")
-        .filter(Campaign.budget_spent + Campaign.buyer_cpc <= Campaign.budget_total)
-        .filter(or_(Campaign.start_date.is_(None), Campaign.start_date <= today))
-        .filter(or_(Campaign.end_date.is_(None), Campaign.end_date >= today))
+    features.blocked_ad_ids = get_frequency_cap_store().capped_ad_ids(
+        partner_id, ad_ids, freq_cap_seconds
     )
 
-    if category:
-        campaigns = campaigns.filter(
-            or_(Campaign.targeting_category.is_(None), Campaign.targeting_category == category)
+    ctr_cutoff = _lookback_hour(ctr_lookback_days)
+    exploration_cutoff = _lookback_hour(exploration_lookback_days)
+    delivery_cutoff = _lookback_hour(delivery_lookback_days)
+    ad_id_set = set(ad_ids)
+    campaign_id_set = set(campaign_ids)
+
+    counter = EngagementCounter
+    in_ctr_window = counter.hour >= ctr_cutoff
+    for_partner = counter.partner_id == partner_id
+    rows = (
+        db.session.query(
+            counter.campaign_id,
+            counter.ad_id,
+            func.sum(counter.accepted_clicks).filter(in_ctr_window).label("clicks"),
+            func.sum(counter.accepted_clicks)
+            .filter(in_ctr_window, for_partner)
+            .label("partner_clicks"),
+            func.sum(counter.impressions).filter(in_ctr_window).label("impressions"),
+            func.sum(counter.impressions)
+            .filter(in_ctr_window, for_partner)
+            .label("partner_impressions"),
+            func.sum(counter.filled_requests)
+            .filter(counter.hour >= exploration_cutoff, for_partner)
+            .label("partner_serves"),
+            func.sum(counter.filled_requests)
+            .filter(counter.hour >= delivery_cutoff)
+            .label("delivery_requests"),
+            func.sum(counter.accepted_clicks)
+            .filter(counter.hour >= delivery_cutoff)
+            .label("delivery_clicks"),
         )
+        .filter(or_(counter.campaign_id.in_(campaign_ids), counter.ad_id.in_(ad_ids)))
+        .filter(counter.hour >= min(ctr_cutoff, exploration_cutoff, delivery_cutoff))
+        .group_by(counter.campaign_id, counter.ad_id)
+        .all()
+    )
+    for row in rows:
+        if row.ad_id in ad_id_set:
+            _sum_into(features.ad_clicks, row.ad_id, row.partner_clicks)
+            _sum_into(features.ad_impressions, row.ad_id, row.partner_impressions)
+            _sum_into(features.ad_serves, row.ad_id, row.partner_serves)
+        if row.campaign_id in campaign_id_set:
+            _sum_into(features.campaign_clicks, row.campaign_id, row.partner_clicks)
+            _sum_into(features.campaign_impressions, row.campaign_id, row.partner_impressions)
+            _sum_into(features.global_clicks, row.campaign_id, row.clicks)
+            _sum_into(features.global_impressions, row.campaign_id, row.impressions)
+            _sum_into(features.delivery_requests, row.campaign_id, row.delivery_requests)
+            _sum_into(features.delivery_clicks, row.campaign_id, row.delivery_clicks)
+
+    assignment_rows = (
+        db.session.query(AdAssignment.campaign_id, func.count(AdAssignment.id).label("count"))
+        .filter(AdAssignment.partner_id == partner_id)
+        .filter(AdAssignment.campaign_id.in_(campaign_ids))
+        .group_by(AdAssignment.campaign_id)
+        .all()
+    )
+    features.assignment_counts = {row.campaign_id: row.count for row in assignment_rows}
 
-    if geo:
-        campaigns = campaigns.filter(
-            or_(Campaign.targeting_geo.is_(None), Campaign.targeting_geo == geo)
-        )
+    return features
 
-    if device:
-        campaigns = campaigns.filter(
-            or_(Campaign.targeting_device.is_(None), Campaign.targeting_device == device)
-        )
 
-    if placement:
-        campaigns = campaigns.filter(
-            or_(Campaign.targeting_placement.is_(None), Campaign.targeting_placement == placement)
-        )
+@dataclass(frozen=True)
+class AdSlot:
+    category: str | None = None
+    geo: str | None = None
+    device: str | None = None
+    placement: str | None = None
 
+
+def _eligible_for_slots(index, slots):
+    """Return per-slot eligible campaign ids and the shared (campaign, ad) set."""
+    slot_campaign_ids = []
+    shared = {}
+    for slot in slots:
+        campaign_ids = index.candidate_ids(
+            category=slot.category, geo=slot.geo, device=slot.device, placement=slot.placement
+        )
+        slot_campaign_ids.append(campaign_ids)
+        for campaign_id in campaign_ids:
+            if campaign_id not in shared:
+                shared[campaign_id] = (index.campaigns[campaign_id], index.ads[campaign_id])
+    return slot_campaign_ids, [shared[campaign_id] for campaign_id in sorted(shared)]
+
+
+def _rank_affordable(rank, drop):
+    """Call ``rank()`` until its winner can still pay, and return that ranking.
+
+    The index lags spend committed by other workers by up to
+    ``CAMPAIGN_INDEX_TTL_SECONDS``, so each winner's campaign row is checked
+    before it is served. A winner that fails the check is remembered in the
+    worker's exhausted set and removed with ``drop(campaign_id)`` before the
+    rest are ranked again. Returns ``None`` when no candidate can pay.
+    """
+    exhausted = get_exhausted_campaigns()
+    while True:
+        ranked = rank()
+        if not ranked:
+            return None
+        campaign_id = ranked[0].signals.campaign.id
+        if affordable_campaign_ids([campaign_id]):
+            return ranked
+        exhausted.add(campaign_id)
+        drop(campaign_id)
+
+
+def _rank_slot_scalar(weights, base_signals, slot, campaign_ids, skip, limit, config):
+    """Rank one slot's candidates one at a time; returns ``(ranked, blocked_by_cap)``."""
     candidates = []
     blocked_by_cap = 0
+    for campaign_id in campaign_ids:
+        signals = base_signals.get(campaign_id)
+        if signals is None:
+            blocked_by_cap += 1
+            continue
+        if skip(campaign_id):
+            continue
+        candidates.append(
+            replace(
+                signals,
+                targeting_bonus=_targeting_bonus(
+                    signals.campaign,
+                    slot.category,
+                    slot.geo,
+                    slot.device,
+                    slot.placement,
+                    config.targeting_bonus_value,
+                ),
+            )
+        )
+
+    def drop(campaign_id):
+        candidates[:] = [signals for signals in candidates if signals.campaign.id != campaign_id]
+
+    ranked = _rank_affordable(lambda: rank_scalar(weights, candidates, limit), drop)
+    return ranked, blocked_by_cap
 
-    snapshot = build_market_health_snapshot()
-    multipliers = derive_adaptive_multipliers(snapshot)
-    alpha_profit = multipliers["alpha_profit"]
-    beta_ctr = multipliers["beta_ctr"]
-    gamma_targeting = multipliers["gamma_targeting"]
-    market_delta_quality = multipliers["delta_quality"]
-    market_note = multipliers["market_note"]
+
+def _rank_slot_columns(weights, columns, available, slot, campaign_ids, limit, config):
+    """Rank one slot over the request's :class:`CandidateColumns`.
+
+    ``available`` marks rows not yet served or found exhausted in this
+    request; rows dropped here are cleared in it for later slots too.
+    Returns ``(ranked, blocked_by_cap)``.
+    """
+    in_slot = np.isin(columns.campaign_id, campaign_ids)
+    # Every indexed campaign has a row unless its ad is frequency capped.
+    blocked_by_cap = len(campaign_ids) - int(np.count_nonzero(in_slot))
+    rows = in_slot & available
+    bonus = columns.targeting_bonus(
+        {dimension: getattr(slot, dimension) for dimension in TARGETING_DIMENSIONS},
+        config.targeting_bonus_value,
+    )
+
+    def drop(campaign_id):
+        dropped = columns.campaign_id == campaign_id
+        rows[dropped] = False
+        available[dropped] = False
+
+    ranked = _rank_affordable(
+        lambda: rank_rows(weights, columns, np.flatnonzero(rows), bonus, limit), drop
+    )
+    return ranked, blocked_by_cap
+
+
+def select_ads_for_slots(partner_id, slots, config=None):
+    """Pick one ad per slot, never repeating a campaign within the request.
+
+    Partner-level signals (market multipliers, quality state, reject rate) and
+    candidate features are loaded once for the union of eligible campaigns;
+    only the targeting bonus is computed per slot. Slots are filled in order,
+    so earlier slots get first pick. ``config`` defaults to the app's current
+    :class:`~app.config.MatchingConfig`.
+    """
+    if config is None:
+        config = get_matching_config()
+    index = get_campaign_index()
+    slot_campaign_ids, eligible = _eligible_for_slots(index, slots)
+
+    _, multipliers = get_market_health(config)
 
     quality = partner_quality_state(
         partner_id=partner_id,
-        recent_days=quality_recent_days,
-        long_days=quality_long_days,
-        new_clicks_threshold=quality_new_clicks,
-        risky_reject_rate=quality_risky_reject_rate,
-        recovering_reject_rate=quality_recover_reject_rate,
-        delta_multipliers={
-            "NEW": quality_delta_new,
-            "STABLE": quality_delta_stable,
-            "RISKY": quality_delta_risky,
-            "RECOVERING": quality_delta_recovering,
-        },
+        recent_days=config.quality_recent_days,
+        long_days=config.quality_long_days,
+        new_clicks_threshold=config.quality_new_clicks,
+        risky_reject_rate=config.quality_risky_reject_rate,
+        recovering_reject_rate=config.quality_recover_reject_rate,
+        delta_multipliers=config.quality_delta_multipliers,
     )
-    partner_quality_state_value = quality["state"]
-    partner_quality_note = quality["note"]
-    partner_quality_multiplier = quality["delta_multiplier"]
-    delta_quality = market_delta_quality * partner_quality_multiplier
-
-    # Partner-level quality signal based on recent click decision events (accepted/rejected).
-    partner_reject_rate_value = partner_reject_rate(partner_id, reject_lookback_days)
-
-    partner_request_count = _partner_request_count(partner_id, exploration_lookback_days)
-    is_new_partner = partner_request_count < exploration_new_partner_requests
-
-    for campaign in campaigns.order_by(Campaign.id.asc()).all():
-        ad = (
-            Ad.query.filter_by(campaign_id=campaign.id, active=True)
-            .order_by(Ad.id.asc())
-            .first()
-        )
-        if not ad:
-            continue
 
-        if freq_cap_seconds and _exposure_blocked(partner_id, ad.id, freq_cap_seconds):
-            blocked_by_cap += 1
+    weights = ScoringWeights(
+        alpha_profit=multipliers["alpha_profit"],
+        beta_ctr=multipliers["beta_ctr"],
+        gamma_targeting=multipliers["gamma_targeting"],
+        ctr_weight=config.ctr_weight,
+        delta_quality=multipliers["delta_quality"] * quality["delta_multiplier"],
+        # Partner-level quality signal based on recent click decision events (accepted/rejected).
+        partner_reject_rate=partner_reject_rate(partner_id, config.reject_lookback_days),
+        reject_penalty_weight=config.reject_penalty_weight,
+        reject_lookback_days=config.reject_lookback_days,
+        partner_quality_state=quality["state"],
+        partner_quality_note=quality["note"],
+        market_note=multipliers["market_note"],
+    )
+
+    partner_request_count = _partner_request_count(
+        partner_id, config.exploration_lookback_days
+    )
+    is_new_partner = partner_request_count < config.exploration_new_partner_requests
+
+    features = load_candidate_features(
+        partner_id,
+        [campaign.id for campaign, _ in eligible],
+        [ad.id for _, ad in eligible],
+        config.freq_cap_seconds,
+        config.ctr_lookback_days,
+        config.exploration_lookback_days,
+        config.delivery_lookback_days,
+    )
+
+    # Everything except the targeting bonus is independent of the slot.
+    base_signals = {}
+    columns = CandidateColumns(TARGETING_DIMENSIONS) if config.scorer == "numpy" else None
+    for campaign, ad in eligible:
+        if ad.id in features.blocked_ad_ids:
             continue
 
-        ad_clicks, ad_impressions = _ad_ctr(partner_id, ad.id, ctr_lookback_days)
-        if ad_impressions == 0:
-            ad_clicks, ad_impressions = _campaign_ctr(
-                partner_id, campaign.id, ctr_lookback_days
-            )
-        if ad_impressions == 0:
-            ad_clicks, ad_impressions = _global_campaign_ctr(
-                campaign.id, ctr_lookback_days
-            )
+        ad_clicks, ad_impressions = features.ctr_counts(campaign.id, ad.id)
 
         if ad_impressions == 0:
             ctr = DEFAULT_CTR
         else:
             ctr = _smoothed_ctr(ad_clicks, ad_impressions)
 
-        expected_profit = float(campaign.buyer_cpc - campaign.partner_payout)
-        targeting_bonus = _targeting_bonus(
-            campaign, category, geo, device, placement, targeting_bonus_value
-        )
-        # Apply partner-quality penalty uniformly across all candidate ads.
-        reject_penalty = partner_reject_rate_value * reject_penalty_weight
-        quality_penalty = reject_penalty * delta_quality
-
-        ad_serves = _partner_ad_serves(partner_id, ad.id, exploration_lookback_days)
-        is_new_ad = ad_serves < exploration_new_ad_serves
+        ad_serves = features.ad_serves.get(ad.id, 0)
+        is_new_ad = ad_serves < config.exploration_new_ad_serves
         exploration_applied = False
         exploration_bonus_value = 0
         exploration_reason = None
-        if ad_serves < exploration_max_ad_serves:
+        if ad_serves < config.exploration_max_ad_serves:
             exploration_applied, exploration_bonus_value, exploration_reason = (
                 _exploration_decision(
                     partner_id,
                     ad.id,
-                    exploration_rate,
-                    exploration_bonus,
+                    config.exploration_rate,
+                    config.exploration_bonus,
                     is_new_partner,
                     is_new_ad,
                 )
@@ -357,99 +463,97 @@ def select_ad_for_partner(
 
         delivery_boost = _delivery_boost(
             campaign,
-            delivery_lookback_days,
-            delivery_min_requests,
-            delivery_low_click_rate,
-            delivery_min_budget_remaining_ratio,
-            delivery_boost_value,
+            features.delivery_requests.get(campaign.id, 0),
+            features.delivery_clicks.get(campaign.id, 0),
+            config.delivery_min_requests,
+            config.delivery_low_click_rate,
+            config.delivery_min_budget_remaining_ratio,
+            config.delivery_boost_value,
         )
 
-        score = (
-            expected_profit * alpha_profit
-            + (ctr * ctr_weight * beta_ctr)
-            + (targeting_bonus * gamma_targeting)
-            - quality_penalty
-            + exploration_bonus_value
-            + delivery_boost
+        base_signals[campaign.id] = CandidateSignals(
+            campaign=campaign,
+            ad=ad,
+            expected_profit=float(campaign.buyer_cpc - campaign.partner_payout),
+            ctr=ctr,
+            targeting_bonus=0.0,
+            exploration_applied=exploration_applied,
+            exploration_bonus=exploration_bonus_value,
+            exploration_reason=exploration_reason,
+            delivery_boost=delivery_boost,
+            assignment_count=features.assignment_counts.get(campaign.id, 0),
         )
+        if columns is not None:
+            columns.append(
+                base_signals[campaign.id],
+                {
+                    dimension: getattr(campaign, f"targeting_{dimension}")
+                    for dimension in TARGETING_DIMENSIONS
+                },
+            )
 
-        assignment_count = (
-            AdAssignment.query.filter_by(partner_id=partner_id, campaign_id=campaign.id)
-            .count()
+    limit = config.debug_limit if config.debug else 1
+    exhausted = get_exhausted_campaigns()
+    used_campaign_ids = set()
+    results = []
+    if columns is not None:
+        columns.freeze()
+        available = np.fromiter(
+            (campaign_id not in exhausted for campaign_id in columns.campaign_id.tolist()),
+            dtype=bool,
+            count=len(columns),
         )
-
-        score_breakdown = {
-            "profit": round(expected_profit, 4),
-            "alpha_profit": round(alpha_profit, 4),
-            "ctr": round(ctr, 4),
-            "ctr_weight": round(ctr_weight, 4),
-            "beta_ctr": round(beta_ctr, 4),
-            "targeting_bonus": round(targeting_bonus, 4),
-            "gamma_targeting": round(gamma_targeting, 4),
-            "partner_reject_rate": round(partner_reject_rate_value, 4),
-            "partner_reject_penalty": round(reject_penalty, 4),
-            "partner_reject_lookback_days": reject_lookback_days,
-            "partner_reject_penalty_weight": round(reject_penalty_weight, 4),
-            "partner_quality_state": partner_quality_state_value,
-            "partner_quality_note": partner_quality_note,
-            "delta_quality": round(delta_quality, 4),
-            "partner_quality_penalty": round(quality_penalty, 4),
-            "exploration_applied": exploration_applied,
-            "exploration_bonus": round(exploration_bonus_value, 4),
-            "exploration_reason": exploration_reason,
-            "delivery_boost": round(delivery_boost, 4),
-            "delivery_boost_applied": delivery_boost > 0,
-            "market_note": market_note,
-            "total": round(score, 4),
-        }
-
-        explanation_parts = [
-            f"Score balances profit ${expected_profit:.2f}, CTR {ctr:.2%}, "
-            f"targeting bonus {targeting_bonus:.2f}."
-        ]
-        if market_note:
-            explanation_parts.append(market_note)
-        if partner_quality_note:
-            explanation_parts.append(
-                f"Partner quality state: {partner_quality_state_value}. {partner_quality_note}"
+    for slot, campaign_ids in zip(slots, slot_campaign_ids):
+        if columns is None:
+            ranked, blocked_by_cap = _rank_slot_scalar(
+                weights,
+                base_signals,
+                slot,
+                campaign_ids,
+                lambda campaign_id: campaign_id in used_campaign_ids or campaign_id in exhausted,
+                limit,
+                config,
             )
-        if exploration_applied and exploration_reason:
-            explanation_parts.append(
-                f"Exploration applied for {exploration_reason.replace('_', ' ').lower()}."
+        else:
+            ranked, blocked_by_cap = _rank_slot_columns(
+                weights, columns, available, slot, campaign_ids, limit, config
             )
-        if delivery_boost > 0:
-            explanation_parts.append("Delivery balancing boost applied for pacing.")
-
-        explanation = " ".join(explanation_parts)
+        if ranked is None:
+            reason = "FREQ_CAP" if blocked_by_cap else "NO_ELIGIBLE_ADS"
+            results.append(MatchResult(None, None, None, {}, reason, []))
+            continue
 
-        candidates.append(
-            (
-                score,
-                assignment_count,
-                campaign.id,
-                ad.id,
-                campaign,
-                ad,
-                explanation,
-                score_breakdown,
+        winner = ranked[0]
+        used_campaign_ids.add(winner.signals.campaign.id)
+        if columns is not None:
+            available[columns.campaign_id == winner.signals.campaign.id] = False
+        debug_candidates = None
+        if config.debug:
+            debug_candidates = [
+                {
+                    "campaign_id": entry.signals.campaign.id,
+                    "ad_id": entry.signals.ad.id,
+                    "score": round(entry.score, 4),
+                    "score_breakdown": entry.score_breakdown,
+                }
+                for entry in ranked
+            ]
+        results.append(
+            MatchResult(
+                winner.signals.ad,
+                winner.signals.campaign,
+                winner.explanation,
+                winner.score_breakdown,
+                None,
+                debug_candidates,
             )
         )
+    return results
+
 
-    if not candidates:
-        reason = "FREQ_CAP" if blocked_by_cap else "NO_ELIGIBLE_ADS"
-        return MatchResult(None, None, None, {}, reason, [])
-
-    candidates.sort(key=lambda item: (-item[0], item[1], item[2], item[3]))
-    _, _, _, _, campaign, ad, explanation, score_breakdown = candidates[0]
-    debug_candidates = None
-    if debug:
-        debug_candidates = [
-            {
-                "campaign_id": entry[4].id,
-                "ad_id": entry[5].id,
-                "score": round(entry[0], 4),
-                "score_breakdown": entry[7],
-            }
-            for entry in candidates[:debug_limit]
-        ]
-    return MatchResult(ad, campaign, explanation, score_breakdown, None, debug_candidates)
+def select_ad_for_partner(
+    partner_id, category=None, geo=None, device=None, placement=None, config=None
+):
+    """Single-slot form of :func:`select_ads_for_slots`."""
+    slot = AdSlot(category=category, geo=geo, device=device, placement=placement)
+    return select_ads_for_slots(partner_id, [slot], config=config)[0]
@@ -1,25 +1,85 @@
 from datetime import datetime, timedelta
 
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.extensions import db
 from app.models.click_event import ClickEvent
+from app.models.partner_quality import PartnerQualityBucket
+from app.services.upsert import increment_counters
 
 
-def _click_decisions(partner_id, cutoff):
-    accepted = (
-        ClickEvent.query.filter_by(partner_id=partner_id, status="ACCEPTED")
-        .filter(ClickEvent.ts >= cutoff)
-        .count()
-    )
-    rejected = (
-        ClickEvent.query.filter_by(partner_id=partner_id, status="REJECTED")
-        .filter(ClickEvent.ts >= cutoff)
-        .count()
+def bucket_start(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def record_click_decisions(decisions, connection=None):
+    """Add ``(partner_id, status, ts)`` decisions to the hourly quality buckets."""
+    rows = []
+    for partner_id, status, ts in decisions:
+        if partner_id is None:
+            continue
+        rows.append(
+            {
+                "partner_id": partner_id,
+                "bucket_start": bucket_start(ts or datetime.utcnow()),
+                "accepted": 1 if status == "ACCEPTED" else 0,
+                "rejected": 1 if status == "REJECTED" else 0,
+            }
+        )
+    increment_counters(
+        PartnerQualityBucket.__table__,
+        ("partner_id", "bucket_start"),
+        ("accepted", "rejected"),
+        rows,
+        connection=connection,
     )
-    return accepted, rejected
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_clicks(session, flush_context):
+    # Keep buckets in the same transaction as the click rows they summarize.
+    decisions = [
+        (instance.partner_id, instance.status, instance.__dict__.get("ts"))
+        for instance in session.new
+        if isinstance(instance, ClickEvent)
+    ]
+    if decisions:
+        record_click_decisions(decisions, connection=session.connection())
+
+
+def _click_decisions(partner_id, cutoffs):
+    """Return ``[(accepted, rejected), ...]`` for each cutoff, from hour buckets.
+
+    Windows are aligned to whole hours, so a window may include up to one
+    extra hour of history at its start. ``None`` means all history.
+    """
+    bucket_cutoffs = [bucket_start(cutoff) if cutoff else None for cutoff in cutoffs]
+    columns = []
+    for cutoff in bucket_cutoffs:
+        accepted = func.sum(PartnerQualityBucket.accepted)
+        rejected = func.sum(PartnerQualityBucket.rejected)
+        if cutoff:
+            accepted = accepted.filter(PartnerQualityBucket.bucket_start >= cutoff)
+            rejected = rejected.filter(PartnerQualityBucket.bucket_start >= cutoff)
+        columns.append(func.coalesce(accepted, 0))
+        columns.append(func.coalesce(rejected, 0))
+
+    query = db.session.query(*columns).filter(PartnerQualityBucket.partner_id == partner_id)
+    if all(bucket_cutoffs):
+        query = query.filter(PartnerQualityBucket.bucket_start >= min(bucket_cutoffs))
+    row = query.one()
+    return [(int(row[index]), int(row[index + 1])) for index in range(0, len(row), 2)]
+
+
+def partner_click_totals(partner_id):
+    """All-time ``(accepted, rejected)`` click decisions for a partner."""
+    return _click_decisions(partner_id, [None])[0]
 
 
 def partner_reject_rate(partner_id, lookback_days):
     cutoff = datetime.utcnow() - timedelta(days=lookback_days)
-    accepted, rejected = _click_decisions(partner_id, cutoff)
+    accepted, rejected = _click_decisions(partner_id, [cutoff])[0]
     total = accepted + rejected
     return rejected / total if total else 0
 
@@ -37,8 +97,9 @@ def partner_quality_state(
     recent_cutoff = now - timedelta(days=recent_days)
     long_cutoff = now - timedelta(days=long_days)
 
-    recent_accepted, recent_rejected = _click_decisions(partner_id, recent_cutoff)
-    long_accepted, long_rejected = _click_decisions(partner_id, long_cutoff)
+    (recent_accepted, recent_rejected), (long_accepted, long_rejected) = _click_decisions(
+        partner_id, [recent_cutoff, long_cutoff]
+    )
 
     recent_total = recent_accepted + recent_rejected
     long_total = long_accepted + long_rejected
@@ -1,19 +1,21 @@
 from decimal import Decimal, ROUND_HALF_UP
 
-from flask import current_app, has_app_context
+from flask import has_app_context
 
-from app.config import Config, load_platform_fee_percent
+from app.config import Config, PricingConfig
+from app.services.settings import get_pricing_config
 
 
-def get_platform_fee_percent():
-    value = Config.PLATFORM_FEE_PERCENT
+def _pricing_config():
     if has_app_context():
-        value = current_app.config.get("PLATFORM_FEE_PERCENT", value)
-    return load_platform_fee_percent(value)
+        return get_pricing_config()
+    return PricingConfig.from_mapping({"PLATFORM_FEE_PERCENT": Config.PLATFORM_FEE_PERCENT})
+
+
+def get_platform_fee_percent():
+    return _pricing_config().platform_fee_percent
 
 
 def compute_partner_payout(max_cpc):
-    fee_percent = get_platform_fee_percent()
-    fee_multiplier = (Decimal("100") - fee_percent) / Decimal("100")
-    payout = Decimal(str(max_cpc)) * fee_multiplier
+    payout = Decimal(str(max_cpc)) * _pricing_config().payout_multiplier
     return payout.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
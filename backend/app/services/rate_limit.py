@@ -0,0 +1,283 @@
+from collections import OrderedDict
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import BigInteger, Float, Integer, bindparam, case
+
+from app.extensions import db
+from app.models.click_rate_limit import ClickRateLimit
+from app.services.upsert import dialect_insert
+
+RATE_LIMIT_BACKENDS = ("memory", "shared", "database")
+RATE_LIMIT_WINDOW_SECONDS = 60
+
+
+def _window_position(now_ts, window_seconds):
+    """Return the fixed window ``now_ts`` falls in and how much of the
+    previous window still overlaps the sliding window ending at ``now_ts``.
+    """
+    window_index = int(now_ts // window_seconds)
+    elapsed = (now_ts - window_index * window_seconds) / window_seconds
+    return window_index, 1.0 - elapsed
+
+
+def _roll(window_index, current, previous, now_index):
+    """Counts as of ``now_index`` for an entry last written in ``window_index``."""
+    if window_index == now_index:
+        return current, previous
+    if window_index == now_index - 1:
+        return 0, current
+    return 0, 0
+
+
+class MemoryRateLimiter:
+    """Per-worker sliding-window counters, one entry per key.
+
+    Each entry holds the hit counts of the current and previous fixed
+    windows; the sliding count is the current count plus the overlapping
+    share of the previous one, so ``allow`` is O(1). Entries are kept in
+    last-hit order, so keys idle for two windows are dropped from the front
+    on every write and ``max_entries`` evicts the least recently seen.
+    """
+
+    def __init__(self, max_entries=100_000, window_seconds=RATE_LIMIT_WINDOW_SECONDS):
+        self.max_entries = max_entries
+        self.window_seconds = window_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def allow(self, key, now_ts, limit):
+        if limit <= 0:
+            return False
+        now_index, weight = _window_position(now_ts, self.window_seconds)
+        entries = self._entries
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None:
+                current, previous = 0, 0
+            else:
+                current, previous = _roll(entry[0], entry[1], entry[2], now_index)
+            allowed = previous * weight + current + 1 <= limit
+            if allowed:
+                current += 1
+            entries[key] = (now_index, current, previous)
+            entries.move_to_end(key)
+            while entries:
+                oldest = next(iter(entries.values()))
+                if oldest[0] >= now_index - 1 and len(entries) <= self.max_entries:
+                    break
+                entries.popitem(last=False)
+        return allowed
+
+
+class SharedMemoryRateLimiter:
+    """Sliding-window counters in a memory-mapped file shared by every worker
+    on the host.
+
+    The file is a fixed open-addressing table of ``slots`` entries, so its
+    size never grows. A key probes a handful of slots; when none is free or
+    idle for two windows, the slot hit least recently is taken over. Writers
+    serialize on ``flock`` (plus a thread lock, since ``flock`` is per open
+    file). The file is reopened after a fork so each process locks on its own.
+    """
+
+    SLOT = struct.Struct("<QqII")
+    PROBES = 8
+
+    def __init__(self, path=None, slots=1 << 20, window_seconds=RATE_LIMIT_WINDOW_SECONDS):
+        self.path = path or default_shared_path()
+        self.slots = slots
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    @property
+    def size_bytes(self):
+        return self.slots * self.SLOT.size
+
+    def _ensure_open(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size_bytes:
+            os.ftruncate(fd, self.size_bytes)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size_bytes)
+        self._pid = os.getpid()
+
+    def close(self):
+        if self._map is not None and self._pid == os.getpid():
+            self._map.close()
+            os.close(self._fd)
+        self._pid = self._fd = self._map = None
+
+    @staticmethod
+    def _fingerprint(key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+        # Zero marks an empty slot.
+        return int.from_bytes(digest, "little") or 1
+
+    def allow(self, key, now_ts, limit):
+        if limit <= 0:
+            return False
+        now_index, weight = _window_position(now_ts, self.window_seconds)
+        fingerprint = self._fingerprint(key)
+        slot_size = self.SLOT.size
+        with self._lock:
+            self._ensure_open()
+            table = self._map
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                match = free = oldest = None
+                oldest_index = None
+                home = fingerprint % self.slots
+                for probe in range(self.PROBES):
+                    offset = ((home + probe) % self.slots) * slot_size
+                    slot_key, window_index, current, previous = self.SLOT.unpack_from(
+                        table, offset
+                    )
+                    if slot_key == fingerprint:
+                        match = offset
+                        break
+                    if slot_key == 0 or window_index < now_index - 1:
+                        if free is None:
+                            free = offset
+                    elif oldest is None or window_index < oldest_index:
+                        oldest, oldest_index = offset, window_index
+                if match is not None:
+                    target = match
+                    current, previous = _roll(window_index, current, previous, now_index)
+                else:
+                    # No slot for this key yet: take an idle one, else evict
+                    # the one hit least recently.
+                    target = free if free is not None else oldest
+                    current, previous = 0, 0
+                allowed = previous * weight + current + 1 <= limit
+                if allowed:
+                    current += 1
+                self.SLOT.pack_into(
+                    table, target, fingerprint, now_index, current, previous
+                )
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return allowed
+
+
+class DatabaseRateLimiter:
+    """Sliding-window counters in ``click_rate_limits``, shared by every replica.
+
+    Each hit is one conditional upsert in the caller's transaction: the row is
+    rolled forward to the current window and incremented only while the
+    sliding count is under the limit, so no row comes back once the key is
+    limited. Rows idle for two windows are deleted at most every
+    ``purge_interval_seconds`` per worker.
+    """
+
+    def __init__(self, purge_interval_seconds=300, window_seconds=RATE_LIMIT_WINDOW_SECONDS):
+        self.purge_interval_seconds = purge_interval_seconds
+        self.window_seconds = window_seconds
+        self._last_purge = time.monotonic()
+        self._statements = {}
+
+    def _upsert(self):
+        # Built once per dialect with bind parameters; constructing the
+        # expression costs far more than running it.
+        bind = db.session.get_bind()
+        statement = self._statements.get(bind.dialect.name)
+        if statement is not None:
+            return statement
+        table = ClickRateLimit.__table__
+        now_index = bindparam("now_index", type_=BigInteger)
+        same_window = table.c.window_index == now_index
+        previous_window = table.c.window_index == now_index - 1
+        rolled_current = case((same_window, table.c.current_count), else_=0)
+        rolled_previous = case(
+            (same_window, table.c.previous_count),
+            (previous_window, table.c.current_count),
+            else_=0,
+        )
+        statement = dialect_insert(table).values(
+            key=bindparam("key"), window_index=now_index, current_count=1, previous_count=0
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "window_index": now_index,
+                "current_count": rolled_current + 1,
+                "previous_count": rolled_previous,
+            },
+            where=rolled_previous * bindparam("weight", type_=Float)
+            + rolled_current
+            + 1
+            <= bindparam("limit", type_=Integer),
+        ).returning(table.c.current_count)
+        return self._statements.setdefault(bind.dialect.name, statement)
+
+    def allow(self, key, now_ts, limit):
+        if limit <= 0:
+            return False
+        now_index, weight = _window_position(now_ts, self.window_seconds)
+        row = db.session.execute(
+            self._upsert(),
+            {"key": key, "now_index": now_index, "weight": weight, "limit": limit},
+        ).first()
+        allowed = row is not None
+
+        if time.monotonic() - self._last_purge >= self.purge_interval_seconds:
+            self._last_purge = time.monotonic()
+            self.purge_expired(now_ts)
+        return allowed
+
+    def purge_expired(self, now_ts=None):
+        now_index, _ = _window_position(
+            time.time() if now_ts is None else now_ts, self.window_seconds
+        )
+        return (
+            db.session.query(ClickRateLimit)
+            .filter(ClickRateLimit.window_index < now_index - 1)
+            .delete(synchronize_session=False)
+        )
+
+
+def default_shared_path():
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "campaign-master-click-rate-limit")
+
+
+def _build_limiter(backend):
+    config = current_app.config
+    if backend == "memory":
+        return MemoryRateLimiter(
+            max_entries=int(config.get("RATE_LIMIT_MEMORY_MAX_ENTRIES", 100_000))
+        )
+    if backend == "shared":
+        return SharedMemoryRateLimiter(
+            path=config.get("RATE_LIMIT_SHARED_PATH") or None,
+            slots=int(config.get("RATE_LIMIT_SHARED_SLOTS", 1 << 20)),
+        )
+    if backend == "database":
+        return DatabaseRateLimiter(
+            purge_interval_seconds=float(config.get("RATE_LIMIT_PURGE_INTERVAL_SECONDS", 300))
+        )
+    raise ValueError(f"Unknown rate limit backend: {backend!r}")
+
+
+def get_rate_limiter():
+    backend = current_app.config.get("RATE_LIMIT_BACKEND", "memory")
+    limiters = current_app.extensions.setdefault("rate_limiters", {})
+    limiter = limiters.get(backend)
+    if limiter is None:
+        limiter = limiters.setdefault(backend, _build_limiter(backend))
+    return limiter
@@ -0,0 +1,379 @@
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from app.extensions import db
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.models.daily_click_decision import DailyClickDecision
+from app.models.daily_traffic_stat import DailyTrafficStat
+from app.models.impression_event import ImpressionEvent
+from app.models.rollup_watermark import RollupWatermark
+from app.services.upsert import dialect_insert, increment_counters
+
+TRAFFIC_CLICKS_WATERMARK = "daily_traffic_stats:clicks"
+TRAFFIC_IMPRESSIONS_WATERMARK = "daily_traffic_stats:impressions"
+TRAFFIC_KEY_COLUMNS = ["day", "buyer_id", "campaign_id", "ad_id", "partner_id"]
+CLICK_DECISIONS_WATERMARK = "daily_click_decisions"
+CLICK_DECISION_KEY_COLUMNS = ["day", "partner_id", "status", "reject_reason"]
+CLICK_DECISION_DIMENSIONS = ("day", "partner_id", "reject_reason")
+UPSERT_CHUNK = 1000
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _lock_watermark(name):
+    table = RollupWatermark.__table__
+    db.session.execute(
+        dialect_insert(table)
+        .values(name=name, last_event_id=0)
+        .on_conflict_do_nothing(index_elements=[table.c.name])
+    )
+    # Held until the batch commits, so concurrent refreshes cannot fold the
+    # same events twice.
+    return (
+        db.session.query(RollupWatermark)
+        .filter(RollupWatermark.name == name)
+        .with_for_update()
+        .one()
+    )
+
+
+def _upsert_chunks(table, key_columns, counter_columns, rows):
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[start : start + UPSERT_CHUNK]
+        increment_counters(table, key_columns, counter_columns, chunk)
+
+
+def _fold(name, model, fold_batch, settle_seconds, batch_size, now):
+    """Advance watermark ``name`` over ``model`` events, ``batch_size`` ids per
+    transaction, calling ``fold_batch(lower, upper)`` for each id range.
+
+    Event ids are handed out before their transactions commit, and buffered
+    rows get fresh ids carrying old timestamps, so neither the highest
+    committed id nor event ``ts`` bounds what is safe to fold. Instead each
+    run records the highest id it sees, and events are folded only up to an
+    id recorded at least ``settle_seconds`` ago: every lower id was handed
+    out before then, so its transaction has committed or rolled back by now
+    unless it ran longer than the settle window.
+    """
+    watermark = _lock_watermark(name)
+    start = watermark.last_event_id
+    if watermark.observed_at is None or (watermark.observed_event_id or 0) <= start:
+        watermark.observed_event_id = (
+            db.session.query(func.max(model.id)).filter(model.id > start).scalar() or start
+        )
+        watermark.observed_at = now
+    upper = None
+    if watermark.observed_at <= now - timedelta(seconds=settle_seconds):
+        upper = watermark.observed_event_id
+    folded = 0
+    lower = start
+    while upper is not None and lower < upper:
+        high = min(lower + batch_size, upper)
+        folded += fold_batch(lower, high)
+        watermark.last_event_id = high
+        watermark.updated_at = now
+        db.session.commit()
+        lower = high
+        if lower < upper:
+            watermark = _lock_watermark(name)
+            if watermark.last_event_id != lower:
+                # Another refresh took over between batches.
+                break
+    db.session.commit()
+    return {"from_id": start, "to_id": lower, "rows": folded}
+
+
+def _fold_click_traffic(lower, upper):
+    day = func.date(ClickEvent.ts)
+    buyer_id = func.coalesce(Campaign.buyer_id, 0)
+    campaign_id = func.coalesce(ClickEvent.campaign_id, 0)
+    ad_id = func.coalesce(ClickEvent.ad_id, 0)
+    partner_id = func.coalesce(ClickEvent.partner_id, 0)
+    rows = (
+        db.session.query(
+            day.label("day"),
+            buyer_id.label("buyer_id"),
+            campaign_id.label("campaign_id"),
+            ad_id.label("ad_id"),
+            partner_id.label("partner_id"),
+            func.count(ClickEvent.id).label("clicks"),
+            func.sum(ClickEvent.spend_delta).label("spend"),
+            func.sum(ClickEvent.earnings_delta).label("earnings"),
+            func.sum(ClickEvent.profit_delta).label("profit"),
+        )
+        .outerjoin(Campaign, Campaign.id == ClickEvent.campaign_id)
+        .filter(ClickEvent.id > lower)
+        .filter(ClickEvent.id <= upper)
+        .filter(ClickEvent.status == "ACCEPTED")
+        .group_by(day, buyer_id, campaign_id, ad_id, partner_id)
+        .all()
+    )
+    _upsert_chunks(
+        DailyTrafficStat.__table__,
+        TRAFFIC_KEY_COLUMNS,
+        ["clicks", "spend", "earnings", "profit"],
+        [{**row._asdict(), "day": _as_date(row.day)} for row in rows],
+    )
+    return len(rows)
+
+
+def _fold_impression_traffic(lower, upper):
+    day = func.date(ImpressionEvent.ts)
+    buyer_id = func.coalesce(Campaign.buyer_id, 0)
+    campaign_id = func.coalesce(ImpressionEvent.campaign_id, 0)
+    ad_id = func.coalesce(ImpressionEvent.ad_id, 0)
+    partner_id = func.coalesce(ImpressionEvent.partner_id, 0)
+    rows = (
+        db.session.query(
+            day.label("day"),
+            buyer_id.label("buyer_id"),
+            campaign_id.label("campaign_id"),
+            ad_id.label("ad_id"),
+            partner_id.label("partner_id"),
+            func.count(ImpressionEvent.id).label("impressions"),
+        )
+        .outerjoin(Campaign, Campaign.id == ImpressionEvent.campaign_id)
+        .filter(ImpressionEvent.id > lower)
+        .filter(ImpressionEvent.id <= upper)
+        .filter(ImpressionEvent.status == "ACCEPTED")
+        .group_by(day, buyer_id, campaign_id, ad_id, partner_id)
+        .all()
+    )
+    _upsert_chunks(
+        DailyTrafficStat.__table__,
+        TRAFFIC_KEY_COLUMNS,
+        ["impressions"],
+        [{**row._asdict(), "day": _as_date(row.day)} for row in rows],
+    )
+    return len(rows)
+
+
+def _fold_click_decisions(lower, upper):
+    day = func.date(ClickEvent.ts)
+    partner_id = func.coalesce(ClickEvent.partner_id, 0)
+    reject_reason = func.coalesce(ClickEvent.reject_reason, "")
+    rows = (
+        db.session.query(
+            day.label("day"),
+            partner_id.label("partner_id"),
+            ClickEvent.status.label("status"),
+            reject_reason.label("reject_reason"),
+            func.count(ClickEvent.id).label("clicks"),
+        )
+        .filter(ClickEvent.id > lower)
+        .filter(ClickEvent.id <= upper)
+        .group_by(day, partner_id, ClickEvent.status, reject_reason)
+        .all()
+    )
+    _upsert_chunks(
+        DailyClickDecision.__table__,
+        CLICK_DECISION_KEY_COLUMNS,
+        ["clicks"],
+        [{**row._asdict(), "day": _as_date(row.day)} for row in rows],
+    )
+    return len(rows)
+
+
+def _refresh_settings(settle_seconds, batch_size, now):
+    config = current_app.config
+    if settle_seconds is None:
+        settle_seconds = float(config.get("ROLLUP_SETTLE_SECONDS", 60))
+    if batch_size is None:
+        batch_size = int(config.get("ROLLUP_BATCH_SIZE", 50_000))
+    return settle_seconds, batch_size, now or datetime.utcnow()
+
+
+def refresh_daily_traffic_stats(settle_seconds=None, batch_size=None, now=None):
+    """Fold accepted clicks and impressions past the watermarks into
+    ``daily_traffic_stats``. Safe to run repeatedly and concurrently.
+    """
+    settings = _refresh_settings(settle_seconds, batch_size, now)
+    return {
+        "clicks": _fold(TRAFFIC_CLICKS_WATERMARK, ClickEvent, _fold_click_traffic, *settings),
+        "impressions": _fold(
+            TRAFFIC_IMPRESSIONS_WATERMARK, ImpressionEvent, _fold_impression_traffic, *settings
+        ),
+    }
+
+
+def refresh_daily_click_decisions(settle_seconds=None, batch_size=None, now=None):
+    """Fold click decisions past the watermark into ``daily_click_decisions``."""
+    settings = _refresh_settings(settle_seconds, batch_size, now)
+    return _fold(CLICK_DECISIONS_WATERMARK, ClickEvent, _fold_click_decisions, *settings)
+
+
+def refresh_rollups(settle_seconds=None, batch_size=None, now=None):
+    return {
+        "daily_traffic_stats": refresh_daily_traffic_stats(settle_seconds, batch_size, now),
+        "daily_click_decisions": refresh_daily_click_decisions(settle_seconds, batch_size, now),
+    }
+
+
+def _watermark_value(name):
+    return (
+        select(RollupWatermark.last_event_id)
+        .where(RollupWatermark.name == name)
+        .scalar_subquery()
+    )
+
+
+def daily_traffic_rows(start_date, buyer_id=None, partner_id=None):
+    """Per-day rows since ``start_date`` for ``build_daily_series``.
+
+    Days already folded come from ``daily_traffic_stats``; events past the
+    watermarks (today's, and anything the refresh has not reached yet) are
+    read from the event tables and added on top. The watermarks are read in
+    the same statement as the rollup rows, so a refresh committing in
+    between cannot count a batch twice or drop it.
+    """
+    rollup_query = db.session.query(
+        DailyTrafficStat.day.label("day"),
+        func.sum(DailyTrafficStat.clicks).label("clicks"),
+        func.sum(DailyTrafficStat.spend).label("spend"),
+        func.sum(DailyTrafficStat.earnings).label("earnings"),
+        func.sum(DailyTrafficStat.profit).label("profit"),
+        func.sum(DailyTrafficStat.impressions).label("impressions"),
+        _watermark_value(TRAFFIC_CLICKS_WATERMARK).label("clicks_watermark"),
+        _watermark_value(TRAFFIC_IMPRESSIONS_WATERMARK).label("impressions_watermark"),
+    ).filter(DailyTrafficStat.day >= start_date)
+    if buyer_id is not None:
+        rollup_query = rollup_query.filter(DailyTrafficStat.buyer_id == buyer_id)
+    if partner_id is not None:
+        rollup_query = rollup_query.filter(DailyTrafficStat.partner_id == partner_id)
+    rollup_rows = rollup_query.group_by(DailyTrafficStat.day).all()
+
+    # No rollup rows in range means nothing in range was folded, so reading
+    # every event in range is exact.
+    clicks_watermark = impressions_watermark = 0
+    if rollup_rows:
+        clicks_watermark = rollup_rows[0].clicks_watermark or 0
+        impressions_watermark = rollup_rows[0].impressions_watermark or 0
+
+    click_day = func.date(ClickEvent.ts)
+    click_query = (
+        db.session.query(
+            click_day.label("day"),
+            func.count(ClickEvent.id).label("clicks"),
+            func.sum(ClickEvent.spend_delta).label("spend"),
+            func.sum(ClickEvent.earnings_delta).label("earnings"),
+            func.sum(ClickEvent.profit_delta).label("profit"),
+        )
+        .filter(ClickEvent.id > clicks_watermark)
+        .filter(ClickEvent.status == "ACCEPTED")
+        .filter(ClickEvent.ts >= start_date)
+    )
+    impression_day = func.date(ImpressionEvent.ts)
+    impression_query = (
+        db.session.query(
+            impression_day.label("day"),
+            func.count(ImpressionEvent.id).label("impressions"),
+        )
+        .filter(ImpressionEvent.id > impressions_watermark)
+        .filter(ImpressionEvent.status == "ACCEPTED")
+        .filter(ImpressionEvent.ts >= start_date)
+    )
+    if buyer_id is not None:
+        click_query = click_query.join(Campaign, ClickEvent.campaign_id == Campaign.id).filter(
+            Campaign.buyer_id == buyer_id
+        )
+        impression_query = impression_query.join(
+            Campaign, ImpressionEvent.campaign_id == Campaign.id
+        ).filter(Campaign.buyer_id == buyer_id)
+    if partner_id is not None:
+        click_query = click_query.filter(ClickEvent.partner_id == partner_id)
+        impression_query = impression_query.filter(ImpressionEvent.partner_id == partner_id)
+
+    click_rows = click_query.group_by(click_day).all()
+    impression_rows = impression_query.group_by(impression_day).all()
+    return rollup_rows + click_rows, rollup_rows + impression_rows
+
+
+def _decision_value(dimension, value):
+    if dimension == "day":
+        return _as_date(value)
+    if dimension == "reject_reason":
+        return value or None
+    return value
+
+
+def click_decision_counts(
+    group_by, start_date=None, end_date=None, partner_id=None, reject_reason=None
+):
+    """Accepted and rejected click counts keyed by a tuple of ``group_by``
+    values (any of ``day``, ``partner_id``, ``reject_reason``), optionally
+    limited to a day range, a partner and a reject reason.
+
+    Reads ``daily_click_decisions`` plus raw clicks past its watermark, the
+    same way :func:`daily_traffic_rows` does. Unattributed clicks have
+    partner id 0.
+    """
+    unknown = set(group_by) - set(CLICK_DECISION_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown click decision dimensions: {', '.join(sorted(unknown))}")
+
+    rollup_columns = {
+        "day": DailyClickDecision.day,
+        "partner_id": DailyClickDecision.partner_id,
+        "reject_reason": DailyClickDecision.reject_reason,
+    }
+    rollup_groups = [rollup_columns[name] for name in group_by]
+    rollup_query = db.session.query(
+        *[column.label(name) for name, column in zip(group_by, rollup_groups)],
+        func.sum(
+            case((DailyClickDecision.status == "ACCEPTED", DailyClickDecision.clicks), else_=0)
+        ).label("accepted"),
+        func.sum(
+            case((DailyClickDecision.status == "REJECTED", DailyClickDecision.clicks), else_=0)
+        ).label("rejected"),
+        _watermark_value(CLICK_DECISIONS_WATERMARK).label("watermark"),
+    )
+    if start_date is not None:
+        rollup_query = rollup_query.filter(DailyClickDecision.day >= start_date)
+    if end_date is not None:
+        rollup_query = rollup_query.filter(DailyClickDecision.day <= end_date)
+    if partner_id is not None:
+        rollup_query = rollup_query.filter(DailyClickDecision.partner_id == partner_id)
+    if reject_reason is not None:
+        rollup_query = rollup_query.filter(DailyClickDecision.reject_reason == reject_reason)
+    rollup_rows = rollup_query.group_by(*rollup_groups).all()
+    watermark = (rollup_rows[0].watermark or 0) if rollup_rows else 0
+
+    raw_columns = {
+        "day": func.date(ClickEvent.ts),
+        "partner_id": func.coalesce(ClickEvent.partner_id, 0),
+        "reject_reason": func.coalesce(ClickEvent.reject_reason, ""),
+    }
+    raw_groups = [raw_columns[name] for name in group_by]
+    raw_query = db.session.query(
+        *[column.label(name) for name, column in zip(group_by, raw_groups)],
+        func.sum(case((ClickEvent.status == "ACCEPTED", 1), else_=0)).label("accepted"),
+        func.sum(case((ClickEvent.status == "REJECTED", 1), else_=0)).label("rejected"),
+    ).filter(ClickEvent.id > watermark)
+    # Only ids past the watermark are read; ts bounds are plain ranges rather
+    # than func.date(ts) comparisons.
+    if start_date is not None:
+        raw_query = raw_query.filter(ClickEvent.ts >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        raw_query = raw_query.filter(
+            ClickEvent.ts < datetime.combine(end_date + timedelta(days=1), time.min)
+        )
+    if partner_id is not None:
+        raw_query = raw_query.filter(ClickEvent.partner_id == partner_id)
+    if reject_reason is not None:
+        raw_query = raw_query.filter(ClickEvent.reject_reason == reject_reason)
+    raw_rows = raw_query.group_by(*raw_groups).all()
+
+    counts = {}
+    for row in rollup_rows + raw_rows:
+        key = tuple(_decision_value(name, getattr(row, name)) for name in group_by)
+        entry = counts.setdefault(key, {"accepted": 0, "rejected": 0})
+        entry["accepted"] += int(row.accepted or 0)
+        entry["rejected"] += int(row.rejected or 0)
+    return counts
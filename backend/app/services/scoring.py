@@ -0,0 +1,272 @@
+from dataclasses import dataclass, replace
+import heapq
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class ScoringWeights:
+    """Per-request multipliers and partner-level penalties shared by all candidates."""
+
+    alpha_profit: float
+    beta_ctr: float
+    gamma_targeting: float
+    ctr_weight: float
+    delta_quality: float
+    partner_reject_rate: float
+    reject_penalty_weight: float
+    reject_lookback_days: int
+    partner_quality_state: str
+    partner_quality_note: str | None
+    market_note: str | None
+
+    @property
+    def reject_penalty(self):
+        return self.partner_reject_rate * self.reject_penalty_weight
+
+    @property
+    def quality_penalty(self):
+        # Apply partner-quality penalty uniformly across all candidate ads.
+        return self.reject_penalty * self.delta_quality
+
+
+@dataclass(slots=True)
+class CandidateSignals:
+    campaign: object
+    ad: object
+    expected_profit: float
+    ctr: float
+    targeting_bonus: float
+    exploration_applied: bool
+    exploration_bonus: float
+    exploration_reason: str | None
+    delivery_boost: float
+    assignment_count: int
+
+
+@dataclass
+class RankedCandidate:
+    score: float
+    signals: CandidateSignals
+    score_breakdown: dict
+    explanation: str | None
+
+
+def candidate_score(weights, signals):
+    return (
+        signals.expected_profit * weights.alpha_profit
+        + (signals.ctr * weights.ctr_weight * weights.beta_ctr)
+        + (signals.targeting_bonus * weights.gamma_targeting)
+        - weights.quality_penalty
+        + signals.exploration_bonus
+        + signals.delivery_boost
+    )
+
+
+def score_breakdown(weights, signals, score):
+    return {
+        "profit": round(signals.expected_profit, 4),
+        "alpha_profit": round(weights.alpha_profit, 4),
+        "ctr": round(signals.ctr, 4),
+        "ctr_weight": round(weights.ctr_weight, 4),
+        "beta_ctr": round(weights.beta_ctr, 4),
+        "targeting_bonus": round(signals.targeting_bonus, 4),
+        "gamma_targeting": round(weights.gamma_targeting, 4),
+        "partner_reject_rate": round(weights.partner_reject_rate, 4),
+        "partner_reject_penalty": round(weights.reject_penalty, 4),
+        "partner_reject_lookback_days": weights.reject_lookback_days,
+        "partner_reject_penalty_weight": round(weights.reject_penalty_weight, 4),
+        "partner_quality_state": weights.partner_quality_state,
+        "partner_quality_note": weights.partner_quality_note,
+        "delta_quality": round(weights.delta_quality, 4),
+        "partner_quality_penalty": round(weights.quality_penalty, 4),
+        "exploration_applied": signals.exploration_applied,
+        "exploration_bonus": round(signals.exploration_bonus, 4),
+        "exploration_reason": signals.exploration_reason,
+        "delivery_boost": round(signals.delivery_boost, 4),
+        "delivery_boost_applied": signals.delivery_boost > 0,
+        "market_note": weights.market_note,
+        "total": round(score, 4),
+    }
+
+
+def score_explanation(weights, signals):
+    explanation_parts = [
+        f"Score balances profit ${signals.expected_profit:.2f}, CTR {signals.ctr:.2%}, "
+        f"targeting bonus {signals.targeting_bonus:.2f}."
+    ]
+    if weights.market_note:
+        explanation_parts.append(weights.market_note)
+    if weights.partner_quality_note:
+        explanation_parts.append(
+            f"Partner quality state: {weights.partner_quality_state}. "
+            f"{weights.partner_quality_note}"
+        )
+    if signals.exploration_applied and signals.exploration_reason:
+        explanation_parts.append(
+            f"Exploration applied for "
+            f"{signals.exploration_reason.replace('_', ' ').lower()}."
+        )
+    if signals.delivery_boost > 0:
+        explanation_parts.append("Delivery balancing boost applied for pacing.")
+    return " ".join(explanation_parts)
+
+
+def _materialize(weights, ranked_scores):
+    """Build result objects for ``(score, signals)`` pairs, best first."""
+    ranked = []
+    for position, (score, signals) in enumerate(ranked_scores):
+        ranked.append(
+            RankedCandidate(
+                score,
+                signals,
+                score_breakdown(weights, signals, score),
+                score_explanation(weights, signals) if position == 0 else None,
+            )
+        )
+    return ranked
+
+
+def rank_scalar(weights, candidates, limit):
+    """Score candidates one at a time and return the best ``limit`` entries.
+
+    Scores are kept as plain sort-key tuples and the top entries are picked
+    with a bounded heap; breakdowns are only built for the returned entries
+    and the explanation only for the winner.
+    """
+    keys = (
+        (
+            -candidate_score(weights, signals),
+            signals.assignment_count,
+            signals.campaign.id,
+            signals.ad.id,
+            position,
+        )
+        for position, signals in enumerate(candidates)
+    )
+    return _materialize(
+        weights,
+        [(-key[0], candidates[key[4]]) for key in heapq.nsmallest(limit, keys)],
+    )
+
+
+class CandidateColumns:
+    """One request's candidate features as NumPy columns, one row per candidate.
+
+    Rows are appended while the caller builds the candidate signals, so the
+    columns are filled in that single pass and ranking a slot is array
+    arithmetic over the rows it may use. ``targeting`` holds each row's
+    campaign targeting value per dimension, for :meth:`targeting_bonus`.
+    """
+
+    _FEATURES = (
+        ("expected_profit", np.float64),
+        ("ctr", np.float64),
+        ("exploration_bonus", np.float64),
+        ("delivery_boost", np.float64),
+        ("assignment_count", np.int64),
+    )
+
+    def __init__(self, dimensions=()):
+        self.signals = []
+        self._values = {name: [] for name, _ in self._FEATURES}
+        self._values["campaign_id"] = []
+        self._values["ad_id"] = []
+        self._targeting = {dimension: [] for dimension in dimensions}
+        self.targeting = {}
+
+    def __len__(self):
+        return len(self.signals)
+
+    def append(self, signals, targeting=None):
+        values = self._values
+        self.signals.append(signals)
+        for name, _ in self._FEATURES:
+            values[name].append(getattr(signals, name))
+        values["campaign_id"].append(signals.campaign.id)
+        values["ad_id"].append(signals.ad.id)
+        for dimension, column in self._targeting.items():
+            column.append((targeting or {}).get(dimension))
+
+    def freeze(self):
+        """Convert the appended rows to arrays; call once before ranking."""
+        for name, dtype in (*self._FEATURES, ("campaign_id", np.int64), ("ad_id", np.int64)):
+            setattr(self, name, np.asarray(self._values[name], dtype=dtype))
+        self.targeting = {
+            dimension: np.asarray(values, dtype=object)
+            for dimension, values in self._targeting.items()
+        }
+        return self
+
+    def targeting_bonus(self, requested, bonus_value):
+        """Per-row bonus: ``bonus_value`` for each requested dimension the campaign targets."""
+        bonus = np.zeros(len(self.signals))
+        for dimension, value in requested.items():
+            if value:
+                bonus += (self.targeting[dimension] == value) * bonus_value
+        return bonus
+
+
+def rank_rows(weights, columns, rows, targeting_bonus, limit):
+    """Score ``rows`` of frozen ``columns`` in one NumPy pass and return the
+    best ``limit`` entries.
+
+    ``targeting_bonus`` is a per-row array for the slot being ranked.
+    Ordering matches :func:`rank_scalar` (highest score, then fewest
+    assignments, then lowest campaign and ad id).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if not len(rows):
+        return []
+
+    bonus = targeting_bonus[rows]
+    scores = (
+        columns.expected_profit[rows] * weights.alpha_profit
+        + (columns.ctr[rows] * weights.ctr_weight * weights.beta_ctr)
+        + (bonus * weights.gamma_targeting)
+        - weights.quality_penalty
+        + columns.exploration_bonus[rows]
+        + columns.delivery_boost[rows]
+    )
+
+    best = int(np.argmax(scores))
+    if limit == 1 and np.count_nonzero(scores == scores[best]) == 1:
+        order = [best]
+    else:
+        order = np.lexsort(
+            (
+                columns.ad_id[rows],
+                columns.campaign_id[rows],
+                columns.assignment_count[rows],
+                -scores,
+            )
+        )[:limit]
+
+    return _materialize(
+        weights,
+        [
+            (
+                float(scores[index]),
+                replace(columns.signals[rows[index]], targeting_bonus=float(bonus[index])),
+            )
+            for index in order
+        ],
+    )
+
+
+def rank_vectorized(weights, candidates, limit):
+    """:func:`rank_rows` over a plain candidate list, for one-off rankings.
+
+    Request matching builds :class:`CandidateColumns` once and ranks each slot
+    with :func:`rank_rows` instead of converting the list on every call.
+    """
+    columns = CandidateColumns()
+    for signals in candidates:
+        columns.append(signals)
+    columns.freeze()
+    bonus = np.fromiter(
+        (signals.targeting_bonus for signals in candidates),
+        dtype=np.float64,
+        count=len(candidates),
+    )
+    return rank_rows(weights, columns, np.arange(len(candidates)), bonus, limit)
@@ -0,0 +1,187 @@
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import MatchingConfig, PricingConfig
+from app.extensions import db
+from app.models.runtime_settings import RuntimeSettings
+from app.services.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_SETTINGS_NAME = "runtime"
+# Blueprints whose requests read matching or pricing settings; health checks
+# and /metrics never touch the database for settings.
+SETTINGS_BLUEPRINTS = frozenset(
+    {"admin", "analytics", "buyer_campaigns", "partner_ads", "tracking"}
+)
+
+
+class CompiledSettings:
+    """Matching and pricing settings compiled from the Flask config.
+
+    The compiled pair is rebuilt only when the config has been written since
+    the last build. :meth:`sync` applies the overrides shared by all workers
+    through the ``runtime_settings`` row when its version moves, and publishes
+    the new pair as a single reference, so a request sees either the old or
+    the new settings, never a mix.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self.shared_version = None
+        self.checked_at = None
+
+    def _current(self, config):
+        state = self._state
+        if state is None or state[0] != config.version:
+            state = (
+                config.version,
+                MatchingConfig.from_mapping(config),
+                PricingConfig.from_mapping(config),
+            )
+            self._state = state
+        return state
+
+    def get(self, config):
+        state = self._state
+        if state is not None and state[0] == config.version:
+            return state
+        with self._lock:
+            return self._current(config)
+
+    def sync(self, config, version, overrides):
+        """Apply shared ``overrides`` unless ``version`` was already applied.
+
+        Returns True when the settings changed. Raises ValueError, leaving the
+        current settings in place, if the overrides do not validate here.
+        """
+        with self._lock:
+            if version == self.shared_version:
+                return False
+            self.shared_version = version
+            merged = {**config, **overrides}
+            matching = MatchingConfig.from_mapping(merged)
+            pricing = PricingConfig.from_mapping(merged)
+            config.update({**matching.to_mapping(), **pricing.to_mapping()})
+            self._state = (config.version, matching, pricing)
+        return True
+
+
+def init_settings(app):
+    """Compile settings at startup so invalid configuration fails fast."""
+    settings = app.extensions.setdefault("settings", CompiledSettings())
+    settings.get(app.config)
+    app.before_request(_sync_for_request)
+    return settings
+
+
+def _settings():
+    return current_app.extensions.setdefault("settings", CompiledSettings())
+
+
+def _apply_shared(settings, version, overrides):
+    try:
+        changed = settings.sync(current_app.config, version, overrides)
+    except ValueError:
+        logger.exception("ignoring invalid shared settings version %s", version)
+        return
+    if changed:
+        # Multipliers are derived from the thresholds; drop the cached pair.
+        market_health = current_app.extensions.get("market_health")
+        if market_health is not None:
+            market_health.clear()
+
+
+def _sync_for_request():
+    if request.blueprint in SETTINGS_BLUEPRINTS:
+        sync_shared_settings()
+
+
+def sync_shared_settings(force=False):
+    """Pick up settings published by any worker, at most every ``SETTINGS_POLL_SECONDS``.
+
+    If the shared row cannot be read, the settings this worker already has
+    are kept and the next poll tries again.
+    """
+    settings = _settings()
+    now = time.monotonic()
+    interval = float(current_app.config.get("SETTINGS_POLL_SECONDS", 5))
+    if not force and settings.checked_at is not None and now - settings.checked_at < interval:
+        return
+    settings.checked_at = now
+    try:
+        row = (
+            db.session.query(RuntimeSettings.version, RuntimeSettings.overrides)
+            .filter(RuntimeSettings.name == RUNTIME_SETTINGS_NAME)
+            .first()
+        )
+    except SQLAlchemyError:
+        db.session.rollback()
+        logger.warning("could not read shared settings; keeping current ones", exc_info=True)
+        return
+    if row is not None:
+        _apply_shared(settings, row.version, json.loads(row.overrides))
+
+
+def _lock_runtime_settings():
+    table = RuntimeSettings.__table__
+    db.session.execute(
+        dialect_insert(table)
+        .values(name=RUNTIME_SETTINGS_NAME, version=0, overrides="{}")
+        .on_conflict_do_nothing(index_elements=[table.c.name])
+    )
+    # Held until the change commits, so concurrent admin writes apply in turn
+    # and neither drops the other's keys.
+    return (
+        db.session.query(RuntimeSettings)
+        .filter(RuntimeSettings.name == RUNTIME_SETTINGS_NAME)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+
+
+def publish_settings(matching_changes, pricing_changes):
+    """Validate and store a settings change for every worker, then apply it here.
+
+    ``matching_changes`` and ``pricing_changes`` map field names to raw values,
+    as accepted by ``with_changes``. Raises ValueError if they do not validate.
+    Other workers apply the change on their next poll.
+    """
+    settings = _settings()
+    config = current_app.config
+    row = _lock_runtime_settings()
+    overrides = json.loads(row.overrides)
+    _apply_shared(settings, row.version, overrides)
+    _, matching, pricing = settings.get(config)
+    current = {**matching.to_mapping(), **pricing.to_mapping()}
+    try:
+        matching = matching.with_changes(matching_changes)
+        pricing = pricing.with_changes(pricing_changes)
+    except ValueError:
+        db.session.rollback()
+        raise
+    updated = {**matching.to_mapping(), **pricing.to_mapping()}
+    overrides.update({key: value for key, value in updated.items() if value != current[key]})
+
+    row.version = row.version + 1
+    row.overrides = json.dumps(overrides, sort_keys=True)
+    row.updated_at = db.func.now()
+    version = row.version
+    db.session.commit()
+    _apply_shared(settings, version, overrides)
+    return settings.get(config)[1:]
+
+
+def get_matching_config():
+    return _settings().get(current_app.config)[1]
+
+
+def get_pricing_config():
+    return _settings().get(current_app.config)[2]
@@ -0,0 +1,122 @@
+import logging
+import time
+
+from flask import g, has_app_context, request
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request",
+    ["endpoint"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Total SQL time per request",
+    ["endpoint"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_SLOWEST = Histogram(
+    "http_request_db_slowest_statement_seconds",
+    "Slowest single SQL statement per request",
+    ["endpoint"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+_listeners_installed = False
+
+
+class SqlStats:
+    __slots__ = ("statements", "total_seconds", "slowest_seconds", "slowest_statement")
+
+    def __init__(self):
+        self.statements = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, seconds):
+        self.statements += 1
+        self.total_seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+
+def current_sql_stats():
+    """Stats for the active request, or ``None`` when not instrumented."""
+    if not has_app_context():
+        return None
+    return g.get("sql_stats")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_sql_stats() is not None:
+        conn.info.setdefault("sql_metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_sql_stats()
+    started = conn.info.get("sql_metrics_started")
+    if stats is None or not started:
+        return
+    stats.record(statement, time.perf_counter() - started.pop())
+
+
+def _install_listeners():
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _listeners_installed = True
+
+
+def _enabled(app, key):
+    return str(app.config.get(key, "0")).lower() in ("1", "true", "yes")
+
+
+def init_sql_metrics(app):
+    """Count SQL statements and time per request when ``SQL_INSTRUMENTATION`` is on.
+
+    Totals are exported as Prometheus histograms labelled by endpoint on the
+    ``/metrics`` endpoint served by ``PrometheusMetrics``. With
+    ``SQL_TIMING_HEADERS`` on and ``APP_ENV`` other than ``production``, the
+    totals are also returned as ``X-DB-Queries`` / ``X-DB-Time`` headers.
+    """
+    if not _enabled(app, "SQL_INSTRUMENTATION"):
+        return
+    _install_listeners()
+    emit_headers = (
+        _enabled(app, "SQL_TIMING_HEADERS") and app.config.get("APP_ENV") != "production"
+    )
+
+    @app.before_request
+    def _start_sql_stats():
+        g.sql_stats = SqlStats()
+
+    @app.after_request
+    def _observe_sql_stats(response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+        endpoint = request.endpoint or "unknown"
+        DB_QUERIES.labels(endpoint).observe(stats.statements)
+        DB_TIME.labels(endpoint).observe(stats.total_seconds)
+        DB_SLOWEST.labels(endpoint).observe(stats.slowest_seconds)
+        logger.debug(
+            "%s: %d statements in %.1f ms, slowest %.1f ms: %s",
+            endpoint,
+            stats.statements,
+            stats.total_seconds * 1000,
+            stats.slowest_seconds * 1000,
+            stats.slowest_statement,
+        )
+        if emit_headers:
+            response.headers["X-DB-Queries"] = str(stats.statements)
+            response.headers["X-DB-Time"] = f"{stats.total_seconds * 1000:.3f}"
+        return response
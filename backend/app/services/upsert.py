@@ -0,0 +1,43 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+
+
+def dialect_insert(table, connection=None):
+    """Return an INSERT construct that supports ``on_conflict_do_*``."""
+    bind = connection if connection is not None else db.session.get_bind()
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    if bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"upsert not supported on {bind.dialect.name}")
+
+
+def increment_counters(table, key_columns, counter_columns, rows, connection=None):
+    """Atomically add ``rows`` into counter columns keyed by ``key_columns``.
+
+    Rows sharing a key are merged first so a single statement never touches
+    the same target row twice.
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        current = merged.setdefault(
+            key,
+            {
+                **{column: row[column] for column in key_columns},
+                **{column: 0 for column in counter_columns},
+            },
+        )
+        for column in counter_columns:
+            current[column] += row.get(column, 0) or 0
+    if not merged:
+        return
+
+    stmt = dialect_insert(table, connection).values(list(merged.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[column] for column in key_columns],
+        set_={column: table.c[column] + stmt.excluded[column] for column in counter_columns},
+    )
+    executor = connection if connection is not None else db.session
+    executor.execute(stmt)
@@ -6,6 +6,10 @@ from flask import current_app, request
 
 from app.extensions import db
 from app.models.click_event import ClickEvent
+from app.services.dedup import get_dedup_window
+from app.services.event_buffer import get_event_buffer
+from app.services.heavy_hitters import get_heavy_hitters, is_heavy_hitter
+from app.services.rate_limit import get_rate_limiter
 
 
 @dataclass
@@ -16,25 +20,6 @@ class ClickDecision:
     ua_hash: str | None
 
 
-class ClickRateLimiter:
-    def __init__(self):
-        self._buckets = {}
-
-    def allow(self, ip_hash, now_ts, limit, window_seconds=60):
-        timestamps = self._buckets.get(ip_hash, [])
-        cutoff = now_ts - window_seconds
-        timestamps = [ts for ts in timestamps if ts >= cutoff]
-        if len(timestamps) >= limit:
-            self._buckets[ip_hash] = timestamps
-            return False
-        timestamps.append(now_ts)
-        self._buckets[ip_hash] = timestamps
-        return True
-
-
-_rate_limiter = ClickRateLimiter()
-
-
 def get_hash_salt():
     return current_app.config.get("CLICK_HASH_SALT", "devsalt")
 
@@ -61,9 +46,12 @@ def build_request_fingerprint(req):
     return ip_hash, ua_hash, ua
 
 
-def _is_duplicate_click(assignment_code, ip_hash, now_dt):
-    window_seconds = current_app.config.get("CLICK_DUPLICATE_WINDOW_SECONDS", 10)
-    cutoff = now_dt - timedelta(seconds=window_seconds)
+def _recent_click_recorded(assignment_code, ip_hash, cutoff):
+    event_buffer = get_event_buffer()
+    if event_buffer is not None:
+        latest = event_buffer.latest_pending_ts(ClickEvent, assignment_code, ip_hash)
+        if latest is not None and latest >= cutoff:
+            return True
     existing = (
         db.session.query(ClickEvent.id)
         .filter(ClickEvent.assignment_code == assignment_code)
@@ -74,13 +62,33 @@ def _is_duplicate_click(assignment_code, ip_hash, now_dt):
     return existing is not None
 
 
+def _is_duplicate_click(assignment_code, ip_hash, now_dt):
+    window_seconds = current_app.config.get("CLICK_DUPLICATE_WINDOW_SECONDS", 10)
+    cutoff = now_dt - timedelta(seconds=window_seconds)
+    window = get_dedup_window("click")
+    if window is None:
+        return _recent_click_recorded(assignment_code, ip_hash, cutoff)
+    return window.is_duplicate(
+        (assignment_code, ip_hash),
+        lambda: _recent_click_recorded(assignment_code, ip_hash, cutoff),
+    )
+
+
 def _rate_limit_allows(ip_hash, now_dt):
     limit = current_app.config.get("CLICK_RATE_LIMIT_PER_MINUTE", 20)
-    return _rate_limiter.allow(ip_hash, now_dt.timestamp(), limit, window_seconds=60)
+    return get_rate_limiter().allow(ip_hash, now_dt.timestamp(), limit)
 
 
 def validate_click(assignment):
     ip_hash, ua_hash, ua = build_request_fingerprint(request)
+    # Every click counts towards the heavy hitters, whatever its outcome.
+    volumes = get_heavy_hitters().observe(
+        {
+            "ip": ip_hash,
+            "ua": ua_hash,
+            "partner": assignment.partner_id if assignment is not None else None,
+        }
+    )
 
     if assignment is None:
         return ClickDecision(
@@ -115,6 +123,14 @@ def validate_click(assignment):
             ua_hash=ua_hash,
         )
 
+    if is_heavy_hitter(volumes):
+        return ClickDecision(
+            status="REJECTED",
+            reason="HEAVY_HITTER",
+            ip_hash=ip_hash,
+            ua_hash=ua_hash,
+        )
+
     return ClickDecision(
         status="ACCEPTED",
         reason=None,
@@ -0,0 +1,253 @@
+"""Concurrent click spend benchmark.
+
+Drives accepted clicks against one hot campaign from several threads and
+compares the old row-lock spend path (``SELECT ... FOR UPDATE``, budget check
+in Python, ORM update) with the conditional ``UPDATE ... RETURNING`` in
+``app.services.budget.spend_click``. Reports throughput, latency percentiles
+and whether the campaign was ever overspent. Output is JSON.
+
+    python -m benchmarks.budget_bench --threads 1,8,32 --clicks 200
+    python -m benchmarks.budget_bench --database-url postgresql://... --output budget.json
+
+SQLite serializes all writers, so the difference only shows on Postgres.
+"""
+
+import argparse
+from decimal import Decimal
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from app import create_app
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.models.user import User
+from app.services.budget import SpendResult, get_exhausted_campaigns, spend_click
+from benchmarks.matching_bench import _git_commit, _int_list, _percentile
+
+CPC = Decimal("1.00")
+PAYOUT = Decimal("0.70")
+
+
+def spend_with_row_lock(campaign_id):
+    """The pre-``spend_click`` path, kept as the baseline."""
+    campaign = (
+        db.session.query(Campaign)
+        .filter(Campaign.id == campaign_id)
+        .with_for_update()
+        .first()
+    )
+    if campaign.status != "active" or campaign.budget_remaining < campaign.buyer_cpc:
+        if campaign.status == "active":
+            campaign.status = "paused"
+        return SpendResult("REJECTED", "BUDGET_EXHAUSTED")
+    campaign.budget_spent = (campaign.budget_spent or Decimal("0")) + campaign.buyer_cpc
+    if campaign.budget_remaining < campaign.buyer_cpc:
+        campaign.status = "paused"
+    return SpendResult(
+        "ACCEPTED",
+        None,
+        spend_delta=campaign.buyer_cpc,
+        earnings_delta=campaign.partner_payout,
+        profit_delta=campaign.buyer_cpc - campaign.partner_payout,
+    )
+
+
+STRATEGIES = {"row_lock": spend_with_row_lock, "atomic": spend_click}
+
+
+def build_campaign(budget_clicks):
+    buyer = User(email="bench-buyer@example.com", password_hash="-", role="buyer")
+    partner = User(email="bench-partner@example.com", password_hash="-", role="partner")
+    db.session.add_all([buyer, partner])
+    db.session.flush()
+    campaign = Campaign(
+        buyer_id=buyer.id,
+        name="Hot campaign",
+        status="active",
+        budget_total=CPC * budget_clicks,
+        budget_spent=Decimal("0"),
+        buyer_cpc=CPC,
+        partner_payout=PAYOUT,
+    )
+    db.session.add(campaign)
+    db.session.flush()
+    ad = Ad(
+        campaign_id=campaign.id,
+        title="Hot ad",
+        body="Synthetic ad",
+        image_url="https://example.com/ad.png",
+        destination_url="https://example.com/landing",
+        active=True,
+    )
+    db.session.add(ad)
+    db.session.commit()
+    return {"partner_id": partner.id, "campaign_id": campaign.id, "ad_id": ad.id}
+
+
+def run_strategy(app, strategy, threads, clicks_per_thread, budget_clicks):
+    spend = STRATEGIES[strategy]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ids = build_campaign(budget_clicks)
+        get_exhausted_campaigns().clear()
+
+    latencies = []
+    accepted = []
+    errors = []
+    start_barrier = threading.Barrier(threads)
+
+    def worker(worker_index):
+        local_latencies = []
+        local_accepted = 0
+        with app.app_context():
+            start_barrier.wait()
+            for click_index in range(clicks_per_thread):
+                started = time.perf_counter()
+                try:
+                    result = spend(ids["campaign_id"])
+                    db.session.add(
+                        ClickEvent(
+                            assignment_code=f"bench-{worker_index}-{click_index}",
+                            partner_id=ids["partner_id"],
+                            campaign_id=ids["campaign_id"],
+                            ad_id=ids["ad_id"],
+                            ip_hash="bench",
+                            status=result.status,
+                            reject_reason=result.reject_reason,
+                            spend_delta=result.spend_delta,
+                            earnings_delta=result.earnings_delta,
+                            profit_delta=result.profit_delta,
+                        )
+                    )
+                    db.session.commit()
+                except Exception as exc:
+                    db.session.rollback()
+                    errors.append(type(exc).__name__)
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+                local_accepted += result.status == "ACCEPTED"
+            db.session.remove()
+        latencies.extend(local_latencies)
+        accepted.append(local_accepted)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        campaign = db.session.get(Campaign, ids["campaign_id"])
+        budget_spent = campaign.budget_spent
+        budget_total = campaign.budget_total
+        status = campaign.status
+        db.session.remove()
+
+    total_accepted = sum(accepted)
+    completed = len(latencies)
+    return {
+        "threads": threads,
+        "clicks": threads * clicks_per_thread,
+        "completed": completed,
+        "errors": len(errors),
+        "accepted": total_accepted,
+        "clicks_per_second": round(completed / elapsed, 1) if elapsed else None,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "final_status": status,
+        "overspent": budget_spent > budget_total,
+        "spend_matches_accepted": budget_spent == CPC * total_accepted,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--threads",
+        type=_int_list,
+        default=[1, 8, 32],
+        help="comma-separated concurrency levels",
+    )
+    parser.add_argument("--clicks", type=int, default=200, help="clicks per thread")
+    parser.add_argument(
+        "--budget-clicks",
+        type=int,
+        default=None,
+        help="campaign budget in clicks; defaults to 90%% of the clicks sent so the "
+        "campaign runs out mid-run",
+    )
+    parser.add_argument(
+        "--strategies",
+        default="row_lock,atomic",
+        help=f"comma-separated subset of {', '.join(STRATEGIES)}",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="SQLAlchemy URL; tables are dropped and recreated, so use a scratch "
+        "database (default: a temporary SQLite file)",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    strategies = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    unknown = set(strategies) - set(STRATEGIES)
+    if unknown:
+        raise SystemExit(f"unknown strategies: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": database_url,
+                "JWT_SECRET_KEY": "bench-secret",
+            }
+        )
+        results = []
+        for threads in args.threads:
+            budget_clicks = args.budget_clicks or max(1, threads * args.clicks * 9 // 10)
+            for strategy in strategies:
+                print(f"running {strategy} with {threads} threads", file=sys.stderr)
+                results.append(
+                    {
+                        "strategy": strategy,
+                        **run_strategy(app, strategy, threads, args.clicks, budget_clicks),
+                    }
+                )
+        with app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    report = {
+        "benchmark": "budget",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "dialect": database_url.split(":", 1)[0],
+        "clicks_per_thread": args.clicks,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Matching benchmark over synthetic marketplaces.
+
+Builds a marketplace per size, then drives ``select_ad_for_partner`` directly
+and ``GET /api/partner/ad`` through the Flask test client. For each it reports
+latency percentiles, SQL statements per request and (on Postgres) rows scanned
+per request. Output is JSON with stable keys so runs can be diffed across
+commits.
+
+    python -m benchmarks.matching_bench --campaigns 100,1000 --requests 200
+    python -m benchmarks.matching_bench --database-url postgresql://... --output bench.json
+"""
+
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, insert, text
+
+from app import create_app
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.assignment import AdAssignment
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.models.impression_event import ImpressionEvent
+from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.models.user import User
+from app.services.engagement import record_engagement
+from app.services.matching import select_ad_for_partner
+from app.services.partner_quality import record_click_decisions
+
+CATEGORIES = ["Fitness", "Travel", "Finance", "Gaming", "Food", "Fashion", "Auto", "Home"]
+GEOS = ["US", "CA", "UK", "DE", "FR", "BR", "IN", "JP"]
+DEVICES = ["mobile", "desktop", "tablet"]
+PLACEMENTS = ["header", "sidebar", "footer", "inline", "interstitial"]
+INSERT_CHUNK = 5000
+
+
+def _values(base, cardinality):
+    """Return ``cardinality`` targeting values, extending ``base`` if needed."""
+    if cardinality <= len(base):
+        return base[:cardinality]
+    return base + [f"{base[0]}-{index}" for index in range(cardinality - len(base))]
+
+
+class StatementCounter:
+    """Counts cursor executions on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    @contextmanager
+    def active(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        try:
+            yield self
+        finally:
+            event.remove(self.engine, "before_cursor_execute", self._before)
+
+
+def _rows_scanned():
+    """Total tuples read from user tables, or ``None`` when not on Postgres."""
+    if db.engine.dialect.name != "postgresql":
+        return None
+    with db.engine.connect() as conn:
+        try:
+            conn.execute(text("SELECT pg_stat_force_next_flush()"))
+        except Exception:
+            # Before Postgres 15 the collector flushes on its own schedule.
+            conn.rollback()
+            time.sleep(0.6)
+        conn.execute(text("SELECT pg_stat_clear_snapshot()"))
+        return conn.execute(
+            text(
+                "SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0) "
+                "FROM pg_stat_user_tables"
+            )
+        ).scalar()
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(model), rows[start : start + INSERT_CHUNK])
+
+
+def build_marketplace(rng, size):
+    """Insert a synthetic marketplace and return ids needed to drive requests."""
+    categories = _values(CATEGORIES, size["targeting_cardinality"])
+    geos = _values(GEOS, size["targeting_cardinality"])
+
+    def maybe(values):
+        # Roughly a quarter of campaigns leave each dimension untargeted.
+        return None if rng.random() < 0.25 else rng.choice(values)
+
+    _insert(User, [{"email": "bench-buyer@example.com", "password_hash": "-", "role": "buyer"}])
+    _insert(
+        User,
+        [
+            {
+                "email": f"bench-partner-{index}@example.com",
+                "password_hash": "-",
+                "role": "partner",
+            }
+            for index in range(size["partners"])
+        ],
+    )
+    buyer_id = db.session.query(User.id).filter_by(role="buyer").scalar()
+    partner_ids = [row.id for row in db.session.query(User.id).filter_by(role="partner")]
+
+    campaign_rows = []
+    for index in range(size["campaigns"]):
+        cpc = Decimal(rng.choice(["0.50", "1.00", "1.50", "2.00", "3.00"]))
+        campaign_rows.append(
+            {
+                "buyer_id": buyer_id,
+                "name": f"Bench {index}",
+                "status": "active",
+                "budget_total": Decimal("100000.00"),
+                "budget_spent": Decimal("0.00"),
+                "buyer_cpc": cpc,
+                "partner_payout": (cpc * Decimal("0.7")).quantize(Decimal("0.01")),
+                "targeting_category": maybe(categories),
+                "targeting_geo": maybe(geos),
+                "targeting_device": maybe(DEVICES),
+                "targeting_placement": maybe(PLACEMENTS),
+            }
+        )
+    _insert(Campaign, campaign_rows)
+    campaign_ids = [row.id for row in db.session.query(Campaign.id).order_by(Campaign.id)]
+
+    ad_rows = [
+        {
+            "campaign_id": campaign_id,
+            "title": f"Ad {campaign_id}-{index}",
+            "body": "Synthetic ad",
+            "image_url": "https://example.com/ad.png",
+            "destination_url": "https://example.com/landing",
+            "active": True,
+        }
+        for campaign_id in campaign_ids
+        for index in range(size["ads_per_campaign"])
+    ]
+    _insert(Ad, ad_rows)
+    ads = [(row.id, row.campaign_id) for row in db.session.query(Ad.id, Ad.campaign_id)]
+
+    now = datetime.utcnow()
+    request_rows = []
+    assignment_rows = []
+    impression_rows = []
+    click_rows = []
+    for day in range(size["history_days"]):
+        for _ in range(size["requests_per_day"]):
+            partner_id = rng.choice(partner_ids)
+            created_at = now - timedelta(days=day, seconds=rng.randrange(86400))
+            if rng.random() < 0.2:
+                request_rows.append(
+                    {"partner_id": partner_id, "filled": False, "created_at": created_at}
+                )
+                continue
+            ad_id, campaign_id = rng.choice(ads)
+            code = f"b{len(assignment_rows):x}"
+            request_rows.append(
+                {
+                    "partner_id": partner_id,
+                    "filled": True,
+                    "ad_id": ad_id,
+                    "campaign_id": campaign_id,
+                    "assignment_code": code,
+                    "created_at": created_at,
+                }
+            )
+            assignment_rows.append(
+                {
+                    "code": code,
+                    "partner_id": partner_id,
+                    "campaign_id": campaign_id,
+                    "ad_id": ad_id,
+                    "created_at": created_at,
+                }
+            )
+            event_fields = {
+                "assignment_code": code,
+                "partner_id": partner_id,
+                "campaign_id": campaign_id,
+                "ad_id": ad_id,
+                "ts": created_at,
+                "ip_hash": "bench",
+            }
+            impression_rows.append({**event_fields, "status": "ACCEPTED"})
+            if rng.random() < 0.05:
+                status = "REJECTED" if rng.random() < 0.1 else "ACCEPTED"
+                click_rows.append({**event_fields, "status": status})
+
+    # Core inserts skip the flush hooks, so roll events into counters here.
+    _insert(PartnerAdRequestEvent, request_rows)
+    _insert(AdAssignment, assignment_rows)
+    _insert(ImpressionEvent, impression_rows)
+    _insert(ClickEvent, click_rows)
+    record_engagement(PartnerAdRequestEvent, request_rows)
+    record_engagement(ImpressionEvent, impression_rows)
+    record_engagement(ClickEvent, click_rows)
+    record_click_decisions(
+        [(row["partner_id"], row["status"], row["ts"]) for row in click_rows]
+    )
+    db.session.commit()
+
+    return {
+        "partner_ids": partner_ids,
+        "categories": categories,
+        "geos": geos,
+        "history_rows": len(request_rows) + len(impression_rows) + len(click_rows),
+    }
+
+
+def _random_targeting(rng, marketplace):
+    targeting = {
+        "category": rng.choice(marketplace["categories"]),
+        "geo": rng.choice(marketplace["geos"]),
+        "device": rng.choice(DEVICES),
+        "placement": rng.choice(PLACEMENTS),
+    }
+    # Leave some dimensions open so wildcard-heavy requests are covered.
+    return {key: value for key, value in targeting.items() if rng.random() < 0.75}
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summarize(latencies, statements, rows_scanned, requests, filled):
+    return {
+        "requests": requests,
+        "fill_rate": round(filled / requests, 4) if requests else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "statements_per_request": round(statements / requests, 2),
+        "rows_scanned_per_request": (
+            round(rows_scanned / requests, 1) if rows_scanned is not None else None
+        ),
+    }
+
+
+def _measure(run_one, counter, requests, warmup):
+    for _ in range(warmup):
+        run_one()
+    latencies = []
+    filled = 0
+    rows_before = _rows_scanned()
+    with counter.active():
+        for _ in range(requests):
+            started = time.perf_counter()
+            filled += 1 if run_one() else 0
+            latencies.append(time.perf_counter() - started)
+    rows_after = _rows_scanned()
+    rows_scanned = rows_after - rows_before if rows_before is not None else None
+    # Only cursor executions inside the timed loop are counted.
+    return _summarize(latencies, counter.count, rows_scanned, requests, filled)
+
+
+def run_size(size, args):
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": args.database_url,
+        "JWT_SECRET_KEY": "bench-secret",
+        "FREQ_CAP_SECONDS": args.freq_cap_seconds,
+        "MATCHING_SCORER": args.scorer,
+    }
+    app = create_app(config)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        marketplace = build_marketplace(rng, size)
+        build_seconds = time.perf_counter() - started
+        partner_ids = marketplace["partner_ids"]
+
+        def direct():
+            result = select_ad_for_partner(
+                rng.choice(partner_ids), **_random_targeting(rng, marketplace)
+            )
+            db.session.rollback()
+            return result.ad is not None
+
+        direct_stats = _measure(direct, StatementCounter(db.engine), args.requests, args.warmup)
+
+        with app.test_request_context():
+            tokens = {
+                partner_id: create_access_token(
+                    identity=str(partner_id), additional_claims={"role": "partner"}
+                )
+                for partner_id in partner_ids
+            }
+        engine = db.engine
+
+    client = app.test_client()
+
+    def route():
+        partner_id = rng.choice(partner_ids)
+        response = client.get(
+            "/api/partner/ad",
+            query_string=_random_targeting(rng, marketplace),
+            headers={"Authorization": f"Bearer {tokens[partner_id]}"},
+        )
+        return response.get_json().get("filled")
+
+    with app.app_context():
+        route_stats = _measure(route, StatementCounter(engine), args.requests, args.warmup)
+        db.session.remove()
+        db.drop_all()
+
+    return {
+        "size": size,
+        "history_rows": marketplace["history_rows"],
+        "build_seconds": round(build_seconds, 2),
+        "select_ad_for_partner": direct_stats,
+        "route": route_stats,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--campaigns",
+        type=_int_list,
+        default=[100, 500, 2000],
+        help="comma-separated campaign counts; one marketplace per value",
+    )
+    parser.add_argument("--ads-per-campaign", type=int, default=2)
+    parser.add_argument("--partners", type=int, default=50)
+    parser.add_argument("--history-days", type=int, default=7)
+    parser.add_argument(
+        "--requests-per-day", type=int, default=2000, help="historical ad requests per day"
+    )
+    parser.add_argument(
+        "--targeting-cardinality",
+        type=int,
+        default=8,
+        help="distinct category and geo values",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per mode")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--freq-cap-seconds", type=int, default=0)
+    parser.add_argument("--scorer", default="scalar", choices=["scalar", "numpy"])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--database-url",
+        default="sqlite:///:memory:",
+        help="SQLAlchemy URL; tables are dropped and recreated, so use a scratch database",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for campaigns in args.campaigns:
+        size = {
+            "campaigns": campaigns,
+            "ads_per_campaign": args.ads_per_campaign,
+            "partners": args.partners,
+            "history_days": args.history_days,
+            "requests_per_day": args.requests_per_day,
+            "targeting_cardinality": args.targeting_cardinality,
+        }
+        print(f"running {size}", file=sys.stderr)
+        results.append(run_size(size, args))
+
+    report = {
+        "benchmark": "matching",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "dialect": args.database_url.split(":", 1)[0],
+        "scorer": args.scorer,
+        "requests": args.requests,
+        "seed": args.seed,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Click rate limiter benchmark.
+
+For each backend in ``app.services.rate_limit``, first calls ``allow()`` once
+for each of ``--ips`` distinct IP hashes and reports how much memory the
+counters then hold, then sends ``--requests`` calls at random IPs from that
+set and reports throughput and latency percentiles. Output is JSON.
+
+    python -m benchmarks.rate_limit_bench --ips 1000000
+    python -m benchmarks.rate_limit_bench --backends database --database-url postgresql://...
+
+Memory is measured with ``tracemalloc`` for ``memory``, as the pages the
+mapped file actually uses for ``shared``, and as the table size for
+``database`` (``pg_total_relation_size`` on Postgres, the database file on
+SQLite). The ``database`` fill commits every ``--fill-batch`` calls; the
+timed requests commit after every call, as ``/t/<code>`` does.
+"""
+
+import argparse
+from hashlib import sha256
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.services.rate_limit import (
+    DatabaseRateLimiter,
+    MemoryRateLimiter,
+    RATE_LIMIT_BACKENDS,
+    SharedMemoryRateLimiter,
+)
+from benchmarks.matching_bench import _git_commit, _percentile
+
+LIMIT = 20
+START_TS = 1_800_000_000.0
+
+
+def _ip_hash(index):
+    return sha256(f"bench:{index}".encode("utf-8")).hexdigest()
+
+
+def _database_bytes():
+    bind = db.session.get_bind()
+    if bind.dialect.name == "postgresql":
+        return db.session.execute(
+            text("SELECT pg_total_relation_size('click_rate_limits')")
+        ).scalar()
+    page_count = db.session.execute(text("PRAGMA page_count")).scalar()
+    page_size = db.session.execute(text("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+def _fill(limiter, ip_hashes, commit_every=None):
+    started = time.perf_counter()
+    for index, ip_hash in enumerate(ip_hashes, start=1):
+        limiter.allow(ip_hash, START_TS, LIMIT)
+        if commit_every and index % commit_every == 0:
+            db.session.commit()
+    if commit_every:
+        db.session.commit()
+    return time.perf_counter() - started
+
+
+def _timed_requests(limiter, ip_hashes, requests, seed, commit):
+    rng = random.Random(seed)
+    latencies = []
+    allowed = 0
+    # Spread the requests over the next minute so windows roll.
+    step = 60.0 / max(1, requests)
+    started = time.perf_counter()
+    for index in range(requests):
+        ip_hash = ip_hashes[rng.randrange(len(ip_hashes))]
+        call_started = time.perf_counter()
+        allowed += limiter.allow(ip_hash, START_TS + 1 + index * step, LIMIT)
+        if commit:
+            db.session.commit()
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "allowed": allowed,
+        "allows_per_second": round(requests / elapsed, 1) if elapsed else None,
+        "p50_us": round(_percentile(latencies, 0.50) * 1e6, 2) if latencies else None,
+        "p95_us": round(_percentile(latencies, 0.95) * 1e6, 2) if latencies else None,
+        "p99_us": round(_percentile(latencies, 0.99) * 1e6, 2) if latencies else None,
+    }
+
+
+def run_memory(ip_hashes, args):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    limiter = MemoryRateLimiter(max_entries=len(ip_hashes))
+    _fill(limiter, ip_hashes)
+    memory_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Fill again untraced for the timings; tracemalloc slows every allocation.
+    limiter = MemoryRateLimiter(max_entries=len(ip_hashes))
+    fill_seconds = _fill(limiter, ip_hashes)
+    return {
+        "entries": len(limiter),
+        "fill_seconds": round(fill_seconds, 3),
+        "memory_bytes": memory_bytes,
+        **_timed_requests(limiter, ip_hashes, args.requests, args.seed, commit=False),
+    }
+
+
+def run_shared(ip_hashes, args, scratch):
+    path = os.path.join(scratch, "rate-limit")
+    limiter = SharedMemoryRateLimiter(path=path, slots=args.shared_slots)
+    try:
+        fill_seconds = _fill(limiter, ip_hashes)
+        stats = _timed_requests(limiter, ip_hashes, args.requests, args.seed, commit=False)
+    finally:
+        limiter.close()
+    return {
+        "slots": args.shared_slots,
+        "fill_seconds": round(fill_seconds, 3),
+        "memory_bytes": os.stat(path).st_blocks * 512,
+        "table_bytes": limiter.size_bytes,
+        **stats,
+    }
+
+
+def run_database(app, ip_hashes, args):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        limiter = DatabaseRateLimiter(purge_interval_seconds=float("inf"))
+        fill_seconds = _fill(limiter, ip_hashes, commit_every=args.fill_batch)
+        memory_bytes = _database_bytes()
+        stats = _timed_requests(
+            limiter, ip_hashes, args.database_requests, args.seed, commit=True
+        )
+        db.session.remove()
+    return {
+        "fill_seconds": round(fill_seconds, 3),
+        "memory_bytes": memory_bytes,
+        **stats,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ips", type=int, default=1_000_000, help="distinct IP hashes")
+    parser.add_argument(
+        "--requests", type=int, default=200_000, help="timed allow() calls per backend"
+    )
+    parser.add_argument(
+        "--database-requests",
+        type=int,
+        default=20_000,
+        help="timed allow() calls for the database backend, which commits each one",
+    )
+    parser.add_argument(
+        "--fill-batch",
+        type=int,
+        default=5000,
+        help="allow() calls per commit while filling the database backend",
+    )
+    parser.add_argument(
+        "--shared-slots",
+        type=int,
+        default=None,
+        help="slot count for the shared backend (default: twice --ips)",
+    )
+    parser.add_argument(
+        "--backends",
+        default=",".join(RATE_LIMIT_BACKENDS),
+        help=f"comma-separated subset of {', '.join(RATE_LIMIT_BACKENDS)}",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="SQLAlchemy URL for the database backend; tables are dropped and "
+        "recreated, so use a scratch database (default: a temporary SQLite file)",
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.shared_slots is None:
+        args.shared_slots = max(64, 2 * args.ips)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backends) - set(RATE_LIMIT_BACKENDS)
+    if unknown:
+        raise SystemExit(f"unknown backends: {', '.join(sorted(unknown))}")
+
+    ip_hashes = [_ip_hash(index) for index in range(args.ips)]
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        for backend in backends:
+            print(f"running {backend} with {args.ips} IPs", file=sys.stderr)
+            if backend == "memory":
+                stats = run_memory(ip_hashes, args)
+            elif backend == "shared":
+                stats = run_shared(ip_hashes, args, scratch)
+            else:
+                app = create_app(
+                    {
+                        "TESTING": True,
+                        "SQLALCHEMY_DATABASE_URI": database_url,
+                        "JWT_SECRET_KEY": "bench-secret",
+                    }
+                )
+                stats = run_database(app, ip_hashes, args)
+                with app.app_context():
+                    db.drop_all()
+                    db.engine.dispose()
+            stats["bytes_per_ip"] = round(stats["memory_bytes"] / max(1, args.ips), 1)
+            results.append({"backend": backend, **stats})
+
+    report = {
+        "benchmark": "rate_limit",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "dialect": database_url.split(":", 1)[0],
+        "ips": args.ips,
+        "limit_per_minute": LIMIT,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""add hourly partner quality buckets
+
+Revision ID: 0008_partner_quality_buckets
+Revises: 0007_partner_requests
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_partner_quality_buckets"
+down_revision = "0007_partner_requests"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "partner_quality",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("partner_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("accepted", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("rejected", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.UniqueConstraint("partner_id", "bucket_start", name="uq_partner_quality_bucket"),
+    )
+
+    # Backfill from existing click history so quality states survive the switch.
+    op.execute(
+        """
+        INSERT INTO partner_quality (partner_id, bucket_start, accepted, rejected)
+        SELECT
+            partner_id,
+            date_trunc('hour', ts),
+            COUNT(*) FILTER (WHERE status = 'ACCEPTED'),
+            COUNT(*) FILTER (WHERE status = 'REJECTED')
+        FROM click_events
+        WHERE partner_id IS NOT NULL
+        GROUP BY partner_id, date_trunc('hour', ts)
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("partner_quality")
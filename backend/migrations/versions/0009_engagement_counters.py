@@ -0,0 +1,94 @@
+"""add hourly engagement counters
+
+Revision ID: 0009_engagement_counters
+Revises: 0008_partner_quality_buckets
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_engagement_counters"
+down_revision = "0008_partner_quality_buckets"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "engagement_counters",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("partner_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("campaign_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("ad_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("impressions", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("accepted_clicks", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("rejected_clicks", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("filled_requests", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "unfilled_requests", sa.Integer(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.UniqueConstraint(
+            "hour", "partner_id", "campaign_id", "ad_id", name="uq_engagement_counter_key"
+        ),
+    )
+    op.create_index(
+        "ix_engagement_counters_campaign_hour",
+        "engagement_counters",
+        ["campaign_id", "hour"],
+    )
+    op.create_index(
+        "ix_engagement_counters_ad_hour",
+        "engagement_counters",
+        ["ad_id", "hour"],
+    )
+    op.create_index(
+        "ix_engagement_counters_partner_hour",
+        "engagement_counters",
+        ["partner_id", "hour"],
+    )
+
+    op.execute(
+        """
+        INSERT INTO engagement_counters (
+            hour, partner_id, campaign_id, ad_id,
+            impressions, accepted_clicks, rejected_clicks,
+            filled_requests, unfilled_requests
+        )
+        SELECT hour, partner_id, campaign_id, ad_id,
+            SUM(impressions), SUM(accepted_clicks), SUM(rejected_clicks),
+            SUM(filled_requests), SUM(unfilled_requests)
+        FROM (
+            SELECT date_trunc('hour', ts) AS hour,
+                COALESCE(partner_id, 0) AS partner_id,
+                COALESCE(campaign_id, 0) AS campaign_id,
+                COALESCE(ad_id, 0) AS ad_id,
+                0 AS impressions,
+                CASE WHEN status = 'ACCEPTED' THEN 1 ELSE 0 END AS accepted_clicks,
+                CASE WHEN status = 'REJECTED' THEN 1 ELSE 0 END AS rejected_clicks,
+                0 AS filled_requests,
+                0 AS unfilled_requests
+            FROM click_events
+            UNION ALL
+            SELECT date_trunc('hour', ts), COALESCE(partner_id, 0),
+                COALESCE(campaign_id, 0), COALESCE(ad_id, 0), 1, 0, 0, 0, 0
+            FROM impression_events
+            WHERE status = 'ACCEPTED'
+            UNION ALL
+            SELECT date_trunc('hour', created_at), partner_id,
+                COALESCE(campaign_id, 0), COALESCE(ad_id, 0), 0, 0, 0,
+                CASE WHEN filled THEN 1 ELSE 0 END,
+                CASE WHEN filled THEN 0 ELSE 1 END
+            FROM partner_ad_request_events
+        ) AS events
+        GROUP BY hour, partner_id, campaign_id, ad_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_engagement_counters_partner_hour", table_name="engagement_counters")
+    op.drop_index("ix_engagement_counters_ad_hour", table_name="engagement_counters")
+    op.drop_index("ix_engagement_counters_campaign_hour", table_name="engagement_counters")
+    op.drop_table("engagement_counters")
@@ -0,0 +1,33 @@
+"""make partner ad exposures a purgeable frequency cap store
+
+Revision ID: 0010_frequency_cap_store
+Revises: 0009_engagement_counters
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+revision = "0010_frequency_cap_store"
+down_revision = "0009_engagement_counters"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_partner_ad_exposures_last_served_at",
+        "partner_ad_exposures",
+        ["last_served_at"],
+    )
+    # Exposure rows only matter for the cap window, so skip WAL for them.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE partner_ad_exposures SET UNLOGGED")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE partner_ad_exposures SET LOGGED")
+    op.drop_index(
+        "ix_partner_ad_exposures_last_served_at",
+        table_name="partner_ad_exposures",
+    )
@@ -0,0 +1,34 @@
+"""widen assignment codes for signed tokens
+
+Revision ID: 0011_signed_assignment_codes
+Revises: 0010_frequency_cap_store
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011_signed_assignment_codes"
+down_revision = "0010_frequency_cap_store"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        "ad_assignments",
+        "code",
+        existing_type=sa.String(length=32),
+        type_=sa.String(length=64),
+        existing_nullable=False,
+    )
+
+
+def downgrade():
+    op.alter_column(
+        "ad_assignments",
+        "code",
+        existing_type=sa.String(length=64),
+        type_=sa.String(length=32),
+        existing_nullable=False,
+    )
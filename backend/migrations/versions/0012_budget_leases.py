@@ -0,0 +1,43 @@
+"""add budget leases for per-worker click spend
+
+Revision ID: 0012_budget_leases
+Revises: 0011_signed_assignment_codes
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012_budget_leases"
+down_revision = "0011_signed_assignment_codes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "budget_leases",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("campaign_id", sa.Integer(), nullable=False),
+        sa.Column("holder", sa.String(length=120), nullable=False),
+        sa.Column("amount", sa.Numeric(12, 2), nullable=False),
+        sa.Column("spent", sa.Numeric(12, 2), server_default=sa.text("0"), nullable=False),
+        sa.Column("buyer_cpc", sa.Numeric(12, 2), nullable=False),
+        sa.Column("partner_payout", sa.Numeric(12, 2), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("released_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(["campaign_id"], ["campaigns.id"], ondelete="CASCADE"),
+    )
+    op.create_index(
+        "ix_budget_leases_campaign_released",
+        "budget_leases",
+        ["campaign_id", "released_at"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_budget_leases_campaign_released", table_name="budget_leases")
+    op.drop_table("budget_leases")
@@ -0,0 +1,37 @@
+"""add shared sliding-window click rate limit counters
+
+Revision ID: 0013_click_rate_limits
+Revises: 0012_budget_leases
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013_click_rate_limits"
+down_revision = "0012_budget_leases"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "click_rate_limits",
+        sa.Column("key", sa.String(length=64), primary_key=True),
+        sa.Column("window_index", sa.BigInteger(), nullable=False),
+        sa.Column("current_count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("previous_count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+    )
+    op.create_index(
+        "ix_click_rate_limits_window_index",
+        "click_rate_limits",
+        ["window_index"],
+    )
+    # Counters only matter for two windows, so skip WAL for them.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE click_rate_limits SET UNLOGGED")
+
+
+def downgrade():
+    op.drop_index("ix_click_rate_limits_window_index", table_name="click_rate_limits")
+    op.drop_table("click_rate_limits")
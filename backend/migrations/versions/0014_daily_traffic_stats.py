@@ -0,0 +1,70 @@
+"""add daily traffic rollups and rollup watermarks
+
+Revision ID: 0014_daily_traffic_stats
+Revises: 0013_click_rate_limits
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0014_daily_traffic_stats"
+down_revision = "0013_click_rate_limits"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_traffic_stats",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("buyer_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("campaign_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("ad_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("partner_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("clicks", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("impressions", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("spend", sa.Numeric(12, 2), server_default=sa.text("0"), nullable=False),
+        sa.Column("earnings", sa.Numeric(12, 2), server_default=sa.text("0"), nullable=False),
+        sa.Column("profit", sa.Numeric(12, 2), server_default=sa.text("0"), nullable=False),
+        sa.UniqueConstraint(
+            "day",
+            "buyer_id",
+            "campaign_id",
+            "ad_id",
+            "partner_id",
+            name="uq_daily_traffic_stat_key",
+        ),
+    )
+    op.create_index("ix_daily_traffic_stats_day", "daily_traffic_stats", ["day"])
+    op.create_index(
+        "ix_daily_traffic_stats_buyer_day", "daily_traffic_stats", ["buyer_id", "day"]
+    )
+    op.create_index(
+        "ix_daily_traffic_stats_partner_day", "daily_traffic_stats", ["partner_id", "day"]
+    )
+    op.create_index(
+        "ix_daily_traffic_stats_campaign_day", "daily_traffic_stats", ["campaign_id", "day"]
+    )
+
+    # Rows are filled by `flask rollups refresh`, starting from event id 0.
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column(
+            "last_event_id", sa.BigInteger(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("rollup_watermarks")
+    op.drop_index("ix_daily_traffic_stats_campaign_day", table_name="daily_traffic_stats")
+    op.drop_index("ix_daily_traffic_stats_partner_day", table_name="daily_traffic_stats")
+    op.drop_index("ix_daily_traffic_stats_buyer_day", table_name="daily_traffic_stats")
+    op.drop_index("ix_daily_traffic_stats_day", table_name="daily_traffic_stats")
+    op.drop_table("daily_traffic_stats")
@@ -0,0 +1,48 @@
+"""add daily click decision rollups
+
+Revision ID: 0015_daily_click_decisions
+Revises: 0014_daily_traffic_stats
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0015_daily_click_decisions"
+down_revision = "0014_daily_traffic_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are filled by `flask rollups refresh`, starting from event id 0.
+    op.create_table(
+        "daily_click_decisions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("partner_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column(
+            "reject_reason", sa.String(length=32), server_default=sa.text("''"), nullable=False
+        ),
+        sa.Column("clicks", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.UniqueConstraint(
+            "day",
+            "partner_id",
+            "status",
+            "reject_reason",
+            name="uq_daily_click_decision_key",
+        ),
+    )
+    op.create_index("ix_daily_click_decisions_day", "daily_click_decisions", ["day"])
+    op.create_index(
+        "ix_daily_click_decisions_partner_day",
+        "daily_click_decisions",
+        ["partner_id", "day"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_daily_click_decisions_partner_day", table_name="daily_click_decisions")
+    op.drop_index("ix_daily_click_decisions_day", table_name="daily_click_decisions")
+    op.drop_table("daily_click_decisions")
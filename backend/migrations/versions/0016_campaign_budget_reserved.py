@@ -0,0 +1,49 @@
+"""keep leased campaign budget out of budget_spent
+
+Revision ID: 0016_campaign_budget_reserved
+Revises: 0015_daily_click_decisions
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0016_campaign_budget_reserved"
+down_revision = "0015_daily_click_decisions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "campaigns",
+        sa.Column(
+            "budget_reserved", sa.Numeric(12, 2), server_default=sa.text("0"), nullable=False
+        ),
+    )
+    # Open leases used to be counted in budget_spent in full; move their
+    # amount to budget_reserved. Their spend is settled when they close.
+    op.execute(
+        """
+        UPDATE campaigns
+        SET budget_reserved = open_leases.amount,
+            budget_spent = campaigns.budget_spent - open_leases.amount
+        FROM (
+            SELECT campaign_id, SUM(amount) AS amount
+            FROM budget_leases
+            WHERE released_at IS NULL
+            GROUP BY campaign_id
+        ) AS open_leases
+        WHERE open_leases.campaign_id = campaigns.id
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+        UPDATE campaigns
+        SET budget_spent = budget_spent + budget_reserved
+        """
+    )
+    op.drop_column("campaigns", "budget_reserved")
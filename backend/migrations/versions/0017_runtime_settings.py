@@ -0,0 +1,30 @@
+"""add shared runtime settings for admin config changes
+
+Revision ID: 0017_runtime_settings
+Revises: 0016_campaign_budget_reserved
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0017_runtime_settings"
+down_revision = "0016_campaign_budget_reserved"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "runtime_settings",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column("version", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("overrides", sa.Text(), server_default=sa.text("'{}'"), nullable=False),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("runtime_settings")
@@ -0,0 +1,24 @@
+"""bound rollup folds by event ids observed a settle window ago
+
+Revision ID: 0018_rollup_watermark_observations
+Revises: 0017_runtime_settings
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0018_rollup_watermark_observations"
+down_revision = "0017_runtime_settings"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("rollup_watermarks", sa.Column("observed_event_id", sa.BigInteger()))
+    op.add_column("rollup_watermarks", sa.Column("observed_at", sa.DateTime()))
+
+
+def downgrade():
+    op.drop_column("rollup_watermarks", "observed_at")
+    op.drop_column("rollup_watermarks", "observed_event_id")
@@ -1,5 +1,7 @@
 import os
+import random
 import sys
+from dataclasses import replace
 from datetime import datetime, timedelta
 from decimal import Decimal
 
@@ -12,9 +14,19 @@ from app.extensions import db
 from app.models.ad import Ad
 from app.models.campaign import Campaign
 from app.models.click_event import ClickEvent
+from app.models.impression_event import ImpressionEvent
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
 from app.models.user import User
+from app.services.market_health import build_market_health_snapshot, get_market_health
+from app.services.matching import AdSlot, select_ad_for_partner, select_ads_for_slots
 from app.services.pricing import compute_partner_payout
+from app.services.scoring import (
+    CandidateSignals,
+    ScoringWeights,
+    rank_scalar,
+    rank_vectorized,
+)
+from app.services.settings import get_matching_config
 
 
 @pytest.fixture()
@@ -301,3 +313,200 @@ def test_delivery_boost_applied(client, app):
     breakdown = response.get_json()["score_breakdown"]
     assert breakdown["delivery_boost_applied"] is True
     assert breakdown["delivery_boost"] == pytest.approx(0.4)
+
+
+def test_ctr_falls_back_to_campaign_history(client, app):
+    with app.app_context():
+        buyer = create_user("buyer@ctr.com", "buyer")
+        create_user("partner@ctr.com", "partner")
+        other = create_user("other@ctr.com", "partner")
+        campaign = create_campaign(buyer.id, "CTR")
+        ad = create_ad(campaign.id, "Ad CTR")
+        now = datetime.utcnow()
+        for index in range(20):
+            db.session.add(
+                ImpressionEvent(
+                    assignment_code=f"other-{index}",
+                    partner_id=other.id,
+                    campaign_id=campaign.id,
+                    ad_id=ad.id,
+                    ip_hash="hash",
+                    status="ACCEPTED",
+                    ts=now,
+                )
+            )
+        for _ in range(4):
+            db.session.add(
+                ClickEvent(
+                    assignment_code="other-0",
+                    partner_id=other.id,
+                    campaign_id=campaign.id,
+                    ad_id=ad.id,
+                    ip_hash="hash",
+                    ua_hash="ua",
+                    status="ACCEPTED",
+                    ts=now,
+                    spend_delta=Decimal("0"),
+                    earnings_delta=Decimal("0"),
+                    profit_delta=Decimal("0"),
+                )
+            )
+        db.session.commit()
+
+    token = login_partner(client, "partner@ctr.com")
+    response = client.get(
+        "/api/partner/ad",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    breakdown = response.get_json()["score_breakdown"]
+    assert breakdown["ctr"] == pytest.approx(round((4 + 1) / (20 + 10), 4))
+
+
+def test_market_health_snapshot_single_statement_values(app):
+    with app.app_context():
+        partner = create_user("partner@snapshot.com", "partner")
+        now = datetime.utcnow()
+        flags = [True, True, False, False, False]
+        for offset, filled in enumerate(flags):
+            db.session.add(
+                PartnerAdRequestEvent(
+                    partner_id=partner.id,
+                    filled=filled,
+                    created_at=now - timedelta(minutes=len(flags) - offset),
+                )
+            )
+        for status, minutes_ago in (("ACCEPTED", 5), ("REJECTED", 5), ("ACCEPTED", 90)):
+            db.session.add(
+                ClickEvent(
+                    assignment_code="snapshot",
+                    partner_id=partner.id,
+                    ip_hash="hash",
+                    status=status,
+                    ts=now - timedelta(minutes=minutes_ago),
+                )
+            )
+        db.session.commit()
+
+        snapshot = build_market_health_snapshot()
+        assert snapshot["fill_rate"] == pytest.approx(2 / 5)
+        assert snapshot["reject_rate"] == pytest.approx(0.5)
+        assert snapshot["reject_volatility"] == pytest.approx(0.5)
+        assert snapshot["unfilled_streak"] == 3
+
+        app.config["MARKET_HEALTH_CACHE_SECONDS"] = 60
+        cached_snapshot, multipliers = get_market_health()
+        db.session.add(PartnerAdRequestEvent(partner_id=partner.id, filled=True))
+        db.session.commit()
+        assert get_market_health()[0] is cached_snapshot
+        assert "market_note" in multipliers
+
+
+def test_vectorized_scorer_matches_scalar_ranking():
+    rng = random.Random(7)
+    weights = ScoringWeights(
+        alpha_profit=1.2,
+        beta_ctr=1.1,
+        gamma_targeting=1.3,
+        ctr_weight=1.0,
+        delta_quality=1.5,
+        partner_reject_rate=0.1,
+        reject_penalty_weight=1.0,
+        reject_lookback_days=7,
+        partner_quality_state="STABLE",
+        partner_quality_note=None,
+        market_note=None,
+    )
+    candidates = []
+    for campaign_id in rng.sample(range(1, 500), 60):
+        # Coarse values so plenty of scores tie and the tie-break decides.
+        candidates.append(
+            CandidateSignals(
+                campaign=type("C", (), {"id": campaign_id})(),
+                ad=type("A", (), {"id": campaign_id * 10})(),
+                expected_profit=rng.choice([0.5, 0.6, 0.9]),
+                ctr=rng.choice([0.01, 0.02]),
+                targeting_bonus=rng.choice([0.0, 0.5]),
+                exploration_applied=False,
+                exploration_bonus=0,
+                exploration_reason=None,
+                delivery_boost=rng.choice([0.0, 0.2]),
+                assignment_count=rng.choice([0, 1, 2]),
+            )
+        )
+
+    for limit in (1, 5, len(candidates)):
+        scalar = rank_scalar(weights, candidates, limit)
+        vectorized = rank_vectorized(weights, candidates, limit)
+        assert [entry.signals.campaign.id for entry in vectorized] == [
+            entry.signals.campaign.id for entry in scalar
+        ]
+        assert [entry.score for entry in vectorized] == [entry.score for entry in scalar]
+        assert [entry.score_breakdown for entry in vectorized] == [
+            entry.score_breakdown for entry in scalar
+        ]
+        assert vectorized[0].explanation == scalar[0].explanation
+        assert len(scalar) == limit
+        assert all(entry.explanation is None for entry in scalar[1:])
+        assert all(entry.explanation is None for entry in vectorized[1:])
+
+
+def test_matching_scorers_select_same_ad(app):
+    with app.app_context():
+        buyer = create_user("buyer@scorer.com", "buyer")
+        partner = create_user("partner@scorer.com", "partner")
+        for index in range(6):
+            campaign = create_campaign(
+                buyer.id,
+                f"Scorer {index}",
+                category="Fitness" if index % 2 else None,
+            )
+            create_ad(campaign.id, f"Ad {index}")
+
+        results = {
+            scorer: select_ad_for_partner(
+                partner.id,
+                category="Fitness",
+                config=replace(
+                    get_matching_config(), scorer=scorer, debug=True, debug_limit=4
+                ),
+            )
+            for scorer in ("scalar", "numpy")
+        }
+
+    scalar, vectorized = results["scalar"], results["numpy"]
+    assert vectorized.ad.id == scalar.ad.id
+    assert vectorized.score_breakdown == scalar.score_breakdown
+    assert vectorized.explanation == scalar.explanation
+    assert vectorized.debug_candidates == scalar.debug_candidates
+    assert len(scalar.debug_candidates) == 4
+
+
+def test_matching_scorers_fill_slots_the_same(app):
+    with app.app_context():
+        buyer = create_user("buyer@slots.com", "buyer")
+        partner = create_user("partner@slots.com", "partner")
+        for index in range(7):
+            campaign = create_campaign(
+                buyer.id,
+                f"Slots {index}",
+                category="Fitness" if index % 3 == 0 else None,
+            )
+            create_ad(campaign.id, f"Ad {index}")
+        slots = [AdSlot(category="Fitness"), AdSlot(), AdSlot(category="Fitness", geo="US")]
+
+        results = {
+            scorer: select_ads_for_slots(
+                partner.id,
+                slots,
+                config=replace(get_matching_config(), scorer=scorer, debug=True, debug_limit=3),
+            )
+            for scorer in ("scalar", "numpy")
+        }
+
+    scalar, vectorized = results["scalar"], results["numpy"]
+    assert [result.ad.id for result in vectorized] == [result.ad.id for result in scalar]
+    assert len({result.campaign.id for result in scalar}) == len(slots)
+    assert [result.debug_candidates for result in vectorized] == [
+        result.debug_candidates for result in scalar
+    ]
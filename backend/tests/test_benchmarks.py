@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from benchmarks import budget_bench, matching_bench, rate_limit_bench
+
+
+def test_matching_bench_reports_per_size(capsys):
+    matching_bench.main(
+        [
+            "--campaigns",
+            "5,10",
+            "--partners",
+            "3",
+            "--history-days",
+            "1",
+            "--requests-per-day",
+            "20",
+            "--requests",
+            "5",
+            "--warmup",
+            "1",
+        ]
+    )
+    report = json.loads(capsys.readouterr().out)
+    assert [result["size"]["campaigns"] for result in report["results"]] == [5, 10]
+    for result in report["results"]:
+        for mode in ("select_ad_for_partner", "route"):
+            stats = result[mode]
+            assert stats["requests"] == 5
+            assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+            assert stats["statements_per_request"] > 0
+            assert stats["rows_scanned_per_request"] is None
+
+
+def test_budget_bench_never_overspends(capsys):
+    budget_bench.main(["--threads", "1,2", "--clicks", "5", "--budget-clicks", "6"])
+    report = json.loads(capsys.readouterr().out)
+    atomic = [result for result in report["results"] if result["strategy"] == "atomic"]
+    assert [result["threads"] for result in atomic] == [1, 2]
+    for result in atomic:
+        assert result["errors"] == 0
+        assert result["accepted"] == min(6, result["clicks"])
+        assert result["spend_matches_accepted"] is True
+        assert result["overspent"] is False
+
+
+def test_rate_limit_bench_reports_each_backend(capsys):
+    rate_limit_bench.main(
+        ["--ips", "50", "--requests", "40", "--database-requests", "10", "--fill-batch", "20"]
+    )
+    report = json.loads(capsys.readouterr().out)
+    assert [result["backend"] for result in report["results"]] == [
+        "memory",
+        "shared",
+        "database",
+    ]
+    for result in report["results"]:
+        assert result["memory_bytes"] > 0
+        assert result["p50_us"] <= result["p95_us"] <= result["p99_us"]
+        assert 0 < result["allowed"] <= result["requests"]
+    assert report["results"][0]["entries"] == 50
@@ -0,0 +1,219 @@
+import multiprocessing
+import os
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.budget_lease import BudgetLease
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.models.user import User
+from app.services.analytics import campaign_event_totals
+from app.services.budget import get_budget_leases, reconcile_budgets, spend_click
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def lease_config(database_url):
+    return {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "JWT_SECRET_KEY": "test-secret",
+        "BUDGET_LEASE_CLICKS": 2,
+        "BUDGET_LEASE_SECONDS": 60,
+        "BUDGET_LEASE_MARGIN_SECONDS": 5,
+        "EXHAUSTED_CAMPAIGN_TTL_SECONDS": 0,
+    }
+
+
+@pytest.fixture()
+def app():
+    app = create_app(lease_config("sqlite:///:memory:"))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def create_campaign(budget_total, buyer_cpc="1.00"):
+    buyer = User(email="buyer@example.com", password_hash="-", role="buyer")
+    partner = User(email="partner@example.com", password_hash="-", role="partner")
+    db.session.add_all([buyer, partner])
+    db.session.flush()
+    campaign = Campaign(
+        buyer_id=buyer.id,
+        name="Leased",
+        status="active",
+        budget_total=Decimal(budget_total),
+        budget_spent=Decimal("0"),
+        buyer_cpc=Decimal(buyer_cpc),
+        partner_payout=Decimal(buyer_cpc) * Decimal("0.7"),
+    )
+    db.session.add(campaign)
+    db.session.flush()
+    ad = Ad(
+        campaign_id=campaign.id,
+        title="Ad",
+        body="Body",
+        image_url="https://example.com/ad.png",
+        destination_url="https://example.com/landing",
+        active=True,
+    )
+    db.session.add(ad)
+    db.session.commit()
+    return partner.id, campaign.id, ad.id
+
+
+def click(partner_id, campaign_id, ad_id, code):
+    result = spend_click(campaign_id)
+    db.session.add(
+        ClickEvent(
+            assignment_code=code,
+            partner_id=partner_id,
+            campaign_id=campaign_id,
+            ad_id=ad_id,
+            ip_hash="test",
+            status=result.status,
+            reject_reason=result.reject_reason,
+            spend_delta=result.spend_delta,
+            earnings_delta=result.earnings_delta,
+            profit_delta=result.profit_delta,
+        )
+    )
+    db.session.commit()
+    return result
+
+
+def test_clicks_spend_from_leases_and_reconcile(app):
+    partner_id, campaign_id, ad_id = create_campaign("5.00")
+
+    statuses = [click(partner_id, campaign_id, ad_id, f"c{index}").status for index in range(3)]
+    assert statuses == ["ACCEPTED"] * 3
+    campaign = db.session.get(Campaign, campaign_id)
+    # The first slice is used up and settled; the second is open with one
+    # click charged to it. Reserved budget is not counted as spent.
+    assert campaign.budget_spent == Decimal("2.00")
+    assert campaign.budget_reserved == Decimal("2.00")
+    assert BudgetLease.query.filter(BudgetLease.released_at.is_(None)).count() == 1
+    assert campaign_event_totals([campaign_id])[campaign_id]["budget_spent"] == 3.0
+    assert reconcile_budgets()["corrected_campaigns"] == []
+
+    # Only one click's worth is left, which no longer fits a slice.
+    assert click(partner_id, campaign_id, ad_id, "c3").status == "ACCEPTED"
+    assert click(partner_id, campaign_id, ad_id, "c4").status == "ACCEPTED"
+    assert click(partner_id, campaign_id, ad_id, "c5").reject_reason == "BUDGET_EXHAUSTED"
+    db.session.expire_all()
+    campaign = db.session.get(Campaign, campaign_id)
+    assert campaign.budget_spent == Decimal("5.00")
+    assert campaign.budget_reserved == Decimal("0.00")
+    assert campaign.status == "paused"
+
+    get_budget_leases().release_all()
+    db.session.expire_all()
+    assert db.session.get(Campaign, campaign_id).budget_spent == Decimal("5.00")
+    assert BudgetLease.query.filter(BudgetLease.released_at.is_(None)).count() == 0
+
+
+def test_reconcile_reclaims_expired_leases_and_fixes_drift(app):
+    partner_id, campaign_id, ad_id = create_campaign("10.00")
+    click(partner_id, campaign_id, ad_id, "c0")
+    # The worker dies holding the lease; nothing returns it.
+    get_budget_leases().pop(campaign_id)
+    lease = BudgetLease.query.one()
+    lease.expires_at = datetime.utcnow() - timedelta(minutes=5)
+    db.session.commit()
+
+    report = reconcile_budgets(grace_seconds=30)
+    assert report["reclaimed_leases"] == 1
+    assert report["corrected_campaigns"] == []
+    assert db.session.get(Campaign, campaign_id).budget_spent == Decimal("1.00")
+
+    Campaign.query.filter_by(id=campaign_id).update({"budget_spent": Decimal("7.00")})
+    db.session.commit()
+    report = reconcile_budgets()
+    assert [row["campaign_id"] for row in report["corrected_campaigns"]] == [campaign_id]
+    db.session.expire_all()
+    assert db.session.get(Campaign, campaign_id).budget_spent == Decimal("1.00")
+
+
+def test_reconcile_keeps_spend_committed_after_its_snapshot(app):
+    partner_id, campaign_id, ad_id = create_campaign("10.00")
+    app.config["BUDGET_LEASE_CLICKS"] = 0
+    click(partner_id, campaign_id, ad_id, "c0")
+    Campaign.query.filter_by(id=campaign_id).update({"budget_spent": Decimal("4.00")})
+    db.session.commit()
+
+    landed = []
+
+    def click_lands(conn, cursor, statement, parameters, context, executemany):
+        # Another worker charges a click right after the drift is measured.
+        if "expected_spent" in statement and not landed:
+            landed.append(True)
+            conn.exec_driver_sql(
+                "UPDATE campaigns SET budget_spent = budget_spent + 1 WHERE id = ?",
+                (campaign_id,),
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO click_events (assignment_code, partner_id, campaign_id, ad_id,"
+                " ts, ip_hash, status, spend_delta, earnings_delta, profit_delta)"
+                " VALUES ('c1', ?, ?, ?, CURRENT_TIMESTAMP, 'test', 'ACCEPTED', 1, 0.7, 0.3)",
+                (partner_id, campaign_id, ad_id),
+            )
+
+    event.listen(db.engine, "after_cursor_execute", click_lands)
+    try:
+        report = reconcile_budgets()
+    finally:
+        event.remove(db.engine, "after_cursor_execute", click_lands)
+    assert report["corrected_campaigns"][0]["expected"] == "1.00"
+    db.session.expire_all()
+    assert db.session.get(Campaign, campaign_id).budget_spent == Decimal("2.00")
+    assert reconcile_budgets()["corrected_campaigns"] == []
+
+
+def _click_worker(database_url, campaign, clicks, worker_index):
+    app = create_app(lease_config(database_url))
+    partner_id, campaign_id, ad_id = campaign
+    accepted = 0
+    with app.app_context():
+        for index in range(clicks):
+            result = click(partner_id, campaign_id, ad_id, f"w{worker_index}-{index}")
+            accepted += result.status == "ACCEPTED"
+        get_budget_leases().release_all()
+        db.session.remove()
+    return accepted
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to a scratch database")
+def test_leases_never_overspend_across_processes():
+    app = create_app(lease_config(POSTGRES_URL))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        campaign = create_campaign("50.00")
+        db.session.remove()
+
+    workers, clicks = 4, 25
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        accepted = pool.starmap(
+            _click_worker,
+            [(POSTGRES_URL, campaign, clicks, index) for index in range(workers)],
+        )
+
+    with app.app_context():
+        spent = db.session.get(Campaign, campaign[1]).budget_spent
+        assert spent <= Decimal("50.00")
+        assert spent == Decimal("1.00") * sum(accepted)
+        assert ClickEvent.query.filter_by(status="ACCEPTED").count() == sum(accepted)
+        assert reconcile_budgets()["corrected_campaigns"] == []
+        db.session.remove()
+        db.drop_all()
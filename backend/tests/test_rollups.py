@@ -0,0 +1,456 @@
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models.ad import Ad
+from app.models.campaign import Campaign
+from app.models.click_event import ClickEvent
+from app.models.daily_click_decision import DailyClickDecision
+from app.models.daily_traffic_stat import DailyTrafficStat
+from app.models.impression_event import ImpressionEvent
+from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.models.user import User
+from app.services.analytics import (
+    admin_daily_metrics,
+    admin_marketplace_health,
+    admin_risk_series,
+    admin_risk_summary,
+    admin_risk_top_partners,
+    buyer_campaign_table,
+    buyer_daily_metrics,
+    buyer_request_stats,
+    partner_daily_metrics,
+    partner_quality_summary,
+    partner_top_ads,
+    unfilled_request_signatures,
+)
+from app.services.rollups import refresh_daily_traffic_stats, refresh_rollups
+
+
+@pytest.fixture()
+def app():
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "JWT_SECRET_KEY": "test-secret",
+            "ROLLUP_SETTLE_SECONDS": 0,
+            "ROLLUP_BATCH_SIZE": 3,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def create_marketplace():
+    buyers = [
+        User(email=f"buyer{index}@example.com", password_hash="-", role="buyer")
+        for index in range(2)
+    ]
+    partner = User(email="partner@example.com", password_hash="-", role="partner")
+    db.session.add_all([*buyers, partner])
+    db.session.flush()
+    ads = []
+    for buyer in buyers:
+        campaign = Campaign(
+            buyer_id=buyer.id,
+            name=f"Campaign {buyer.id}",
+            status="active",
+            budget_total=Decimal("100.00"),
+            budget_spent=Decimal("0"),
+            buyer_cpc=Decimal("1.00"),
+            partner_payout=Decimal("0.70"),
+        )
+        db.session.add(campaign)
+        db.session.flush()
+        ad = Ad(
+            campaign_id=campaign.id,
+            title="Ad",
+            body="Body",
+            image_url="https://example.com/ad.png",
+            destination_url="https://example.com/landing",
+            active=True,
+        )
+        db.session.add(ad)
+        db.session.flush()
+        ads.append(ad)
+    db.session.commit()
+    return [buyer.id for buyer in buyers], partner.id, ads
+
+
+def add_traffic(
+    partner_id, ad, day, accepted=2, rejected=1, impressions=3, reason="RATE_LIMIT"
+):
+    ts = datetime.combine(day, time(12, 0))
+    for index in range(accepted + rejected):
+        is_accepted = index < accepted
+        db.session.add(
+            ClickEvent(
+                assignment_code="code",
+                partner_id=partner_id,
+                campaign_id=ad.campaign_id,
+                ad_id=ad.id,
+                ts=ts,
+                ip_hash="ip",
+                status="ACCEPTED" if is_accepted else "REJECTED",
+                reject_reason=None if is_accepted else reason,
+                spend_delta=Decimal("1.00") if is_accepted else Decimal("0"),
+                earnings_delta=Decimal("0.70") if is_accepted else Decimal("0"),
+                profit_delta=Decimal("0.30") if is_accepted else Decimal("0"),
+            )
+        )
+    for _ in range(impressions):
+        db.session.add(
+            ImpressionEvent(
+                assignment_code="code",
+                partner_id=partner_id,
+                campaign_id=ad.campaign_id,
+                ad_id=ad.id,
+                ts=ts,
+                ip_hash="ip",
+                status="ACCEPTED",
+            )
+        )
+    db.session.commit()
+
+
+def all_series(buyer_ids, partner_id):
+    return {
+        "admin": admin_daily_metrics(days=30),
+        "buyers": [buyer_daily_metrics(buyer_id) for buyer_id in buyer_ids],
+        "partner": partner_daily_metrics(partner_id),
+    }
+
+
+def test_daily_series_match_raw_events_across_refreshes(app):
+    buyer_ids, partner_id, ads = create_marketplace()
+    today = date.today()
+    for offset in (20, 3, 1):
+        add_traffic(partner_id, ads[0], today - timedelta(days=offset))
+    add_traffic(partner_id, ads[1], today - timedelta(days=3), accepted=1, impressions=5)
+    raw = all_series(buyer_ids, partner_id)
+
+    report = refresh_daily_traffic_stats()
+    assert report["clicks"]["to_id"] == ClickEvent.query.count()
+    assert report["impressions"]["to_id"] == ImpressionEvent.query.count()
+    assert DailyTrafficStat.query.count() == 4
+    assert all_series(buyer_ids, partner_id) == raw
+
+    # Today's traffic is not folded yet and is read from the event tables.
+    add_traffic(partner_id, ads[1], today, accepted=4, impressions=2)
+    topped_up = all_series(buyer_ids, partner_id)
+    assert topped_up["admin"][-1]["clicks"] == 4
+    assert topped_up["buyers"][1][-1]["spend"] == 4.0
+    assert topped_up["partner"][-1]["impressions"] == 2
+
+    refresh_daily_traffic_stats()
+    assert all_series(buyer_ids, partner_id) == topped_up
+    # Nothing new to fold: the watermark makes reruns no-ops.
+    assert refresh_daily_traffic_stats()["clicks"]["rows"] == 0
+    assert all_series(buyer_ids, partner_id) == topped_up
+
+
+def test_refresh_leaves_unsettled_events_and_cli_reports(app):
+    _, partner_id, ads = create_marketplace()
+    add_traffic(partner_id, ads[0], date.today() - timedelta(days=1))
+
+    report = refresh_daily_traffic_stats(settle_seconds=10 * 24 * 3600)
+    assert report["clicks"] == {"from_id": 0, "to_id": 0, "rows": 0}
+
+    result = app.test_cli_runner().invoke(args=["rollups", "refresh", "--settle-seconds", "0"])
+    assert result.exit_code == 0
+    assert '"to_id": 3' in result.output
+    assert db.session.query(db.func.sum(DailyTrafficStat.clicks)).scalar() == 2
+
+
+
+def test_refresh_waits_for_ids_committed_out_of_order(app):
+    _, partner_id, ads = create_marketplace()
+    old = datetime.combine(date.today() - timedelta(days=2), time(12, 0))
+
+    def click(event_id):
+        return ClickEvent(
+            id=event_id,
+            assignment_code="code",
+            partner_id=partner_id,
+            campaign_id=ads[0].campaign_id,
+            ad_id=ads[0].id,
+            ts=old,
+            ip_hash="ip",
+            status="ACCEPTED",
+            spend_delta=Decimal("1.00"),
+            earnings_delta=Decimal("0.70"),
+            profit_delta=Decimal("0.30"),
+        )
+
+    # Id 2 was handed out to a transaction that has not committed yet.
+    db.session.add_all([click(1), click(3)])
+    db.session.commit()
+    now = datetime.utcnow()
+    report = refresh_daily_traffic_stats(settle_seconds=60, now=now)
+    assert report["clicks"]["to_id"] == 0
+
+    db.session.add(click(2))
+    db.session.commit()
+    assert refresh_daily_traffic_stats(settle_seconds=60, now=now + timedelta(seconds=30))[
+        "clicks"
+    ]["to_id"] == 0
+    report = refresh_daily_traffic_stats(settle_seconds=60, now=now + timedelta(seconds=61))
+    assert report["clicks"]["to_id"] == 3
+    assert db.session.query(db.func.sum(DailyTrafficStat.clicks)).scalar() == 3
+
+def risk_views(partner_id, today):
+    start = today - timedelta(days=13)
+    return {
+        "summary": admin_risk_summary(),
+        "recent_summary": admin_risk_summary(start_date=today - timedelta(days=2)),
+        "partner_summary": admin_risk_summary(partner_id=partner_id),
+        "series": admin_risk_series(start, today),
+        "duplicate_series": admin_risk_series(start, today, reject_reason="DUPLICATE_CLICK"),
+        "top_partners": admin_risk_top_partners(),
+        "top_by_reason": admin_risk_top_partners(reject_reason="DUPLICATE_CLICK"),
+    }
+
+
+def test_risk_views_read_click_decision_rollups(app):
+    _, partner_id, ads = create_marketplace()
+    other = User(email="other@example.com", password_hash="-", role="partner")
+    db.session.add(other)
+    db.session.commit()
+    today = date.today()
+    add_traffic(partner_id, ads[0], today - timedelta(days=5), rejected=3)
+    add_traffic(partner_id, ads[1], today - timedelta(days=1), reason="DUPLICATE_CLICK")
+    add_traffic(other.id, ads[0], today - timedelta(days=1), accepted=1, rejected=2)
+    add_traffic(None, ads[0], today - timedelta(days=1), accepted=0, rejected=1, reason=None)
+    raw = risk_views(partner_id, today)
+
+    assert raw["summary"]["totals"] == {
+        "accepted": 5,
+        "rejected": 7,
+        "total": 12,
+        "rejection_rate": 7 / 12,
+    }
+    assert raw["summary"]["top_reasons"] == [
+        {"reason": "RATE_LIMIT", "count": 5},
+        {"reason": "DUPLICATE_CLICK", "count": 1},
+        {"reason": "UNKNOWN", "count": 1},
+    ]
+    assert raw["recent_summary"]["totals"]["total"] == 7
+    assert raw["partner_summary"]["totals"]["rejected"] == 4
+    assert raw["series"][-2] == {
+        "date": (today - timedelta(days=1)).isoformat(),
+        "accepted": 3,
+        "rejected": 4,
+    }
+    assert sum(day["rejected"] for day in raw["duplicate_series"]) == 1
+    assert [row["id"] for row in raw["top_partners"]] == [partner_id, other.id]
+    assert raw["top_by_reason"][0] == {
+        "id": partner_id,
+        "email": "partner@example.com",
+        "rejected": 1,
+        "total": 8,
+        "rejection_rate": 1 / 8,
+    }
+
+    refresh_rollups()
+    assert DailyClickDecision.query.count() == 7
+    assert risk_views(partner_id, today) == raw
+
+    # Clicks past the watermark are added on top of the rollups.
+    add_traffic(other.id, ads[0], today, accepted=0, rejected=5, reason="DUPLICATE_CLICK")
+    topped_up = risk_views(partner_id, today)
+    assert topped_up["summary"]["totals"]["rejected"] == 12
+    assert topped_up["top_by_reason"][0]["id"] == other.id
+    refresh_rollups()
+    assert risk_views(partner_id, today) == topped_up
+
+
+
+def test_risk_top_partners_fill_the_limit_past_partners_without_users(app):
+    _, partner_id, ads = create_marketplace()
+    today = date.today()
+    add_traffic(partner_id, ads[0], today, rejected=1)
+    # Clicks attributed to a partner id with no user row rank first.
+    add_traffic(partner_id + 100, ads[0], today, rejected=5)
+
+    top = admin_risk_top_partners(limit=1)
+    assert [row["id"] for row in top] == [partner_id]
+
+def count_statements(func, *args):
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before)
+    try:
+        result = func(*args)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before)
+    return result, len(statements)
+
+
+def test_campaign_tables_use_a_constant_number_of_queries(app):
+    buyer_ids, partner_id, ads = create_marketplace()
+    others = [
+        User(email=f"partner{index}@example.com", password_hash="-", role="partner")
+        for index in range(3)
+    ]
+    db.session.add_all(others)
+    db.session.commit()
+    today = date.today()
+    add_traffic(partner_id, ads[0], today, accepted=3, impressions=4)
+    for index, other in enumerate(others):
+        add_traffic(other.id, ads[0], today, accepted=index + 1, impressions=1)
+    add_traffic(partner_id, ads[1], today, accepted=1, impressions=0)
+
+    table, small_queries = count_statements(buyer_campaign_table, buyer_ids[0])
+    assert table == [
+        {
+            "id": ads[0].campaign_id,
+            "name": f"Campaign {buyer_ids[0]}",
+            "status": "active",
+            "spend": 9.0,
+            "clicks": 9,
+            "impressions": 7,
+            "ctr": 9 / 7,
+            "budget_remaining": 100.0,
+            "top_partners": [
+                {"id": partner_id, "email": "partner@example.com", "clicks": 3},
+                {"id": others[2].id, "email": "partner2@example.com", "clicks": 3},
+                {"id": others[1].id, "email": "partner1@example.com", "clicks": 2},
+            ],
+        }
+    ]
+    top_ads, _ = count_statements(partner_top_ads, partner_id)
+    assert [(ad["id"], ad["clicks"], ad["ctr"]) for ad in top_ads] == [
+        (ads[0].id, 3, 3 / 4),
+        (ads[1].id, 1, 0),
+    ]
+
+    for index in range(20):
+        campaign = Campaign(
+            buyer_id=buyer_ids[0],
+            name=f"Extra {index}",
+            status="paused",
+            budget_total=Decimal("10.00"),
+            budget_spent=Decimal("0"),
+            buyer_cpc=Decimal("1.00"),
+            partner_payout=Decimal("0.70"),
+        )
+        db.session.add(campaign)
+    db.session.commit()
+    table, large_queries = count_statements(buyer_campaign_table, buyer_ids[0])
+    assert len(table) == 21
+    assert table[-1]["clicks"] == 9
+    assert table[0]["top_partners"] == [] and table[0]["impressions"] == 0
+    assert large_queries == small_queries <= 3
+
+
+def test_buyer_request_stats_match_unfilled_signatures(app):
+    buyer_ids, partner_id, ads = create_marketplace()
+    first, second = (db.session.get(Campaign, ad.campaign_id) for ad in ads)
+    first.targeting_geo = "US"
+    first.targeting_device = "mobile"
+    second.targeting_category = "news"
+    second.targeting_placement = ""
+    db.session.commit()
+
+    signatures = [
+        # (category, geo, device, placement), unfilled requests
+        (("news", "US", "mobile", "top"), 3),
+        (("sports", "US", None, None), 2),
+        (("news", "CA", "desktop", "side"), 7),
+        (("sports", "DE", "mobile", ""), 5),
+    ]
+    for (category, geo, device, placement), count in signatures:
+        for _ in range(count):
+            db.session.add(
+                PartnerAdRequestEvent(
+                    partner_id=partner_id,
+                    category=category,
+                    geo=geo,
+                    device=device,
+                    placement=placement,
+                    filled=False,
+                )
+            )
+    db.session.add(
+        PartnerAdRequestEvent(
+            partner_id=partner_id, filled=True, campaign_id=first.id, ad_id=ads[0].id
+        )
+    )
+    db.session.commit()
+
+    assert set(unfilled_request_signatures()) == set(signatures)
+    # The first campaign serves US mobile (or unknown) traffic, the second any news.
+    assert buyer_request_stats(buyer_ids[0]) == {
+        "fill_rate": 1 / 6,
+        "total_requests": 6,
+        "filled_requests": 1,
+    }
+    assert buyer_request_stats(buyer_ids[1])["total_requests"] == 10
+
+    first.status = "paused"
+    db.session.commit()
+    health = admin_marketplace_health()
+    assert [
+        (row["id"], row["fill_rate"], row["status"])
+        for row in health["top_under_delivering_buyers"]
+    ] == [(buyer_ids[0], 0, "ON_TRACK"), (buyer_ids[1], 0, "UNDER_DELIVERING")]
+
+
+def test_marketplace_health_is_bulk_and_optionally_cached(app):
+    buyer_ids, partner_id, ads = create_marketplace()
+    partners = [
+        User(email=f"partner{index}@example.com", password_hash="-", role="partner")
+        for index in range(6)
+    ]
+    db.session.add_all(partners)
+    db.session.commit()
+    today = date.today()
+    for index, partner in enumerate(partners):
+        add_traffic(partner.id, ads[index % 2], today, accepted=3, rejected=index, impressions=4)
+
+    admin_marketplace_health()
+    health, queries = count_statements(admin_marketplace_health)
+    expected = sorted(
+        (
+            {
+                "id": user.id,
+                "email": user.email,
+                "rejection_rate": summary["rejection_rate"],
+                "ctr": summary["ctr"],
+            }
+            for user in User.query.filter_by(role="partner").order_by(User.id)
+            for summary in [partner_quality_summary(user.id)]
+        ),
+        key=lambda item: (-item["rejection_rate"], item["ctr"]),
+    )
+    assert health["top_low_quality_partners"] == expected[:5]
+    assert health["top_low_quality_partners"][0]["id"] == partners[-1].id
+    assert health["reject_rate"] == 15 / 33
+    assert [row["clicks"] for row in health["top_under_delivering_buyers"]] == [9, 9]
+
+    db.session.add_all(
+        User(email=f"idle{index}@example.com", password_hash="-", role="partner")
+        for index in range(20)
+    )
+    db.session.commit()
+    _, more_partner_queries = count_statements(admin_marketplace_health)
+    assert more_partner_queries == queries <= 10
+
+    app.config["ADMIN_HEALTH_CACHE_SECONDS"] = 60
+    cached = admin_marketplace_health()
+    add_traffic(partner_id, ads[0], today, accepted=0, rejected=5)
+    assert count_statements(admin_marketplace_health) == (cached, 0)
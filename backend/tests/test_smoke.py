@@ -1,5 +1,8 @@
+import json
 import os
 import sys
+import time
+from datetime import datetime, timedelta
 from decimal import Decimal
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -12,10 +15,40 @@ from app.models.ad import Ad
 from app.models.assignment import AdAssignment
 from app.models.campaign import Campaign
 from app.models.click_event import ClickEvent
+from app.models.engagement_counter import EngagementCounter
 from app.models.impression_event import ImpressionEvent
+from app.models.partner_ad_exposure import PartnerAdExposure
 from app.models.partner_ad_request_event import PartnerAdRequestEvent
+from app.models.partner_quality import PartnerQualityBucket
+from app.models.runtime_settings import RuntimeSettings
 from app.models.user import User
+from app.services.assignment_cache import get_assignment_cache
+from app.services.assignment_codes import verify_code
+from app.services.budget import get_exhausted_campaigns
+from app.services.campaign_index import get_campaign_index
+from app.services.dedup import (
+    DedupWindow,
+    KeyValueDedupStore,
+    MemoryDedupStore,
+    get_dedup_window,
+)
+from app.services.event_buffer import EventBuffer, get_event_buffer
+from app.services.frequency_cap import (
+    DatabaseFrequencyCapStore,
+    LocalKeyValueClient,
+    MemoryFrequencyCapStore,
+    get_frequency_cap_store,
+)
+from app.services.heavy_hitters import (
+    HeavyHitterWindow,
+    heavy_hitter_worker_threshold,
+    is_heavy_hitter,
+)
+from app.services.partner_quality import partner_click_totals, partner_reject_rate
 from app.services.pricing import compute_partner_payout
+from app.services.rate_limit import MemoryRateLimiter, get_rate_limiter
+from app.services.settings import CompiledSettings, get_matching_config, sync_shared_settings
+from app.services.validation import hash_value
 
 
 @pytest.fixture()
@@ -397,6 +430,13 @@ def test_campaign_pricing_computed(client):
     assert updated["max_cpc"] == 4.0
     assert updated["partner_payout"] == 2.8
 
+    listing = client.get(
+        "/api/buyer/campaigns", headers={"Authorization": f"Bearer {token}"}
+    ).get_json()
+    assert listing["meta"]["total"] == 1
+    assert listing["campaigns"][0]["delivery_status"] == "ON_TRACK"
+    assert listing["campaigns"][0]["ctr"] == 0
+
 
 def test_pricing_formula_values(app):
     with app.app_context():
@@ -548,3 +588,799 @@ def test_partner_analytics_request_counters(client, app):
     assert "filled_requests" in payload
     assert "unfilled_requests" in payload
     assert "fill_rate" in payload
+
+
+def test_paused_campaign_drops_out_of_index(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        create_ad(campaign.id)
+        campaign_id = campaign.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    token = login.get_json()["access_token"]
+
+    first = client.get("/api/partner/ad", headers={"Authorization": f"Bearer {token}"})
+    assert first.get_json()["filled"] is True
+
+    with app.app_context():
+        db.session.get(Campaign, campaign_id).status = "paused"
+        db.session.commit()
+
+    second = client.get("/api/partner/ad", headers={"Authorization": f"Bearer {token}"})
+    assert second.get_json()["filled"] is False
+    assert second.get_json()["reason"] == "NO_ELIGIBLE_ADS"
+
+
+@pytest.mark.parametrize("scorer", ["scalar", "numpy"])
+def test_selection_skips_campaigns_exhausted_since_the_index_was_built(client, app, scorer):
+    app.config["MATCHING_SCORER"] = scorer
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        rich = create_campaign(buyer.id, "3.00", "100.00")
+        create_ad(rich.id)
+        other = create_campaign(buyer.id, "1.00", "100.00")
+        create_ad(other.id)
+        rich_id, other_id = rich.id, other.id
+        assert rich_id in get_campaign_index().campaigns
+
+        # Spent by another worker: a Core write does not invalidate this
+        # worker's index, which still lists the campaign until its TTL runs out.
+        table = Campaign.__table__
+        db.session.execute(
+            table.update().where(table.c.id == rich_id).values(budget_spent=table.c.budget_total)
+        )
+        db.session.commit()
+        assert rich_id in get_campaign_index().campaigns
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    headers = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+    served = client.get("/api/partner/ad", headers=headers).get_json()
+    assert served["filled"] is True
+    with app.app_context():
+        assert AdAssignment.query.order_by(AdAssignment.id.desc()).first().campaign_id == other_id
+        assert rich_id in get_exhausted_campaigns()
+
+
+def test_campaign_index_targeting_intersection(app):
+    with app.app_context():
+        buyer, _, _ = create_users()
+        broad = create_campaign(buyer.id, "2.00", "100.00")
+        create_ad(broad.id)
+        fitness = create_campaign(buyer.id, "2.00", "100.00")
+        fitness.targeting_category = "Fitness"
+        fitness.targeting_geo = "US"
+        db.session.commit()
+        create_ad(fitness.id)
+        exhausted = create_campaign(buyer.id, "2.00", "1.00")
+        create_ad(exhausted.id)
+
+        index = get_campaign_index()
+        assert index.candidate_ids() == [broad.id, fitness.id]
+        assert index.candidate_ids(category="Fitness", geo="US") == [broad.id, fitness.id]
+        assert index.candidate_ids(category="Fitness", geo="CA") == [broad.id]
+        assert index.candidate_ids(category="Travel") == [broad.id]
+
+
+def test_click_decisions_update_partner_quality_buckets(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.50", "100.00")
+        ad = create_ad(campaign.id)
+        create_assignment("qualitycode", partner.id, campaign.id, ad.id)
+        partner_id = partner.id
+
+    headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.6"}
+    client.get("/t/qualitycode", headers=headers)
+    client.get("/t/qualitycode", headers=headers)
+
+    with app.app_context():
+        buckets = PartnerQualityBucket.query.filter_by(partner_id=partner_id).all()
+        assert len(buckets) == 1
+        assert (buckets[0].accepted, buckets[0].rejected) == (1, 1)
+        assert partner_click_totals(partner_id) == (1, 1)
+        assert partner_reject_rate(partner_id, 7) == pytest.approx(0.5)
+
+
+def test_serve_and_tracking_update_engagement_counters(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        partner_id, campaign_id, ad_id = partner.id, campaign.id, ad.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    token = login.get_json()["access_token"]
+    served = client.get("/api/partner/ad", headers={"Authorization": f"Bearer {token}"})
+    code = served.get_json()["assignment_code"]
+    unfilled = client.get("/api/partner/ad", headers={"Authorization": f"Bearer {token}"})
+    assert unfilled.get_json()["filled"] is False
+
+    headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.7"}
+    client.post(f"/api/track/impression?code={code}", headers=headers)
+    client.post(f"/api/track/impression?code={code}", headers=headers)
+    client.get(f"/t/{code}", headers=headers)
+
+    with app.app_context():
+        attributed = EngagementCounter.query.filter_by(
+            partner_id=partner_id, campaign_id=campaign_id, ad_id=ad_id
+        ).one()
+        assert attributed.filled_requests == 1
+        assert attributed.impressions == 1
+        assert attributed.accepted_clicks == 1
+        unattributed = EngagementCounter.query.filter_by(
+            partner_id=partner_id, campaign_id=0, ad_id=0
+        ).one()
+        assert unattributed.unfilled_requests == 1
+
+
+@pytest.mark.parametrize("backend", ["database", "memory", "kv"])
+def test_frequency_cap_backends_block_repeat(client, app, backend):
+    app.config["FREQ_CAP_BACKEND"] = backend
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        partner_id, ad_id = partner.id, ad.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    token = login.get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/partner/ad", headers=headers).get_json()["filled"] is True
+    second = client.get("/api/partner/ad", headers=headers).get_json()
+    assert second["filled"] is False
+    assert second["reason"] == "FREQ_CAP"
+
+    with app.app_context():
+        store = get_frequency_cap_store()
+        assert store.capped_ad_ids(partner_id, [ad_id, ad_id + 1], 60) == {ad_id}
+        assert store.capped_ad_ids(partner_id + 1, [ad_id], 60) == set()
+
+
+def test_frequency_cap_stores_expire_entries(app):
+    memory = MemoryFrequencyCapStore(max_entries=2)
+    for ad_id in (1, 2, 3):
+        memory.mark_served(7, ad_id, 60)
+    assert len(memory) == 2
+    assert memory.capped_ad_ids(7, [1, 2, 3], 60) == {2, 3}
+
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        store = DatabaseFrequencyCapStore()
+        store.mark_served(partner.id, ad.id, 60)
+        store.mark_served(partner.id, ad.id, 60)
+        db.session.commit()
+        assert PartnerAdExposure.query.count() == 1
+
+        exposure = PartnerAdExposure.query.one()
+        exposure.last_served_at = datetime.utcnow() - timedelta(seconds=61)
+        db.session.commit()
+        assert store.capped_ad_ids(partner.id, [ad.id], 60) == set()
+        assert store.purge_expired(60) == 1
+        db.session.commit()
+        assert PartnerAdExposure.query.count() == 0
+
+
+def test_batch_ad_request_fills_distinct_campaigns(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        for _ in range(3):
+            campaign = create_campaign(buyer.id, "2.00", "100.00")
+            create_ad(campaign.id)
+        partner_id = partner.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    headers = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+    slots = [
+        {"placement": "header"},
+        {"placement": "sidebar", "device": "mobile"},
+        {"placement": "footer"},
+        {"placement": "inline"},
+    ]
+
+    response = client.post("/api/partner/ads/batch", json={"slots": slots}, headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()["slots"]
+    assert [result["filled"] for result in results] == [True, True, True, False]
+    assert results[3]["reason"] == "NO_ELIGIBLE_ADS"
+    assert len({result["campaign"]["id"] for result in results[:3]}) == 3
+
+    with app.app_context():
+        assert AdAssignment.query.filter_by(partner_id=partner_id).count() == 3
+        assignment = AdAssignment.query.filter_by(code=results[1]["assignment_code"]).one()
+        assert assignment.placement == "sidebar"
+        assert assignment.device == "mobile"
+        assert PartnerAdRequestEvent.query.filter_by(partner_id=partner_id).count() == 4
+        assert PartnerAdExposure.query.filter_by(partner_id=partner_id).count() == 3
+        counters = EngagementCounter.query.filter_by(partner_id=partner_id).all()
+        assert sum(row.filled_requests for row in counters) == 3
+        assert sum(row.unfilled_requests for row in counters) == 1
+
+    repeat = client.post("/api/partner/ads/batch", json={"slots": slots[:1]}, headers=headers)
+    assert repeat.get_json()["slots"][0]["reason"] == "FREQ_CAP"
+
+    invalid = client.post("/api/partner/ads/batch", json={"slots": []}, headers=headers)
+    assert invalid.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "override",
+    [
+        {"MATCHING_SCORER": "bogus"},
+        {"HEAVY_HITTER_REJECT_DIMENSIONS": "ip,country"},
+        {"HEAVY_HITTER_WORKERS": 0},
+        {"CAMPAIGN_INDEX_TTL_SECONDS": -1},
+    ],
+)
+def test_invalid_matching_config_fails_at_startup(override):
+    with pytest.raises(ValueError):
+        create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                **override,
+            }
+        )
+
+
+def test_admin_config_hot_swap(client, app):
+    with app.app_context():
+        buyer, partner, admin = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        create_ad(campaign.id)
+
+    def token_for(email):
+        login = client.post("/api/auth/login", json={"email": email, "password": "pass"})
+        return {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+
+    admin_headers = token_for("admin@example.com")
+    partner_headers = token_for("partner@example.com")
+
+    denied = client.put(
+        "/api/admin/config",
+        json={"matching": {"freq_cap_seconds": 0}},
+        headers=partner_headers,
+    )
+    assert denied.status_code == 403
+
+    invalid = client.put(
+        "/api/admin/config",
+        json={"matching": {"exploration_rate": 2}},
+        headers=admin_headers,
+    )
+    assert invalid.status_code == 400
+    unknown = client.put(
+        "/api/admin/config",
+        json={"matching": {"no_such_setting": 1}},
+        headers=admin_headers,
+    )
+    assert unknown.status_code == 400
+
+    swapped = client.put(
+        "/api/admin/config",
+        json={"matching": {"freq_cap_seconds": 0}, "pricing": {"platform_fee_percent": 50}},
+        headers=admin_headers,
+    )
+    assert swapped.status_code == 200
+    assert swapped.get_json()["matching"]["freq_cap_seconds"] == 0
+    assert swapped.get_json()["pricing"]["platform_fee_percent"] == 50.0
+
+    with app.app_context():
+        assert get_matching_config().freq_cap_seconds == 0
+        assert compute_partner_payout(Decimal("2.00")) == Decimal("1.00")
+
+    for _ in range(2):
+        served = client.get("/api/partner/ad", headers=partner_headers)
+        assert served.get_json()["filled"] is True
+
+
+def test_shared_settings_poll_skips_health_and_survives_database_errors(client, app):
+    assert client.get("/api/health").status_code == 200
+    assert app.extensions["settings"].checked_at is None
+
+    with app.app_context():
+        RuntimeSettings.__table__.drop(db.engine)
+        sync_shared_settings(force=True)
+        assert get_matching_config().freq_cap_seconds == 60
+        RuntimeSettings.__table__.create(db.engine)
+
+def test_admin_config_reaches_other_workers(client, app):
+    with app.app_context():
+        create_users()
+    login = client.post("/api/auth/login", json={"email": "admin@example.com", "password": "pass"})
+    admin_headers = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+
+    swapped = client.put(
+        "/api/admin/config",
+        json={"matching": {"freq_cap_seconds": 0}, "pricing": {"platform_fee_percent": 50}},
+        headers=admin_headers,
+    )
+    assert swapped.status_code == 200
+
+    # Another worker (or a restarted one) starts from the environment config
+    # and picks the change up from the shared row on its next poll.
+    app.config.update({"FREQ_CAP_SECONDS": 60, "PLATFORM_FEE_PERCENT": "30"})
+    app.extensions["settings"] = CompiledSettings()
+    with app.app_context():
+        assert get_matching_config().freq_cap_seconds == 60
+    assert client.get("/api/admin/config", headers=admin_headers).get_json()["matching"][
+        "freq_cap_seconds"
+    ] == 0
+    with app.app_context():
+        assert compute_partner_payout(Decimal("2.00")) == Decimal("1.00")
+
+    # A later change keeps earlier overrides and is applied once its version
+    # is seen, not before the poll interval.
+    app.config["SETTINGS_POLL_SECONDS"] = 60
+    with app.app_context():
+        row = db.session.get(RuntimeSettings, "runtime")
+        row.overrides = json.dumps({**json.loads(row.overrides), "MATCH_CTR_WEIGHT": 2.0})
+        row.version += 1
+        db.session.commit()
+        sync_shared_settings()
+        assert get_matching_config().ctr_weight == 1.0
+        sync_shared_settings(force=True)
+        assert get_matching_config().ctr_weight == 2.0
+        assert get_matching_config().freq_cap_seconds == 0
+
+
+@pytest.mark.parametrize("app_env", ["development", "production"])
+def test_sql_instrumentation_headers_and_metrics(app_env):
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "JWT_SECRET_KEY": "test-secret",
+            "APP_ENV": app_env,
+            "SQL_INSTRUMENTATION": "1",
+            "SQL_TIMING_HEADERS": "1",
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        create_users()
+
+    client = app.test_client()
+    response = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    assert response.status_code == 200
+    if app_env == "production":
+        assert "X-DB-Queries" not in response.headers
+    else:
+        assert int(response.headers["X-DB-Queries"]) >= 1
+        assert float(response.headers["X-DB-Time"]) >= 0
+
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert 'http_request_db_queries_count{endpoint="auth.login"}' in metrics
+
+    with app.app_context():
+        db.drop_all()
+
+
+def test_event_buffer_writes_behind_and_dedups_pending_rows(client, app):
+    app.config.update({"EVENT_BUFFER_ENABLED": "1", "EVENT_BUFFER_FLUSH_MS": 60_000})
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        create_assignment("buffercode", partner.id, campaign.id, ad.id)
+        partner_id = partner.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    headers = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+    assert client.get("/api/partner/ad", headers=headers).get_json()["filled"] is True
+
+    track_headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.9"}
+    first = client.post("/api/track/impression?code=buffercode", headers=track_headers)
+    second = client.post("/api/track/impression?code=buffercode", headers=track_headers)
+    assert first.get_json()["deduped"] is False
+    assert second.get_json()["deduped"] is True
+    client.get("/t/buffercode", headers={"User-Agent": "", "X-Forwarded-For": "10.0.0.9"})
+
+    with app.app_context():
+        event_buffer = get_event_buffer()
+        assert len(event_buffer) == 4
+        assert PartnerAdRequestEvent.query.filter_by(partner_id=partner_id).count() == 0
+        assert AdAssignment.query.filter_by(partner_id=partner_id).count() == 2
+        db.session.remove()
+
+        assert event_buffer.flush() == 4
+        assert PartnerAdRequestEvent.query.filter_by(partner_id=partner_id).one().filled
+        assert ImpressionEvent.query.filter_by(assignment_code="buffercode").count() == 2
+        click = ClickEvent.query.filter_by(assignment_code="buffercode").one()
+        assert click.reject_reason == "BOT_SUSPECTED"
+        counters = EngagementCounter.query.filter_by(partner_id=partner_id).all()
+        assert sum(row.filled_requests for row in counters) == 1
+        assert sum(row.impressions for row in counters) == 1
+        assert sum(row.rejected_clicks for row in counters) == 1
+        assert partner_click_totals(partner_id) == (0, 1)
+        event_buffer.close()
+
+    admin_login = client.post(
+        "/api/auth/login",
+        json={"email": "admin@example.com", "password": "pass"},
+    )
+    stats = client.get(
+        "/api/admin/event-buffer",
+        headers={"Authorization": f"Bearer {admin_login.get_json()['access_token']}"},
+    ).get_json()
+    assert stats["enabled"] is True
+    assert stats["flushed"] == 4
+    assert stats["pending"] == 0
+
+
+
+def test_event_buffer_indexes_uncommitted_rows_by_pair(app):
+    class FailingEngine:
+        def begin(self):
+            raise RuntimeError("database unavailable")
+
+    with app.app_context():
+        event_buffer = EventBuffer(FailingEngine(), max_delay_ms=60_000)
+        now = datetime.utcnow()
+        rows = [
+            {"assignment_code": "pair", "ip_hash": ip_hash, "ts": ts, "status": "ACCEPTED"}
+            for ip_hash, ts in (
+                ("ip", now - timedelta(seconds=5)),
+                ("ip", now),
+                ("other", now - timedelta(seconds=9)),
+            )
+        ]
+        event_buffer.add_many(ImpressionEvent, rows)
+        assert event_buffer.latest_pending_ts(ImpressionEvent, "pair", "ip") == now
+        assert event_buffer.latest_pending_ts(ClickEvent, "pair", "ip") is None
+
+        assert event_buffer.flush() == 0
+        assert event_buffer.latest_pending_ts(ImpressionEvent, "pair", "other") == rows[2]["ts"]
+
+        event_buffer.engine = db.engine
+        assert event_buffer.flush() == 3
+        assert event_buffer.latest_pending_ts(ImpressionEvent, "pair", "ip") is None
+        event_buffer.close()
+
+def test_signed_assignment_codes_track_without_assignment_lookup(client, app):
+    app.config["ASSIGNMENT_CODE_FORMAT"] = "signed"
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        partner_id, campaign_id, ad_id = partner.id, campaign.id, ad.id
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "partner@example.com", "password": "pass"},
+    )
+    headers = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+    code = client.get("/api/partner/ad", headers=headers).get_json()["assignment_code"]
+
+    with app.app_context():
+        claims = verify_code(code)
+        assert (claims.partner_id, claims.campaign_id, claims.ad_id) == (
+            partner_id,
+            campaign_id,
+            ad_id,
+        )
+        assert AdAssignment.query.filter_by(code=code).one().partner_id == partner_id
+        # Tracking must not depend on the audit row.
+        AdAssignment.query.filter_by(code=code).delete()
+        db.session.commit()
+        tampered = code[:-2] + ("AA" if code[-2:] != "AA" else "BB")
+        assert verify_code(tampered) is None
+
+    track_headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.10"}
+    impression = client.post(f"/api/track/impression?code={code}", headers=track_headers)
+    assert impression.status_code == 200
+    click = client.get(f"/t/{code}", headers=track_headers)
+    assert click.status_code == 302
+    assert client.post(
+        f"/api/track/impression?code={tampered}", headers=track_headers
+    ).status_code == 404
+
+    with app.app_context():
+        event = ClickEvent.query.filter_by(assignment_code=code).one()
+        assert event.status == "ACCEPTED"
+        assert event.partner_id == partner_id
+        assert db.session.get(Campaign, campaign_id).budget_spent > 0
+
+
+def test_assignment_cache_serves_tracking_and_drops_edited_destinations(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.00", "100.00")
+        ad = create_ad(campaign.id)
+        campaign_id, ad_id = campaign.id, ad.id
+
+    def token_for(email):
+        login = client.post("/api/auth/login", json={"email": email, "password": "pass"})
+        return {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+
+    served = client.get("/api/partner/ad", headers=token_for("partner@example.com"))
+    code = served.get_json()["assignment_code"]
+
+    with app.app_context():
+        cache = get_assignment_cache()
+        assert cache.get(code).destination_url == "https://example.com/landing"
+        # Cached routes are enough to track, even without the assignment row.
+        AdAssignment.query.filter_by(code=code).delete()
+        db.session.commit()
+
+    track_headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.11"}
+    impression = client.post(f"/api/track/impression?code={code}", headers=track_headers)
+    assert impression.status_code == 200
+
+    updated = client.put(
+        f"/api/buyer/campaigns/{campaign_id}/ads/{ad_id}",
+        json={"destination_url": "https://example.com/new"},
+        headers=token_for("buyer@example.com"),
+    )
+    assert updated.status_code == 200
+    with app.app_context():
+        assert get_assignment_cache().get(code) is None
+
+
+def test_atomic_spend_pauses_and_short_circuits_exhausted_campaign(client, app):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.50", "5.00")
+        ad = create_ad(campaign.id)
+        for index in range(3):
+            create_assignment(f"spendcode{index}", partner.id, campaign.id, ad.id)
+        campaign_id = campaign.id
+
+    for index in range(3):
+        response = client.get(
+            f"/t/spendcode{index}",
+            headers={"User-Agent": "pytest", "X-Forwarded-For": f"10.0.1.{index}"},
+        )
+        assert response.status_code == 302
+
+    with app.app_context():
+        clicks = ClickEvent.query.order_by(ClickEvent.id).all()
+        assert [click.status for click in clicks] == ["ACCEPTED", "ACCEPTED", "REJECTED"]
+        assert clicks[2].reject_reason == "BUDGET_EXHAUSTED"
+        campaign = db.session.get(Campaign, campaign_id)
+        assert campaign.status == "paused"
+        assert float(campaign.budget_spent) == 5.0
+        assert campaign_id in get_exhausted_campaigns()
+
+    login = client.post(
+        "/api/auth/login",
+        json={"email": "buyer@example.com", "password": "pass"},
+    )
+    updated = client.put(
+        f"/api/buyer/campaigns/{campaign_id}",
+        json={"budget_total": "10.00", "status": "active"},
+        headers={"Authorization": f"Bearer {login.get_json()['access_token']}"},
+    )
+    assert updated.status_code == 200
+    with app.app_context():
+        assert campaign_id not in get_exhausted_campaigns()
+
+
+def create_dedup_fixture(app, codes):
+    with app.app_context():
+        buyer, partner, _ = create_users()
+        campaign = create_campaign(buyer.id, "2.50", "100.00")
+        ad = create_ad(campaign.id)
+        ip_hash = hash_value("10.0.0.12", salt="testsalt")
+        for code in codes:
+            create_assignment(code, partner.id, campaign.id, ad.id)
+            # Seen by another worker, or before this one started.
+            db.session.add(
+                ImpressionEvent(
+                    assignment_code=code,
+                    campaign_id=campaign.id,
+                    ad_id=ad.id,
+                    partner_id=partner.id,
+                    ip_hash=ip_hash,
+                    status="ACCEPTED",
+                )
+            )
+        db.session.commit()
+        return ip_hash
+
+
+def warm_dedup_windows(app):
+    with app.app_context():
+        for kind in ("click", "impression"):
+            get_dedup_window(kind)._started_at -= 3600
+
+
+def click_reasons(app, code):
+    with app.app_context():
+        return [
+            click.reject_reason
+            for click in ClickEvent.query.filter_by(assignment_code=code).order_by(ClickEvent.id)
+        ]
+
+
+@pytest.mark.parametrize("backend", ["memory", "kv"])
+def test_per_worker_dedup_windows_keep_the_event_table_check(client, app, backend):
+    app.config["DEDUP_BACKEND"] = backend
+    create_dedup_fixture(app, ("coldcode", "warmcode"))
+
+    headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.12"}
+    cold = client.post("/api/track/impression?code=coldcode", headers=headers)
+    assert cold.get_json()["deduped"] is True
+
+    # Even once warm, a per-worker store cannot see other workers' hits.
+    warm_dedup_windows(app)
+    warm = client.post("/api/track/impression?code=warmcode", headers=headers)
+    assert warm.get_json()["deduped"] is True
+
+    click_headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.13"}
+    client.get("/t/warmcode", headers=click_headers)
+    client.get("/t/warmcode", headers=click_headers)
+    assert click_reasons(app, "warmcode") == [None, "DUPLICATE_CLICK"]
+
+
+def test_shared_kv_dedup_skips_event_queries_once_warm(client, app):
+    app.config["DEDUP_BACKEND"] = "kv"
+    shared_client = LocalKeyValueClient()
+    shared_client.shared = True
+    app.extensions["kv_client"] = shared_client
+    ip_hash = create_dedup_fixture(app, ("warmcode",))
+    warm_dedup_windows(app)
+
+    headers = {"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.12"}
+    # The pre-start impression is not looked up: the shared store is authoritative.
+    warm = client.post("/api/track/impression?code=warmcode", headers=headers)
+    assert warm.get_json()["deduped"] is False
+    repeat = client.post("/api/track/impression?code=warmcode", headers=headers)
+    assert repeat.get_json()["deduped"] is True
+    # Another worker on the same store sees this worker's hits.
+    other_worker = DedupWindow(KeyValueDedupStore(shared_client, prefix="dedup:impression"), 60)
+    other_worker._started_at -= 3600
+    assert other_worker.is_duplicate(("warmcode", ip_hash), lambda: False) is True
+
+    # A click rejected before the duplicate check still opens the window.
+    client.get("/t/warmcode", headers={"User-Agent": "", "X-Forwarded-For": "10.0.0.13"})
+    client.get("/t/warmcode", headers={"User-Agent": "pytest", "X-Forwarded-For": "10.0.0.13"})
+    assert click_reasons(app, "warmcode") == ["BOT_SUSPECTED", "DUPLICATE_CLICK"]
+
+
+def test_memory_dedup_store_only_evicts_expired_keys():
+    store = MemoryDedupStore(max_entries=3)
+    assert [store.check_and_mark(("code", index), 60) for index in range(5)] == [False] * 5
+    assert len(store) == 3
+    # Live keys are kept; keys past the bound are not cached.
+    assert store.check_and_mark(("code", 0), 60) is True
+    assert store.check_and_mark(("code", 4), 60) is False
+    time.sleep(0.01)
+    assert store.check_and_mark(("code", 5), 0.001) is False
+    assert len(store) == 1
+
+
+
+@pytest.mark.parametrize("backend", ["memory", "shared", "database"])
+def test_rate_limiter_backends_slide_the_window(app, backend, tmp_path):
+    app.config["RATE_LIMIT_BACKEND"] = backend
+    app.config["RATE_LIMIT_SHARED_PATH"] = str(tmp_path / "rate-limit")
+    app.config["RATE_LIMIT_SHARED_SLOTS"] = 64
+    with app.app_context():
+        limiter = get_rate_limiter()
+        start = 6000.0
+        assert [limiter.allow("ip-a", start + index, 3) for index in range(4)] == [
+            True,
+            True,
+            True,
+            False,
+        ]
+        assert limiter.allow("ip-b", start + 4, 3) is True
+        # Early in the next minute most of the last minute still counts.
+        assert limiter.allow("ip-a", start + 61, 3) is False
+        # Two thirds of the way through only a third of it does.
+        assert limiter.allow("ip-a", start + 100, 3) is True
+        assert limiter.allow("ip-a", start + 101, 3) is True
+        assert limiter.allow("ip-a", start + 102, 3) is False
+        # Idle for two minutes: a fresh start.
+        assert limiter.allow("ip-a", start + 300, 3) is True
+        db.session.commit()
+
+
+def test_memory_rate_limiter_evicts_idle_ips():
+    limiter = MemoryRateLimiter(max_entries=3)
+    for index in range(5):
+        assert limiter.allow(f"ip-{index}", 6000.0, 1) is True
+    assert len(limiter) == 3
+    # The oldest IPs were dropped, so they start over.
+    assert limiter.allow("ip-0", 6001.0, 1) is True
+    assert limiter.allow("ip-4", 6001.0, 1) is False
+    limiter.allow("ip-new", 6200.0, 1)
+    assert len(limiter) == 1
+
+
+def test_heavy_hitters_reject_and_report_top_ips(client, app):
+    app.config["HEAVY_HITTER_REJECT_THRESHOLD"] = 3
+    # Long enough that a window boundary mid-test cannot shift the estimates.
+    app.config["HEAVY_HITTER_WINDOW_SECONDS"] = 10_000_000
+    with app.app_context():
+        buyer, partner, admin = create_users()
+        campaign = create_campaign(buyer.id, "1.00", "100.00")
+        ad = create_ad(campaign.id)
+        for index in range(5):
+            create_assignment(f"heavy{index}", partner.id, campaign.id, ad.id)
+        admin_email = admin.email
+
+    for index in range(5):
+        client.get(f"/t/heavy{index}", headers={"X-Forwarded-For": "10.0.0.66"})
+    client.get("/t/heavy0", headers={"X-Forwarded-For": "10.0.0.67"})
+
+    with app.app_context():
+        reasons = [
+            click.reject_reason
+            for click in ClickEvent.query.order_by(ClickEvent.id).all()
+        ]
+    assert reasons == [None, None, None, "HEAVY_HITTER", "HEAVY_HITTER", None]
+
+    admin_login = client.post(
+        "/api/auth/login",
+        json={"email": admin_email, "password": "pass"},
+    )
+    admin_token = admin_login.get_json()["access_token"]
+    response = client.get(
+        "/api/admin/risk/heavy-hitters?dimension=ip&limit=1",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["reject_dimensions"] == ["ip"]
+    assert payload["scope"] == "worker"
+    assert payload["worker_reject_threshold"] == 3
+    top_ips = payload["dimensions"]["ip"]
+    assert top_ips["total"] == 6
+    assert top_ips["keys"] == [
+        {"key": hash_value("10.0.0.66", salt="testsalt"), "estimate": 5}
+    ]
+    invalid = client.get(
+        "/api/admin/risk/heavy-hitters?dimension=country",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert invalid.status_code == 400
+
+
+def test_heavy_hitter_threshold_is_split_across_workers(app):
+    app.config.update({"HEAVY_HITTER_REJECT_THRESHOLD": 6, "HEAVY_HITTER_WORKERS": 3})
+    with app.app_context():
+        assert heavy_hitter_worker_threshold() == 2
+        assert is_heavy_hitter({"ip": 3}) is True
+        assert is_heavy_hitter({"ip": 2}) is False
+
+
+def test_heavy_hitter_window_memory_is_fixed():
+    window = HeavyHitterWindow(width=256, depth=4, top_k=5, window_seconds=60)
+    size = window.size_bytes
+    for index in range(20_000):
+        window.add(f"noise-{index}", now=6000.0)
+        if index % 100 == 0:
+            window.add("hot", now=6000.0)
+    assert window.size_bytes == size
+    report = window.top(limit=1, now=6000.0)
+    assert report["keys"][0]["key"] == "hot"
+    assert 200 <= report["keys"][0]["estimate"] <= 200 + report["error_bound"]
+    # Half way through the next window, half of the last one still counts.
+    assert window.top(limit=1, now=6090.0)["keys"][0]["estimate"] >= 100
+    assert window.top(limit=1, now=6200.0)["keys"] == []
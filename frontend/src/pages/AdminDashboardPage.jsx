@@ -133,6 +133,12 @@ const AdminDashboardPage = () => {
       why: "Traffic spikes from a single source can trip velocity limits.",
       mitigation: "Throttle high-velocity sources and smooth traffic bursts."
     },
+    HEAVY_HITTER: {
+      title: "Heavy hitter",
+      meaning: "A single source sent more clicks than the heavy-hitter threshold.",
+      why: "Sustained volume from one IP across many ads suggests automated traffic.",
+      mitigation: "Investigate the source in the heavy-hitter report and block it upstream."
+    },
     BUDGET_EXHAUSTED: {
       title: "Budget exhausted",
       meaning: "Campaign budget could not cover the max CPC.",